@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+
+import streamlit as st
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from src.metrics import load_spans
+
+POST_SPANS = ("app.post", "pipeline.post", "job.post") # One root span per generated post
+
+@st.cache_data(ttl=30)
+def load_span_frame(days: int):
+    import pandas as pd
+    spans = load_spans(since=time.time() - days * 86400)
+    if not spans:
+        return pd.DataFrame()
+    frame = pd.DataFrame(spans)
+    frame["started_at"] = pd.to_datetime(frame["started_at"], unit="s")
+    frame["cost_usd"] = frame["cost_usd"].fillna(0.0)
+    return frame
+
+def latency_table(frame):
+    """p50/p95 latency, call count and error rate per span name."""
+    grouped = frame.groupby("name")
+    table = grouped["duration"].quantile([0.5, 0.95]).unstack()
+    table.columns = ["p50_s", "p95_s"]
+    table["count"] = grouped.size()
+    table["error_rate"] = grouped["status"].apply(lambda status: (status == "error").mean())
+    return table.sort_values("p95_s", ascending=False).round(3)
+
+st.title("Pipeline Metrics")
+days = st.slider("Days", min_value=1, max_value=30, value=7)
+frame = load_span_frame(days)
+
+if frame.empty:
+    st.info("No spans recorded yet. Set METRICS_SINK=sqlite (the default) and generate a post.")
+    st.stop()
+
+posts = frame[frame["name"].isin(POST_SPANS)]
+col1, col2, col3 = st.columns(3)
+col1.metric("Posts", len(posts))
+col2.metric("Total cost (USD)", f"{posts['cost_usd'].sum():.2f}")
+col3.metric("Mean cost per post (USD)", f"{posts['cost_usd'].mean():.4f}" if len(posts) else "-")
+
+st.subheader("Latency by stage")
+st.dataframe(latency_table(frame))
+
+st.subheader("Cost per post over time")
+if len(posts):
+    daily = posts.set_index("started_at").resample("D")["cost_usd"].agg(["mean", "sum", "count"])
+    daily.columns = ["mean_cost_per_post", "total_cost", "posts"]
+    st.line_chart(daily[["mean_cost_per_post"]])
+    st.dataframe(daily.round(4))
+
+st.subheader("Recent errors")
+errors = frame[frame["status"] == "error"].sort_values("started_at", ascending=False).head(50)
+st.dataframe(errors[["started_at", "name", "duration", "error"]])
@@ -1,8 +1,8 @@
 import streamlit as st
 import os
 import logging
-import re
 import sys
+import time
 from dotenv import load_dotenv
 
 load_dotenv() # Moved to the very top
@@ -10,22 +10,83 @@ load_dotenv() # Moved to the very top
 # Add the project root to the sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.trend_scraper import get_trending_topics
-from src.blog_writer import generate_blog, generate_attractive_title, generate_blog_from_content
-from src.blogger_api import post_to_blogger
-from src.blog_db import init_db, blog_exists, add_blog_entry, get_recent_topics, get_all_normalized_titles
-from src.config import BLOGGER_BLOG_ID
+# Only the lightweight config is imported up front. Streamlit re-runs this script on
+# every widget interaction, so the heavy modules (openai, pytrends/pandas, Google API
+# client, SciPy) are imported inside run_auto_blogger, on the first click.
+from src.config import BLOGGER_BLOG_ID, TITLES_TO_AVOID_LIMIT, TOPIC_MIN_NOVELTY
+from src.metrics import configure_logging, start_metrics_server, traced, current_cost
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging()
 
-def normalize_title(title: str) -> str:
-    """Normalizes a title for consistent database lookup."""
-    return re.sub(r'[^a-z0-9]', '', title.lower())
+@st.cache_resource
+def get_metrics_server():
+    """One /metrics endpoint per server process (only when METRICS_PORT is set)."""
+    return start_metrics_server()
 
+@st.cache_resource
+def get_blog_repository():
+    """Initializes the DB (running migrations) once per server process and keeps the pooled repository."""
+    from src.blog_db import init_db, get_repository
+    init_db()
+    return get_repository()
+
+@st.cache_resource
+def get_openai():
+    from src.openai_client import get_openai_client
+    return get_openai_client()
+
+def stream_blog_to_ui(chunks, expected_words: int = 1000) -> str:
+    """Renders a streamed post live (progress, time to first token, preview) and returns the full HTML."""
+    status = st.empty()
+    progress = st.progress(0.0)
+    preview = st.empty()
+    started = time.perf_counter()
+    first_token = None
+    last_render = 0.0
+    parts = []
+    words = 0
+    for chunk in chunks:
+        now = time.perf_counter()
+        if first_token is None:
+            first_token = now - started
+        parts.append(chunk)
+        words += chunk.count(" ")
+        if now - last_render >= 0.5: # Re-rendering on every chunk would flood the websocket
+            progress.progress(min(words / expected_words, 1.0))
+            status.write(f"Writing... ~{words} words (first token after {first_token:.1f}s)")
+            preview.markdown("".join(parts), unsafe_allow_html=True)
+            last_render = now
+    progress.progress(1.0)
+    preview.empty()
+    if first_token is not None:
+        status.write(f"Wrote ~{words} words in {time.perf_counter() - started:.1f}s (first token after {first_token:.1f}s).")
+    return "".join(parts)
+
+def generate_blog_live(chunks, title: str) -> str:
+    """Streams the post to the UI while the image is generated in the background, then embeds the image."""
+    from src.blog_writer import start_blog_image, attach_image
+    image_future = start_blog_image(title)
+    try:
+        content = stream_blog_to_ui(chunks)
+    except Exception:
+        image_future.cancel()
+        raise
+    return attach_image(content, image_future, title)
+
+@traced("app.post")
 def run_auto_blogger(generation_mode, provided_content, custom_title):
+    from src.trend_scraper import get_trending_topics
+    from src.blog_writer import stream_blog_text, stream_blog_text_from_content
+    from src.content_validator import GenerationAborted
+    from src.ingest import fetch_article, split_to_budget
+    from src.blogger_api import post_to_blogger
+    from src.blog_db import blog_exists, add_blog_entry, get_topic_history, get_recent_titles, normalize_title
+    from src.topic_ranker import rank_topics
+    from src.title_selector import choose_title
+
     st.write("Initializing...")
-    init_db()
+    get_blog_repository()
+    get_openai() # Warm the shared client before the first request
 
     if not BLOGGER_BLOG_ID:
         st.error("BLOGGER_BLOG_ID environment variable not set in config.py or .env. Please set it up.")
@@ -36,9 +97,22 @@ def run_auto_blogger(generation_mode, provided_content, custom_title):
     blog_content = ""
     original_topic_for_db = "" # To store the original topic or a derived one for DB tracking
 
-    all_existing_titles = get_all_normalized_titles() # Fetch all existing titles once
+    all_existing_titles = get_recent_titles(limit=TITLES_TO_AVOID_LIMIT) # Indexed read of the latest titles, not the whole table
 
-    MAX_TITLE_RETRIES = 5 # Max attempts to generate a unique title
+    def choose_unique_title(source: str, error_context: str) -> str:
+        """Best unique title among all generated candidates, or "" (after reporting why) if there is none."""
+        st.write("Generating and ranking title candidates...")
+        try:
+            selection = choose_title(source, all_existing_titles) # Bulk check against DB and near-duplicate index
+        except Exception as e:
+            st.error(f"Failed to generate attractive title {error_context}: {e}")
+            logging.error(f"Failed to generate attractive title {error_context}: {e}")
+            return ""
+        if not selection.title:
+            st.error(f"Could not generate a unique attractive title after {selection.attempts} attempts. Aborting.")
+            return ""
+        st.info(f"Generated unique title: {selection.title} (best of {selection.candidates} candidates, {len(selection.rejected)} rejected)")
+        return selection.title
 
     if generation_mode == "From Trending Topic":
         st.write("Fetching trending topics...")
@@ -60,29 +134,18 @@ def run_auto_blogger(generation_mode, provided_content, custom_title):
             logging.info("No relevant trending topics after filtering.")
             return
 
-        recent_topics = get_recent_topics(limit=5) # Get last 5 posted topics
-        logging.info(f"Recent topics: {recent_topics}")
-
-        def is_similar(topic1: str, topic2: str) -> bool:
-            """Checks if two topics are similar based on keyword overlap."""
-            words1 = set(topic1.lower().split())
-            words2 = set(topic2.lower().split())
-            return bool(words1.intersection(words2))
+        # Score every candidate against the full post history in one pass
+        ranked_topics = rank_topics(filtered_topics, get_topic_history())
 
         selected_topic = None
-        for topic in filtered_topics:
-            is_new_theme = True
-            for recent_topic in recent_topics:
-                if is_similar(topic, recent_topic):
-                    is_new_theme = False
-                    break
-            if is_new_theme:
-                selected_topic = topic
-                break
-
-        if selected_topic is None and filtered_topics: # If all topics are similar to recent ones, just pick the first available
+        if ranked_topics and ranked_topics[0]["novelty"] >= TOPIC_MIN_NOVELTY:
+            selected_topic = ranked_topics[0]["topic"]
+            st.write(f"Selected most novel topic (novelty score {ranked_topics[0]['novelty']:.2f}).")
+
+        if selected_topic is None and filtered_topics: # If all topics are similar to past ones, just pick the first available
             selected_topic = filtered_topics[0]
-            st.info("All trending topics are similar to recently posted ones. Selecting the first available topic.")
+            st.info("All trending topics are similar to previously posted ones. Selecting the first available topic.")
+            logging.info(f"No topic reached novelty {TOPIC_MIN_NOVELTY}; falling back to '{selected_topic}'.")
 
         if selected_topic is None:
             st.info("No suitable topic found to generate a blog.")
@@ -91,33 +154,16 @@ def run_auto_blogger(generation_mode, provided_content, custom_title):
         original_topic_for_db = selected_topic
         st.write(f"Processing topic: {selected_topic}")
 
-        # Title generation retry loop for Trending Topic
-        for attempt in range(MAX_TITLE_RETRIES):
-            try:
-                st.write(f"Attempt {attempt + 1}/{MAX_TITLE_RETRIES} to generate unique title...")
-                blog_title = generate_attractive_title(selected_topic, all_existing_titles)
-                normalized_attractive_title = normalize_title(blog_title)
-
-                if not blog_exists(normalized_attractive_title): # Check against DB
-                    st.info(f"Generated unique title: {blog_title}")
-                    break # Unique title found
-                else:
-                    st.warning(f"Generated title '{blog_title}' already exists. Retrying...")
-                    # Add the generated title to all_existing_titles to avoid generating it again in this run
-                    all_existing_titles.append(normalized_attractive_title)
-            except Exception as e:
-                st.error(f"Failed to generate attractive title for topic '{selected_topic}' (Attempt {attempt + 1}): {e}")
-                logging.error(f"Failed to generate attractive title for topic '{selected_topic}' (Attempt {attempt + 1}): {e}")
-                blog_title = "" # Reset to ensure it's empty if generation fails
-                break # Exit loop on error
-
+        blog_title = choose_unique_title(selected_topic, f"for topic '{selected_topic}'")
         if not blog_title:
-            st.error(f"Could not generate a unique attractive title after {MAX_TITLE_RETRIES} attempts. Aborting.")
             return
 
         st.write(f"Generating blog content for '{blog_title}'...")
         try:
-            blog_content = generate_blog(blog_title)
+            blog_content = generate_blog_live(stream_blog_text(blog_title), blog_title)
+        except GenerationAborted as e:
+            st.error(f"Stopped generating '{blog_title}' early: {e.reason}")
+            return
         except Exception as e:
             st.error(f"Failed to generate blog content for '{blog_title}': {e}")
             logging.error(f"Failed to generate blog content for '{blog_title}': {e}")
@@ -128,19 +174,19 @@ def run_auto_blogger(generation_mode, provided_content, custom_title):
         if provided_content.startswith("http://") or provided_content.startswith("https://"):
             st.write(f"Fetching content from URL: {provided_content}")
             try:
-                fetch_result = default_api.web_fetch(prompt=f"Extract main content from: {provided_content}")
-                if fetch_result and fetch_result.get('content'):
-                    original_content_to_process = fetch_result['content']
+                _, article_text = fetch_article(provided_content)
+                if article_text:
+                    original_content_to_process = split_to_budget(article_text)[0] # Keep the prompt within budget
                     st.write("Content fetched successfully.")
                 else:
                     st.error(f"Failed to fetch content from URL: {provided_content}")
                     logging.error(f"Failed to fetch content from URL: {provided_content}")
                     return
             except Exception as e:
-                st.error(f"Error during web_fetch: {e}")
-                logging.error(f"Error during web_fetch: {e}")
+                st.error(f"Error fetching URL: {e}")
+                logging.error(f"Error fetching URL {provided_content}: {e}")
                 return
-        
+
         if not original_content_to_process:
             st.warning("No content to process.")
             return
@@ -157,33 +203,16 @@ def run_auto_blogger(generation_mode, provided_content, custom_title):
                 logging.info(f"Blog with custom title '{blog_title}' (normalized: '{normalized_attractive_title}') already exists in DB. Skipping.")
                 return
         else:
-            st.write("Generating attractive title from provided content...")
-            # Title generation retry loop for Provided Content
-            for attempt in range(MAX_TITLE_RETRIES):
-                try:
-                    st.write(f"Attempt {attempt + 1}/{MAX_TITLE_RETRIES} to generate unique title...")
-                    blog_title = generate_attractive_title(original_content_to_process, all_existing_titles) # Generate title from content
-                    normalized_attractive_title = normalize_title(blog_title)
-
-                    if not blog_exists(normalized_attractive_title): # Check against DB
-                        st.info(f"Generated unique title: {blog_title}")
-                        break # Unique title found
-                    else:
-                        st.warning(f"Generated title '{blog_title}' already exists. Retrying...")
-                        all_existing_titles.append(normalized_attractive_title)
-                except Exception as e:
-                    st.error(f"Failed to generate attractive title from provided content (Attempt {attempt + 1}): {e}")
-                    logging.error(f"Failed to generate attractive title from provided content (Attempt {attempt + 1}): {e}")
-                    blog_title = "" # Reset to ensure it's empty if generation fails
-                    break # Exit loop on error
-
+            blog_title = choose_unique_title(original_content_to_process, "from provided content") # Generate title from content
             if not blog_title:
-                st.error(f"Could not generate a unique attractive title after {MAX_TITLE_RETRIES} attempts. Aborting.")
                 return
 
         st.write(f"Generating detailed blog from provided content with title: {blog_title}...")
         try:
-            blog_content = generate_blog_from_content(original_content_to_process, blog_title)
+            blog_content = generate_blog_live(stream_blog_text_from_content(original_content_to_process, blog_title), blog_title)
+        except GenerationAborted as e:
+            st.error(f"Stopped generating the blog early: {e.reason}")
+            return
         except Exception as e:
             st.error(f"Failed to generate blog from provided content: {e}")
             logging.error(f"Failed to generate blog from provided content: {e}")
@@ -203,15 +232,20 @@ def run_auto_blogger(generation_mode, provided_content, custom_title):
 
     st.write("Content generated. Posting to Blogger...")
     try:
-        post_to_blogger(title=blog_title, content=blog_content, blog_id=BLOGGER_BLOG_ID)
-        add_blog_entry(title=normalized_attractive_title, status="posted")
+        post_started = time.perf_counter()
+        response = post_to_blogger(title=blog_title, content=blog_content, blog_id=BLOGGER_BLOG_ID)
+        add_blog_entry(title=normalized_attractive_title, status="posted", topic=original_topic_for_db,
+                       blogger_post_id=response.get("id"), token_cost=current_cost(),
+                       latency=time.perf_counter() - post_started)
         st.success(f"Successfully posted blog with title: {blog_title}")
         logging.info(f"Successfully posted blog with title: {blog_title}")
     except Exception as e:
         st.error(f"Failed to post blog with title '{blog_title}': {e}")
-        add_blog_entry(title=normalized_attractive_title, status="failed")
+        add_blog_entry(title=normalized_attractive_title, status="failed", topic=original_topic_for_db, token_cost=current_cost())
         logging.error(f"Failed to post blog with title '{blog_title}': {e}")
 
+get_metrics_server()
+
 st.title("Auto-Blogger Application")
 
 # Blog Generation Mode Selection
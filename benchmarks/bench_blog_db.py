@@ -0,0 +1,76 @@
+"""Micro-benchmark: connect-per-call vs the pooled BlogRepository.
+
+Run from the project root:
+    python benchmarks/bench_blog_db.py --rows 100000 --lookups 2000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.blog_db import BlogRepository
+
+def _legacy_exists(path: str, title: str) -> bool:
+    # What blog_exists used to do: open, query, close on every call
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT 1 FROM blogs WHERE title = ?", (title,)).fetchone() is not None
+    finally:
+        conn.close()
+
+def _legacy_add(path: str, title: str, status: str = "posted"):
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("INSERT INTO blogs (title, status) VALUES (?, ?)", (title, status))
+        conn.commit()
+    except sqlite3.IntegrityError:
+        pass
+    finally:
+        conn.close()
+
+def _timed(label: str, fn, ops: int) -> float:
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<40} {elapsed * 1000:10.1f} ms  {elapsed / ops * 1e6:10.1f} us/op")
+    return elapsed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=2_000)
+    parser.add_argument("--inserts", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "blogs.db")
+        repo = BlogRepository(path)
+        repo.init_db()
+        repo.bulk_add((f"seededtitle{i}", "posted") for i in range(args.rows))
+        print(f"Seeded {args.rows} rows into {path}\n")
+
+        probes = [f"seededtitle{i * 7 % (args.rows * 2)}" for i in range(args.lookups)]
+        _timed("exists: connect per call", lambda: [_legacy_exists(path, t) for t in probes], args.lookups)
+        _timed("exists: pooled repository", lambda: [repo.exists(t) for t in probes], args.lookups)
+        _timed("exists: one bulk_exists call", lambda: repo.bulk_exists(probes), args.lookups)
+        print()
+
+        legacy_new = [(f"legacytitle{i}", "posted") for i in range(args.inserts)]
+        pooled_new = [(f"pooledtitle{i}", "posted") for i in range(args.inserts)]
+        bulk_new = [(f"bulktitle{i}", "posted") for i in range(args.inserts)]
+        # The legacy path uses a plain rollback-journal database like the old init_db created
+        legacy_path = os.path.join(tmp, "legacy.db")
+        conn = sqlite3.connect(legacy_path)
+        conn.execute("CREATE TABLE blogs (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL UNIQUE, status TEXT NOT NULL)")
+        conn.close()
+        _timed("add: connect per call (no WAL)", lambda: [_legacy_add(legacy_path, t, s) for t, s in legacy_new], args.inserts)
+        _timed("add: pooled repository", lambda: [repo.add(t, s) for t, s in pooled_new], args.inserts)
+        _timed("add: one bulk_add transaction", lambda: repo.bulk_add(bulk_new), args.inserts)
+        repo.close()
+
+if __name__ == "__main__":
+    main()
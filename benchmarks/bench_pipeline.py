@@ -0,0 +1,312 @@
+"""End-to-end throughput benchmark: the full pipeline against local mock services.
+
+Runs topic selection (recorded Google Trends + topic ranking), title, body
+(streamed), image and post stages through the real src code, with OpenAI and
+Blogger replaced by the servers in mock_services.py. Nothing is paid for and
+no credentials are needed. Each scenario is a (posts, historical DB rows)
+pair; the report covers posts/minute, per-stage p50/p95 latency and the time
+spent in DB calls.
+
+Results are appended to benchmarks/results/bench_pipeline.jsonl and each
+scenario is compared with the median of earlier runs with the same settings;
+the exit status is 1 if posts/minute dropped by more than --tolerance.
+
+Run from the project root:
+    python benchmarks/bench_pipeline.py --preset smoke
+    python benchmarks/bench_pipeline.py --posts 1,10,100,1000 --rows 0,100000,1000000 --db-cache /tmp/bench-dbs
+    python benchmarks/bench_pipeline.py --preset smoke --throttle-rate 0.05 --chat-latency lognormal:2,0.5
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from mock_services import MockOpenAIServer, MockBloggerServer, RecordedTrendsFetcher, FaultInjector, fake_blogger_token
+
+RESULTS_PATH = os.path.join(ROOT, "benchmarks", "results", "bench_pipeline.jsonl")
+PRESETS = {
+    "smoke": {"posts": [1, 10], "rows": [0, 10_000]},
+    "standard": {"posts": [1, 10, 100], "rows": [0, 100_000]},
+    "full": {"posts": [1, 10, 100, 1000], "rows": [0, 10_000, 100_000, 1_000_000]},
+}
+SETTINGS_KEYS = ("chat_latency", "chunk_latency", "image_latency", "blogger_latency", "trends_latency", "throttle_rate",
+                 "error_rate", "no_images", "title_workers", "body_workers", "image_workers", "post_workers")
+_SYLLABLES = "ka lo mi ru te sa no vi da pe zu ri mo ta li be go nu fa si ro che la du ne xi po ma wu ke".split()
+
+def _ints(value: str) -> list[int]:
+    return [int(float(part)) for part in value.split(",") if part.strip()]
+
+def _pseudo_words(count: int, rng: random.Random) -> list[str]:
+    """A large vocabulary of made-up words, so seeded titles are as varied as real ones."""
+    return ["".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(count)]
+
+def seed_history(repo, rows: int, seed: int = 7, batch_size: int = 10_000):
+    """Fills the blogs table with `rows` distinct, realistic-length past titles and topics."""
+    from src.blog_db import normalize_title
+    rng = random.Random(seed)
+    vocabulary = _pseudo_words(20_000, rng)
+    added = 0
+    while added < rows:
+        count = min(batch_size, rows - added)
+        entries = []
+        for index in range(added, added + count):
+            topic = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(2, 4)))
+            title = f"{topic} {' '.join(rng.choice(vocabulary) for _ in range(rng.randint(3, 6)))} {index}"
+            entries.append((normalize_title(title), "posted", topic))
+        added += repo.bulk_add(entries)
+        print(f"  seeded {added}/{rows} rows", end="\r", flush=True)
+    if rows:
+        print()
+
+def prepare_database(rows: int, workdir: str, db_cache: str = None) -> str:
+    """Returns the path of a migrated DB holding `rows` historical posts, reusing a cached copy if possible."""
+    from src.blog_db import BlogRepository
+    path = os.path.join(workdir, f"blogs_{rows}.db")
+    cached = os.path.join(db_cache, f"blogs_{rows}.db") if db_cache else None
+    if cached and os.path.exists(cached):
+        shutil.copyfile(cached, path)
+        return path
+    started = time.perf_counter()
+    repo = BlogRepository(path)
+    repo.init_db()
+    seed_history(repo, rows)
+    repo.close()
+    print(f"  seeding {rows} rows took {time.perf_counter() - started:.1f}s")
+    if cached:
+        os.makedirs(db_cache, exist_ok=True)
+        shutil.copyfile(path, cached)
+    return path
+
+def _percentile(samples: list[float], q: float) -> float:
+    samples = sorted(samples)
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, max(0, int(round(q * (len(samples) - 1)))))
+    return samples[index]
+
+def _make_collecting_sink():
+    from src.metrics import SpanSink
+
+    class CollectingSpanSink(SpanSink):
+        """Keeps span records in memory instead of writing them out."""
+
+        def __init__(self):
+            super().__init__()
+            self.records = []
+            self._records_lock = threading.Lock()
+
+        def write(self, record: dict):
+            self._write([record]) # Synchronously, so the records are complete when the run returns
+
+        def _write(self, batch: list):
+            with self._records_lock:
+                self.records.extend(batch)
+
+    return CollectingSpanSink()
+
+def _db_totals() -> dict:
+    """Call count and total seconds of each DB operation so far (from the db.* span histograms)."""
+    from src.metrics import registry
+    histogram = registry.histogram("span_duration_seconds")
+    operations = ("add", "exists", "bulk_exists", "bulk_add", "find_near_duplicates", "bulk_find_near_duplicates")
+    return {name: (histogram.count(span=f"db.{name}"), histogram.sum(span=f"db.{name}")) for name in operations}
+
+def run_scenario(posts: int, db_path: str, args, openai_server, blogger_server) -> dict:
+    from src import metrics
+    from src.blog_db import BlogRepository
+    from src.config import TITLES_TO_AVOID_LIMIT
+    from src.pipeline import BatchPipeline
+    from src.topic_ranker import rank_topics
+    from src.trend_scraper import TrendsCollector
+
+    repo = BlogRepository(db_path)
+    sink = _make_collecting_sink()
+    metrics.set_span_sink(sink)
+    counts_before = dict(openai_server.counts), dict(blogger_server.counts)
+    db_before = _db_totals()
+
+    started = time.perf_counter()
+    collector = TrendsCollector(fetcher=RecordedTrendsFetcher(latency=args.trends_latency, seed=args.seed), snapshot_path=None)
+    trending = collector.collect(use_snapshot=False)
+    trends_s = time.perf_counter() - started
+    started = time.perf_counter()
+    ranked = rank_topics(trending, repo.iter_topics())
+    ranking_s = time.perf_counter() - started
+    # One post per topic; a large batch cycles through the ranked topics with a suffix to keep them distinct
+    topics = [ranked[i % len(ranked)]["topic"] + (f" part {i // len(ranked) + 1}" if i >= len(ranked) else "") for i in range(posts)]
+
+    pipeline = BatchPipeline(
+        blog_id="mock-blog",
+        title_workers=args.title_workers, body_workers=args.body_workers,
+        image_workers=args.image_workers, post_workers=args.post_workers,
+        with_images=not args.no_images,
+        exists_fn=repo.exists,
+        bulk_exists_fn=repo.bulk_exists,
+        near_duplicates_fn=repo.bulk_find_near_duplicates,
+        record_fn=repo.add,
+        existing_titles_fn=lambda: repo.recent_titles(TITLES_TO_AVOID_LIMIT),
+    )
+    result = pipeline.run(topics)
+    summary = result["summary"]
+    db_after = _db_totals()
+    repo.close()
+    metrics.set_span_sink(None)
+
+    stage_samples = {}
+    for record in sink.records:
+        stage_samples.setdefault(record["name"], []).append(record["duration"])
+    stages = {name: {"count": len(samples), "p50_s": round(_percentile(samples, 0.5), 4), "p95_s": round(_percentile(samples, 0.95), 4)}
+              for name, samples in sorted(stage_samples.items())}
+    db = {}
+    for name, (count_after, seconds_after) in db_after.items():
+        calls = count_after - db_before[name][0]
+        seconds = seconds_after - db_before[name][1]
+        if calls:
+            db[name] = {"calls": calls, "total_ms": round(seconds * 1000, 2), "mean_us": round(seconds / calls * 1e6, 1)}
+    db_seconds = sum(entry["total_ms"] for entry in db.values()) / 1000
+    post_costs = [record["cost_usd"] for record in sink.records if record["name"] == "pipeline.post"]
+    mock_counts = {}
+    for server, before in zip((openai_server, blogger_server), counts_before):
+        for name, value in server.counts.items():
+            if value - before.get(name, 0):
+                mock_counts[name] = value - before.get(name, 0)
+
+    return {
+        "posts": posts,
+        "counts": summary["counts"],
+        "elapsed_s": summary["elapsed_s"],
+        "posts_per_minute": summary["posts_per_minute"],
+        "trends_s": round(trends_s, 3),
+        "topic_ranking_s": round(ranking_s, 3),
+        "stages": stages,
+        "db": db,
+        "db_ms_per_post": round(db_seconds * 1000 / max(1, posts), 3),
+        "cost_per_post_usd": round(statistics.mean(post_costs), 5) if post_costs else 0.0,
+        "mock_requests": mock_counts,
+    }
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def load_history(path: str) -> list[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def compare(record: dict, history: list[dict], tolerance: float) -> tuple[float, str]:
+    """Median posts/minute of earlier runs with the same scenario and settings, and ok/REGRESSION."""
+    previous = [run["posts_per_minute"] for run in history
+                if run["posts"] == record["posts"] and run["rows"] == record["rows"] and run["settings"] == record["settings"]]
+    if not previous:
+        return None, "new"
+    baseline = statistics.median(previous)
+    return baseline, "REGRESSION" if record["posts_per_minute"] < baseline * (1 - tolerance) else "ok"
+
+def configure_environment(args, openai_server, blogger_server, workdir: str):
+    """Points src at the mock servers. Must run before anything from src is imported."""
+    os.environ.update({
+        "OPENAI_API_KEY": "mock-key",
+        "OPENAI_BASE_URL": f"{openai_server.url}/v1",
+        "BLOGGER_API_ENDPOINT": blogger_server.url,
+        "GCP_TOKEN_JSON": fake_blogger_token(),
+        "LLM_CACHE_ENABLED": "0", # Every call should reach the mock
+        "METRICS_SINK": "none",
+        "IMAGE_CACHE_DIR": os.path.join(workdir, "images"),
+        "IMAGE_PUBLIC_DIR": os.path.join(workdir, "images", "public"),
+        "IMAGE_PUBLIC_BASE_URL": "https://images.example.com",
+    })
+    # Generous API budgets unless the caller wants to benchmark the rate limiter itself
+    for name, value in (("CHAT_REQUESTS_PER_MINUTE", "100000"), ("CHAT_TOKENS_PER_MINUTE", "100000000"),
+                        ("IMAGE_REQUESTS_PER_MINUTE", "100000"), ("BLOGGER_REQUESTS_PER_MINUTE", "100000"),
+                        ("CHAT_MAX_CONCURRENCY", "64"), ("IMAGE_MAX_CONCURRENCY", "32"), ("BLOGGER_MAX_CONCURRENCY", "32")):
+        os.environ.setdefault(name, value)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the full pipeline offline against mock OpenAI, Blogger and Trends.")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="smoke")
+    parser.add_argument("--posts", type=_ints, help="Comma-separated post counts (overrides the preset).")
+    parser.add_argument("--rows", type=_ints, help="Comma-separated historical DB sizes (overrides the preset).")
+    parser.add_argument("--chat-latency", default="lognormal:0.4,0.3", help="Time to first token / title latency (seconds).")
+    parser.add_argument("--chunk-latency", default="0.002", help="Delay between streamed chunks (seconds).")
+    parser.add_argument("--image-latency", default="lognormal:1.0,0.3")
+    parser.add_argument("--blogger-latency", default="lognormal:0.3,0.3")
+    parser.add_argument("--trends-latency", default="lognormal:1.5,0.4")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of API requests answered with 429.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of API requests answered with 500.")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After sent with injected 429s (seconds).")
+    parser.add_argument("--no-images", action="store_true")
+    parser.add_argument("--title-workers", type=int, default=8)
+    parser.add_argument("--body-workers", type=int, default=16)
+    parser.add_argument("--image-workers", type=int, default=8)
+    parser.add_argument("--post-workers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--log-level", default="CRITICAL", help="Injected faults log an error per request; raise to see them.")
+    parser.add_argument("--db-cache", help="Directory to keep seeded databases in, so large histories are built once.")
+    parser.add_argument("--results", default=RESULTS_PATH, help="JSONL file results are appended to.")
+    parser.add_argument("--no-save", action="store_true", help="Don't append this run to the results file.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed posts/minute drop against earlier runs.")
+    args = parser.parse_args(argv)
+    post_counts = args.posts or PRESETS[args.preset]["posts"]
+    row_counts = args.rows or PRESETS[args.preset]["rows"]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        faults = FaultInjector(args.throttle_rate, args.error_rate, args.retry_after, seed=args.seed)
+        openai_server = MockOpenAIServer(chat_latency=args.chat_latency, chunk_latency=args.chunk_latency,
+                                         image_latency=args.image_latency, faults=faults, seed=args.seed).start()
+        blogger_server = MockBloggerServer(latency=args.blogger_latency, faults=faults, seed=args.seed).start()
+        if not args.no_images:
+            openai_server.image_bytes() # Build the mock PNG up front so it isn't timed
+        configure_environment(args, openai_server, blogger_server, workdir)
+        from src.metrics import configure_logging
+        configure_logging(args.log_level)
+
+        settings = {key: getattr(args, key) for key in SETTINGS_KEYS}
+        history = load_history(args.results)
+        run_meta = {"run_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "git": _git_revision(), "python": platform.python_version()}
+        records = []
+        failed = False
+        print(f"{'posts':>6} {'rows':>9} {'posts/min':>10} {'baseline':>9} {'title p95':>10} {'body p95':>9} {'post p95':>9} "
+              f"{'db ms/post':>10} {'rank s':>7}  status")
+        for rows in row_counts:
+            db_path = prepare_database(rows, workdir, args.db_cache)
+            for posts in post_counts:
+                result = run_scenario(posts, db_path, args, openai_server, blogger_server)
+                record = {**run_meta, "rows": rows, "settings": settings, **result}
+                baseline, status = compare(record, history, args.tolerance)
+                failed |= status == "REGRESSION"
+                records.append(record)
+                stage_p95 = {name: result["stages"].get(f"stage.{name}", {}).get("p95_s", 0.0) for name in ("title", "body", "post")}
+                print(f"{posts:>6} {rows:>9} {result['posts_per_minute']:>10.1f} {baseline if baseline is not None else '-':>9} "
+                      f"{stage_p95['title']:>10.2f} {stage_p95['body']:>9.2f} {stage_p95['post']:>9.2f} "
+                      f"{result['db_ms_per_post']:>10.2f} {result['topic_ranking_s']:>7.2f}  {status}")
+                if result["counts"].get("failed"):
+                    print(f"       {result['counts']['failed']} posts failed; mock requests: {result['mock_requests']}")
+            os.remove(db_path)
+        openai_server.stop()
+        blogger_server.stop()
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(args.results), exist_ok=True)
+        with open(args.results, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+        print(f"\nSaved {len(records)} results to {args.results}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Startup benchmark for the Streamlit app and the src package, with regression thresholds.
+
+Measures, each in a fresh interpreter:
+  * import time of the src modules the app and the batch pipeline use
+  * time to first render of app/streamlit_app.py (Streamlit's AppTest harness)
+  * rerun latency after toggling the generation-mode radio
+
+Run from the project root; exits with status 1 if any median exceeds its threshold:
+    python benchmarks/bench_startup.py --max-import-ms 400 --max-render-ms 1500 --max-rerun-ms 300
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+IMPORT_SNIPPET = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+import src.blog_writer, src.blogger_api, src.trend_scraper, src.blog_db, src.config
+elapsed = time.perf_counter() - started
+heavy = [name for name in ("openai", "pytrends", "pandas", "googleapiclient", "scipy") if name in sys.modules]
+print(json.dumps({{"import_ms": elapsed * 1000, "heavy_modules_loaded": heavy}}))
+"""
+
+RENDER_SNIPPET = """
+import json, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({app!r}, default_timeout=60)
+started = time.perf_counter()
+app.run()
+first_render = time.perf_counter() - started
+started = time.perf_counter()
+app.radio[0].set_value("From Provided Content").run()
+rerun = time.perf_counter() - started
+print(json.dumps({{"render_ms": first_render * 1000, "rerun_ms": rerun * 1000, "exceptions": [str(e.value) for e in app.exception]}}))
+"""
+
+def _run_snippet(snippet: str) -> dict:
+    result = subprocess.run([sys.executable, "-c", snippet], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold-start and rerun latency.")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--max-import-ms", type=float, default=400.0)
+    parser.add_argument("--max-render-ms", type=float, default=1500.0)
+    parser.add_argument("--max-rerun-ms", type=float, default=300.0)
+    args = parser.parse_args(argv)
+
+    app_path = os.path.join(ROOT, "app", "streamlit_app.py")
+    imports = [_run_snippet(IMPORT_SNIPPET.format(root=ROOT)) for _ in range(args.runs)]
+    renders = [_run_snippet(RENDER_SNIPPET.format(app=app_path)) for _ in range(args.runs)]
+
+    results = {
+        "import_ms": statistics.median(run["import_ms"] for run in imports),
+        "render_ms": statistics.median(run["render_ms"] for run in renders),
+        "rerun_ms": statistics.median(run["rerun_ms"] for run in renders),
+    }
+    thresholds = {"import_ms": args.max_import_ms, "render_ms": args.max_render_ms, "rerun_ms": args.max_rerun_ms}
+
+    failed = False
+    for name, value in results.items():
+        status = "ok" if value <= thresholds[name] else "REGRESSION"
+        failed |= status != "ok"
+        print(f"{name:<10} {value:8.1f} ms  (threshold {thresholds[name]:.0f} ms)  {status}")
+
+    heavy = imports[0]["heavy_modules_loaded"]
+    if heavy:
+        print(f"Heavy modules imported eagerly by src: {', '.join(heavy)}  REGRESSION")
+        failed = True
+    app_errors = renders[0]["exceptions"]
+    if app_errors:
+        print(f"App raised during render: {app_errors}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
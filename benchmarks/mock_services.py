@@ -0,0 +1,431 @@
+"""Local stand-ins for the paid APIs, for offline benchmarks.
+
+  * MockOpenAIServer: OpenAI-compatible /v1/chat/completions (plain and
+    streamed) and /v1/images/generations
+  * MockBloggerServer: Blogger v3 posts insert/list and the /batch endpoint
+  * RecordedTrendsFetcher: replays recorded pytrends related-queries results;
+    a drop-in fetcher for TrendsCollector
+
+Latencies are drawn from configurable distributions, and any endpoint can
+answer a share of requests with 429 (with Retry-After) or 500. Record fresh
+Google Trends responses with:
+    python benchmarks/mock_services.py record-trends --out benchmarks/fixtures/trends_related_queries.json
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+TRENDS_FIXTURE = os.path.join(FIXTURES_DIR, "trends_related_queries.json")
+
+WORDS = (
+    "ai automation workflow productivity python data cloud security startup marketing seo content video "
+    "tools guide tips money online remote work freelance crypto design mobile apps chatbot prompt agents "
+    "analytics growth budget health fitness travel learning course career gadgets review beginners"
+).split()
+
+def parse_latency(spec: str, rng: random.Random = None):
+    """Returns a sampler (seconds) for a spec like "0.2", "fixed:0.2", "uniform:0.1,0.5",
+    "normal:0.3,0.05" or "lognormal:0.8,0.5" (median, sigma)."""
+    rng = rng or random.Random()
+    kind, _, params = str(spec).partition(":")
+    if not params:
+        kind, params = "fixed", kind
+    values = [float(value) for value in params.split(",")]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda: rng.lognormvariate(math.log(values[0]), values[1]) if values[0] > 0 else 0.0
+    raise ValueError(f"Unknown latency distribution '{kind}' (use fixed, uniform, normal or lognormal)")
+
+def make_png(width: int = 1024, height: int = 1024, seed: int = 0) -> bytes:
+    """A gradient PNG with a little noise, roughly as hard to compress as a DALL-E image (stdlib only)."""
+    rng = random.Random(seed)
+    rows = bytearray()
+    for y in range(height):
+        rows.append(0) # No PNG filter
+        for x in range(width):
+            noise = rng.randrange(16)
+            rows += bytes(((x * 255 // width + noise) & 255, (y * 255 // height + noise) & 255, (x + y + noise) & 255))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(bytes(rows), 6)) + chunk(b"IEND", b"")
+
+class FaultInjector:
+    """Decides per request whether to answer 429 (throttled) or 500 instead of the real response."""
+
+    def __init__(self, throttle_rate: float = 0.0, error_rate: float = 0.0, retry_after: float = 1.0, seed: int = None):
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def pick(self) -> int:
+        with self._lock:
+            roll = self._rng.random()
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 500
+        return 200
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)): # Clients dropping keep-alive connections
+            super().handle_error(request, client_address)
+
+class _MockServer:
+    """Threaded HTTP server with request counters. Subclasses provide the handler class."""
+
+    handler_class = None
+
+    def __init__(self, faults: FaultInjector = None, seed: int = None, host: str = "127.0.0.1", port: int = 0):
+        self.faults = faults or FaultInjector(seed=seed)
+        self.rng = random.Random(seed)
+        self.counts = {}
+        self._counts_lock = threading.Lock()
+        handler = type("Handler", (self.handler_class,), {"mock": self})
+        self._server = _QuietHTTPServer((host, port), handler)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name: str, amount: int = 1):
+        with self._counts_lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    mock = None
+
+    def log_message(self, *args):
+        pass
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, payload, headers: dict = None):
+        self._send(status, json.dumps(payload).encode("utf-8"), headers=headers)
+
+    def _inject_fault(self, endpoint: str) -> bool:
+        """Sends a 429 or 500 if the injector says so. Returns True if the request was answered."""
+        status = self.mock.faults.pick()
+        if status == 200:
+            return False
+        self.mock.count(f"{endpoint}_{status}")
+        if status == 429:
+            retry_after = self.mock.faults.retry_after
+            self._send_json(429, {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_exceeded",
+                                            "code": "rate_limit_exceeded"}},
+                            {"Retry-After": f"{retry_after:g}", "retry-after-ms": str(int(retry_after * 1000))})
+        else:
+            self._send_json(500, {"error": {"message": "Internal error (mock)", "type": "server_error"}})
+        return True
+
+class _OpenAIHandler(_JsonHandler):
+    def do_GET(self):
+        # Generated image URLs point back here, like DALL-E's temporary blob URLs
+        if not self.path.startswith("/images/"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        self.mock.count("image_downloads")
+        self._send(200, self.mock.image_bytes(), content_type="image/png")
+
+    def do_POST(self):
+        body = json.loads(self._read_body() or b"{}")
+        path = self.path.split("?")[0]
+        if path.endswith("/chat/completions"):
+            self._chat(body)
+        elif path.endswith("/images/generations"):
+            self._image(body)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {path}"}})
+
+    def _chat(self, body: dict):
+        mock = self.mock
+        if self._inject_fault("chat"):
+            return
+        prompt = body["messages"][-1]["content"]
+        prompt_tokens = len(prompt) // 4 + 1
+        if not body.get("stream"):
+            time.sleep(mock.chat_latency())
+            contents = [mock.title_completion(prompt) for _ in range(max(1, int(body.get("n") or 1)))]
+            completion_tokens = sum(len(content) // 4 + 1 for content in contents)
+            mock.count("chat")
+            self._send_json(200, {
+                "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()), "model": body.get("model"),
+                "choices": [{"index": index, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}
+                            for index, content in enumerate(contents)],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+            return
+        time.sleep(mock.chat_latency()) # Time to first token
+        mock.count("chat_stream")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        text = mock.blog_completion()
+        try:
+            for start in range(0, len(text), mock.stream_chunk_chars):
+                self._event({"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": 0, "model": body.get("model"),
+                             "choices": [{"index": 0, "delta": {"content": text[start:start + mock.stream_chunk_chars]},
+                                          "finish_reason": None}]})
+                delay = mock.chunk_latency()
+                if delay:
+                    time.sleep(delay)
+            completion_tokens = len(text) // 4 + 1
+            self._event({"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": 0, "model": body.get("model"),
+                         "choices": [], "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                                  "total_tokens": prompt_tokens + completion_tokens}})
+            self._event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            mock.count("chat_stream_aborted") # The client closed the stream early
+
+    def _event(self, payload):
+        data = ("data: " + (payload if isinstance(payload, str) else json.dumps(payload)) + "\n\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _image(self, body: dict):
+        if self._inject_fault("images"):
+            return
+        time.sleep(self.mock.image_latency())
+        number = next(self.mock._image_ids)
+        self.mock.count("images")
+        self._send_json(200, {"created": int(time.time()), "data": [{"url": f"{self.mock.url}/images/{number}.png"}]})
+
+class MockOpenAIServer(_MockServer):
+    """OpenAI-compatible server. Point OPENAI_BASE_URL at `server.url + "/v1"`.
+
+    Title requests get five unique titles per completion (n) built from the topic in the prompt;
+    streamed requests get a ~blog_words-word HTML post in stream_chunk_chars pieces.
+    """
+
+    handler_class = _OpenAIHandler
+
+    def __init__(self, chat_latency: str = "lognormal:0.4,0.3", chunk_latency: str = "0.002", image_latency: str = "lognormal:1.0,0.3",
+                 blog_words: int = 1000, stream_chunk_chars: int = 40, **kwargs):
+        super().__init__(**kwargs)
+        self.chat_latency = parse_latency(chat_latency, self.rng)
+        self.chunk_latency = parse_latency(chunk_latency, self.rng)
+        self.image_latency = parse_latency(image_latency, self.rng)
+        self.stream_chunk_chars = max(1, stream_chunk_chars)
+        self._title_ids = itertools.count(1)
+        self._image_ids = itertools.count(1)
+        self._blog_text = self._build_blog(blog_words)
+        self._png = None
+        self._png_lock = threading.Lock()
+
+    def image_bytes(self) -> bytes:
+        with self._png_lock:
+            if self._png is None:
+                self._png = make_png()
+            return self._png
+
+    def title_completion(self, prompt: str) -> str:
+        match = re.search(r'based on the following topic: "(.*?)"\. Today', prompt, re.S)
+        topic = " ".join((match.group(1) if match else "blog").split()[:8])
+        number = next(self._title_ids)
+        return "\n".join(f"{index}. {topic}: {self.rng.choice(WORDS).title()} Secrets Nobody Tells You #{number}-{index}"
+                         for index in range(1, 6))
+
+    def _build_blog(self, words: int) -> str:
+        paragraphs = []
+        written = 0
+        section = 0
+        while written < words:
+            section += 1
+            paragraph = " ".join(self.rng.choice(WORDS) for _ in range(80))
+            paragraphs.append(f"<h2>Section {section}</h2>\n<p>{paragraph}.</p>\n<ul><li>{self.rng.choice(WORDS)}</li></ul>")
+            written += 82
+        return "\n".join(paragraphs) + "\n<p>Try it today and share what you find!</p>"
+
+    def blog_completion(self) -> str:
+        return self._blog_text
+
+class _BloggerHandler(_JsonHandler):
+    def do_POST(self):
+        raw = self._read_body()
+        if self.path.split("?")[0].rstrip("/").endswith("/batch"):
+            self._batch(raw)
+            return
+        if self._inject_fault("blogger"):
+            return
+        time.sleep(self.mock.latency())
+        post = self.mock.store(json.loads(raw or b"{}"))
+        self._send_json(200, post)
+
+    def do_GET(self):
+        if self._inject_fault("blogger_list"):
+            return
+        time.sleep(self.mock.latency())
+        self.mock.count("blogger_list")
+        with self.mock._posts_lock:
+            items = list(reversed(self.mock.posts[-50:]))
+        self._send_json(200, {"kind": "blogger#postList", "items": items})
+
+    def _batch(self, raw: bytes):
+        if self._inject_fault("blogger_batch"):
+            return
+        time.sleep(self.mock.latency())
+        boundary = self.headers["Content-Type"].split("boundary=")[1].strip('"')
+        parts = [part for part in raw.decode("utf-8").split("--" + boundary) if "Content-ID" in part]
+        out_boundary = "mock_batch_boundary"
+        chunks = []
+        for part in parts:
+            content_id = re.search(r"Content-ID: <(.*)>", part).group(1)
+            body = re.split(r"\r?\n\r?\n", part, maxsplit=2)[-1].strip() # googleapiclient separates with bare \n
+            post = json.dumps(self.mock.store(json.loads(body or "{}")))
+            chunks.append(f"--{out_boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                          f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: {len(post)}\r\n\r\n{post}\r\n")
+        self.mock.count("blogger_batch")
+        data = ("".join(chunks) + f"--{out_boundary}--\r\n").encode("utf-8")
+        self._send(200, data, content_type=f"multipart/mixed; boundary={out_boundary}")
+
+class MockBloggerServer(_MockServer):
+    """Blogger v3 stand-in. Point BLOGGER_API_ENDPOINT at `server.url`; any token is accepted."""
+
+    handler_class = _BloggerHandler
+
+    def __init__(self, latency: str = "lognormal:0.3,0.3", **kwargs):
+        super().__init__(**kwargs)
+        self.latency = parse_latency(latency, self.rng)
+        self.posts = []
+        self._posts_lock = threading.Lock()
+
+    def store(self, body: dict) -> dict:
+        with self._posts_lock:
+            post = {"kind": "blogger#post", "id": str(len(self.posts) + 1), "title": body.get("title", ""),
+                    "status": "DRAFT", "published": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+            self.posts.append(post)
+        self.count("blogger_insert")
+        return post
+
+def fake_blogger_token() -> str:
+    """GCP_TOKEN_JSON value that builds valid (never expiring) credentials for the mock server."""
+    return json.dumps({"token": "mock-token", "refresh_token": "mock-refresh", "client_id": "mock", "client_secret": "mock",
+                       "expiry": "2099-01-01T00:00:00Z"})
+
+class RecordedTrendsFetcher:
+    """Replays recorded pytrends results: a fetcher for TrendsCollector that never touches the network.
+
+    Batches missing from the recording get deterministic synthetic queries, so
+    any seed list works offline.
+    """
+
+    def __init__(self, path: str = TRENDS_FIXTURE, latency: str = "lognormal:1.5,0.4", seed: int = None):
+        self.responses = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for entry in json.load(f)["responses"]:
+                    self.responses[(tuple(entry["keywords"]), entry.get("geo", ""))] = entry["related"]
+        self.latency = parse_latency(latency, random.Random(seed))
+        self.calls = 0
+
+    def __call__(self, keywords: list[str], geo: str = "") -> dict:
+        self.calls += 1
+        time.sleep(self.latency())
+        recorded = self.responses.get((tuple(keywords), geo))
+        if recorded is not None:
+            return recorded
+        rng = random.Random(f"{','.join(keywords)}|{geo}")
+        return {keyword: {kind: [f"{keyword} {rng.choice(WORDS)} {rng.choice(WORDS)}" for _ in range(count)]
+                          for kind, count in (("top", 25), ("rising", 10))}
+                for keyword in keywords}
+
+def record_trends(seeds, geos, out: str):
+    """Fetches live related queries once per batch and saves them in the fixture format."""
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+    from src.trend_scraper import PytrendsFetcher, TrendsCollector
+
+    fetcher = PytrendsFetcher()
+    collector = TrendsCollector(seeds=seeds, geos=geos, fetcher=fetcher, snapshot_path=None)
+    responses = []
+    for keywords, geo in collector.batches():
+        responses.append({"keywords": keywords, "geo": geo, "related": fetcher(keywords, geo)})
+        time.sleep(5) # Stay well below Google's rate limit
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"recorded_at": time.strftime("%Y-%m-%d"), "responses": responses}, f, indent=1)
+    print(f"Recorded {len(responses)} batches to {out}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the mock servers, or record Google Trends responses.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser("serve", help="Run the mock OpenAI and Blogger servers until interrupted.")
+    serve.add_argument("--openai-port", type=int, default=8901)
+    serve.add_argument("--blogger-port", type=int, default=8902)
+    serve.add_argument("--throttle-rate", type=float, default=0.0)
+    record = subparsers.add_parser("record-trends", help="Record live pytrends responses as a fixture.")
+    record.add_argument("--seeds", default="AI tools,tech,earn money online")
+    record.add_argument("--geos", default="")
+    record.add_argument("--out", default=TRENDS_FIXTURE)
+    args = parser.parse_args(argv)
+
+    if args.command == "record-trends":
+        record_trends([s.strip() for s in args.seeds.split(",") if s.strip()], [g.strip() for g in args.geos.split(",")], args.out)
+        return
+    faults = FaultInjector(throttle_rate=args.throttle_rate)
+    with MockOpenAIServer(port=args.openai_port, faults=faults) as openai_server, \
+            MockBloggerServer(port=args.blogger_port, faults=faults) as blogger_server:
+        print(f"OPENAI_BASE_URL={openai_server.url}/v1")
+        print(f"BLOGGER_API_ENDPOINT={blogger_server.url}")
+        print(f"GCP_TOKEN_JSON='{fake_blogger_token()}'")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
@@ -1,85 +1,453 @@
 import sqlite3
 import logging
 import os
-from .config import DATABASE_NAME
+import copy
+import queue
+import re
+import threading
+from contextlib import contextmanager
+from .config import DATABASE_NAME, DB_POOL_SIZE, TITLE_SIMILARITY_THRESHOLD
+from . import title_index
+from .metrics import traced
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+SQLITE_MAX_VARIABLES = 900 # Stay under SQLite's bound-parameter limit in IN (...) queries
+DEFAULT_NAMESPACE = "" # Dedup namespace of the single-blog setup and of rows from before multi-blog support
+
+def normalize_title(title: str) -> str:
+    """Normalizes a title for consistent database lookup."""
+    return re.sub(r'[^a-z0-9]', '', title.lower())
+
+class BlogRepository:
+    """Owns a small pool of SQLite connections to the blogs database.
+
+    Connections are opened once in WAL mode and reused, so lookups inside
+    retry loops don't pay for connect/close, and readers don't block the
+    writer when several workers share one database.
+
+    Titles are de-duplicated per namespace (one per blog, see
+    src/multi_blog.py); scoped() gives another blog's view of the same pool.
+    """
+
+    def __init__(self, path: str = DATABASE_NAME, pool_size: int = DB_POOL_SIZE, namespace: str = DEFAULT_NAMESPACE):
+        self.path = path
+        self.pool_size = max(1, pool_size)
+        self.namespace = namespace
+        self._pool = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.pool_size) # One per connection that may still be opened
+
+    def scoped(self, namespace: str) -> "BlogRepository":
+        """A repository limited to namespace that shares this one's connection pool."""
+        view = copy.copy(self)
+        view.namespace = namespace
+        return view
+
+    def _open(self) -> sqlite3.Connection:
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-16000") # ~16 MB page cache
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrows a pooled connection, opening a new one while the pool is below pool_size."""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            if self._slots.acquire(blocking=False):
+                try:
+                    conn = self._open()
+                except Exception:
+                    self._slots.release()
+                    raise
+            else:
+                conn = self._pool.get()
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._pool.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            self._slots.release()
+
+    def init_db(self):
+        self.migrate()
+
+    def schema_version(self) -> int:
+        with self.connection() as conn:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def migrate(self):
+        """Applies any migrations newer than the database's user_version.
+
+        The check and the migrations run in one BEGIN IMMEDIATE transaction so
+        concurrent workers starting together apply each migration only once.
+        """
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                    migration(conn)
+                    conn.execute(f"PRAGMA user_version = {number}")
+                    logging.info(f"Applied blogs DB migration {number}: {migration.__doc__}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    @traced("db.add", record=False) # Latency histogram only; these run per title
+    def add(self, title: str, status: str = "posted", topic: str = None, blogger_post_id: str = None,
+            token_cost: float = None, latency: float = None) -> bool:
+        """Returns False if the title was already stored."""
+        with self.connection() as conn:
+            try:
+                cursor = conn.execute(
+                    "INSERT INTO blogs (namespace, title, status, topic, created_at, posted_at, blogger_post_id, token_cost, latency) "
+                    "VALUES (?, ?, ?, ?, strftime('%Y-%m-%dT%H:%M:%fZ', 'now'), "
+                    "CASE WHEN ? = 'posted' THEN strftime('%Y-%m-%dT%H:%M:%fZ', 'now') END, ?, ?, ?)",
+                    (self.namespace, title, status, topic, status, blogger_post_id, token_cost, latency),
+                )
+                title_index.index_title(conn, cursor.lastrowid, title)
+                conn.commit()
+                return True
+            except sqlite3.IntegrityError:
+                conn.rollback()
+                return False
+
+    @traced("db.exists", record=False)
+    def exists(self, title: str) -> bool:
+        with self.connection() as conn:
+            return conn.execute("SELECT 1 FROM blogs WHERE namespace = ? AND title = ?", (self.namespace, title)).fetchone() is not None
+
+    @traced("db.bulk_exists", record=False)
+    def bulk_exists(self, titles) -> set:
+        """Returns the subset of titles already stored, using a few IN (...) queries."""
+        titles = list(dict.fromkeys(titles))
+        found = set()
+        with self.connection() as conn:
+            for start in range(0, len(titles), SQLITE_MAX_VARIABLES):
+                chunk = titles[start:start + SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(f"SELECT title FROM blogs WHERE namespace = ? AND title IN ({placeholders})", [self.namespace] + chunk)
+                found.update(row[0] for row in rows)
+        return found
+
+    @traced("db.bulk_add", record=False)
+    def bulk_add(self, entries) -> int:
+        """Inserts (title, status) or (title, status, topic) tuples in one transaction, skipping existing titles.
+
+        Returns the number of rows actually inserted.
+        """
+        added = 0
+        with self.connection() as conn:
+            for entry in entries:
+                title, status, topic = (tuple(entry) + (None,))[:3]
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO blogs (namespace, title, status, topic, created_at) "
+                    "VALUES (?, ?, ?, ?, strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))",
+                    (self.namespace, title, status, topic),
+                )
+                if cursor.rowcount:
+                    title_index.index_title(conn, cursor.lastrowid, title)
+                    added += 1
+            conn.commit()
+        return added
+
+    @traced("db.find_near_duplicates", record=False)
+    def find_near_duplicates(self, title: str, threshold: float = TITLE_SIMILARITY_THRESHOLD) -> list[tuple[str, float]]:
+        with self.connection() as conn:
+            return title_index.find_similar(conn, title, threshold, namespace=self.namespace)
+
+    @traced("db.bulk_find_near_duplicates", record=False)
+    def bulk_find_near_duplicates(self, titles, threshold: float = TITLE_SIMILARITY_THRESHOLD) -> dict[str, list[tuple[str, float]]]:
+        """Near-duplicates of several normalized titles at once; titles without matches are left out."""
+        with self.connection() as conn:
+            return title_index.find_similar_many(conn, titles, threshold, namespace=self.namespace)
+
+    def recent_titles(self, limit: int = 5) -> list[str]:
+        with self.connection() as conn:
+            return [row[0] for row in conn.execute("SELECT title FROM blogs WHERE namespace = ? ORDER BY id DESC LIMIT ?", (self.namespace, limit))]
+
+    def recent_topics(self, limit: int = 5) -> list[str]:
+        """Original topics of the latest posts, falling back to the title for old rows."""
+        with self.connection() as conn:
+            return [row[0] for row in conn.execute("SELECT COALESCE(topic, title) FROM blogs WHERE namespace = ? ORDER BY id DESC LIMIT ?", (self.namespace, limit))]
+
+    def posted_since(self, since: str) -> int:
+        """Posts published at or after since (an ISO-8601 UTC timestamp), for daily quotas."""
+        with self.connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM blogs WHERE namespace = ? AND status = 'posted' AND posted_at >= ?",
+                                (self.namespace, since)).fetchone()[0]
+
+    def page(self, after_id: int = 0, limit: int = 100, status: str = None) -> list[dict]:
+        """One page of rows with id > after_id, in id order (keyset pagination)."""
+        query = "SELECT * FROM blogs WHERE namespace = ? AND id > ?"
+        params = [self.namespace, after_id]
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        query += " ORDER BY id LIMIT ?"
+        params.append(limit)
+        with self.connection() as conn:
+            cursor = conn.execute(query, params)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor]
+
+    def iter_titles(self, batch_size: int = 1000):
+        """Streams every stored title without loading the table into memory."""
+        after_id = 0
+        while True:
+            with self.connection() as conn:
+                rows = conn.execute("SELECT id, title FROM blogs WHERE namespace = ? AND id > ? ORDER BY id LIMIT ?",
+                                    (self.namespace, after_id, batch_size)).fetchall()
+            if not rows:
+                return
+            for _, title in rows:
+                yield title
+            after_id = rows[-1][0]
+
+    def iter_topics(self, batch_size: int = 1000):
+        """Streams the original topic of every post (the title for rows without one)."""
+        after_id = 0
+        while True:
+            with self.connection() as conn:
+                rows = conn.execute("SELECT id, COALESCE(topic, title) FROM blogs WHERE namespace = ? AND id > ? ORDER BY id LIMIT ?",
+                                    (self.namespace, after_id, batch_size)).fetchall()
+            if not rows:
+                return
+            for _, topic in rows:
+                yield topic
+            after_id = rows[-1][0]
+
+    def all_titles(self) -> list[str]:
+        return list(self.iter_titles())
+
+def _create_blogs_table(conn: sqlite3.Connection):
+    """create blogs table"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS blogs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL UNIQUE,
+            status TEXT NOT NULL
+        )
+    """)
+
+def _add_history_columns(conn: sqlite3.Connection):
+    """add topic, timestamps, Blogger post id, cost and latency columns plus indexes"""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(blogs)")}
+    for column, column_type in (
+        ("topic", "TEXT"),
+        ("created_at", "TEXT"),
+        ("posted_at", "TEXT"),
+        ("blogger_post_id", "TEXT"),
+        ("token_cost", "REAL"),
+        ("latency", "REAL"),
+    ):
+        if column not in existing:
+            conn.execute(f"ALTER TABLE blogs ADD COLUMN {column} {column_type}")
+    # Rows from before this migration have no timestamps; date them at migration time
+    conn.execute("UPDATE blogs SET created_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now') WHERE created_at IS NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_blogs_status ON blogs(status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_blogs_created_at ON blogs(created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_blogs_posted_at ON blogs(posted_at)")
+
+def _add_title_index(conn: sqlite3.Connection):
+    """add MinHash/LSH near-duplicate title index"""
+    title_index.create_index_table(conn)
+    title_index.rebuild_index(conn)
+
+def _create_jobs_table(conn: sqlite3.Connection):
+    """add jobs table for the durable post queue"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            topic TEXT NOT NULL,
+            source_content TEXT,
+            title TEXT,
+            normalized_title TEXT,
+            html TEXT,
+            image_url TEXT,
+            blogger_post_id TEXT,
+            post_attempted_at REAL,
+            stage TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            lease_owner TEXT,
+            lease_expires REAL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_lease ON jobs(status, lease_expires)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_normalized_title ON jobs(normalized_title)")
+
+def _add_blog_namespace(conn: sqlite3.Connection):
+    """make titles unique per blog namespace instead of globally"""
+    # SQLite can't drop the UNIQUE(title) constraint in place, so rebuild the table keeping row ids (title_lsh refers to them)
+    conn.execute("""
+        CREATE TABLE blogs_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            namespace TEXT NOT NULL DEFAULT '',
+            title TEXT NOT NULL,
+            status TEXT NOT NULL,
+            topic TEXT,
+            created_at TEXT,
+            posted_at TEXT,
+            blogger_post_id TEXT,
+            token_cost REAL,
+            latency REAL,
+            UNIQUE (namespace, title)
+        )
+    """)
+    conn.execute("""
+        INSERT INTO blogs_new (id, title, status, topic, created_at, posted_at, blogger_post_id, token_cost, latency)
+        SELECT id, title, status, topic, created_at, posted_at, blogger_post_id, token_cost, latency FROM blogs
+    """)
+    conn.execute("DROP TABLE blogs")
+    conn.execute("ALTER TABLE blogs_new RENAME TO blogs")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_blogs_status ON blogs(status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_blogs_created_at ON blogs(created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_blogs_posted_at ON blogs(namespace, posted_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_blogs_namespace ON blogs(namespace)") # Rows come back in id order, for recent_titles
+
+# Append new migrations at the end; PRAGMA user_version records how many have run
+MIGRATIONS = [
+    _create_blogs_table,
+    _add_history_columns,
+    _add_title_index,
+    _create_jobs_table,
+    _add_blog_namespace,
+]
+
+_default_repository = None
+_default_repository_lock = threading.Lock()
+
+def get_repository() -> BlogRepository:
+    """Returns the process-wide repository for DATABASE_NAME."""
+    global _default_repository
+    if _default_repository is None:
+        with _default_repository_lock:
+            if _default_repository is None:
+                _default_repository = BlogRepository()
+    return _default_repository
 
 def init_db():
-    conn = None
     try:
-        os.makedirs(os.path.dirname(DATABASE_NAME), exist_ok=True)
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS blogs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL UNIQUE,
-                status TEXT NOT NULL
-            )
-        """)
-        conn.commit()
+        get_repository().init_db()
         logging.info("Database initialized successfully.")
     except sqlite3.Error as e:
         logging.error(f"Error initializing database: {e}")
-    finally:
-        if conn:
-            conn.close()
 
-def add_blog_entry(title: str, status: str = "posted"):
-    conn = None
+def add_blog_entry(title: str, status: str = "posted", topic: str = None, blogger_post_id: str = None,
+                   token_cost: float = None, latency: float = None):
     try:
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO blogs (title, status) VALUES (?, ?)", (title, status))
-        conn.commit()
-        logging.info(f"Added blog entry: {title} with status {status}")
-    except sqlite3.IntegrityError:
-        logging.warning(f"Blog entry with title '{title}' already exists in DB. Skipping addition.")
+        if get_repository().add(title, status, topic, blogger_post_id, token_cost, latency):
+            logging.info(f"Added blog entry: {title} with status {status}")
+        else:
+            logging.warning(f"Blog entry with title '{title}' already exists in DB. Skipping addition.")
     except sqlite3.Error as e:
         logging.error(f"Error adding blog entry '{title}': {e}")
-    finally:
-        if conn:
-            conn.close()
 
 def blog_exists(title: str) -> bool:
-    conn = None
     try:
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1 FROM blogs WHERE title = ?", (title,))
-        return cursor.fetchone() is not None
+        return get_repository().exists(title)
     except sqlite3.Error as e:
         logging.error(f"Error checking for blog entry '{title}': {e}")
         return False
-    finally:
-        if conn:
-            conn.close()
+
+def find_near_duplicates(title: str, threshold: float = TITLE_SIMILARITY_THRESHOLD) -> list[tuple[str, float]]:
+    """Stored titles that are near-duplicates of a normalized title, best match first."""
+    try:
+        return get_repository().find_near_duplicates(title, threshold)
+    except sqlite3.Error as e:
+        logging.error(f"Error searching near-duplicates for '{title}': {e}")
+        return []
+
+def is_near_duplicate(title: str, threshold: float = TITLE_SIMILARITY_THRESHOLD) -> bool:
+    matches = find_near_duplicates(title, threshold)
+    if matches:
+        logging.info(f"Title '{title}' is a near-duplicate of '{matches[0][0]}' (similarity {matches[0][1]:.2f}).")
+    return bool(matches)
+
+def bulk_blog_exists(titles) -> set:
+    try:
+        return get_repository().bulk_exists(titles)
+    except sqlite3.Error as e:
+        logging.error(f"Error checking for blog entries: {e}")
+        return set()
+
+def bulk_find_near_duplicates(titles, threshold: float = TITLE_SIMILARITY_THRESHOLD) -> dict[str, list[tuple[str, float]]]:
+    try:
+        return get_repository().bulk_find_near_duplicates(titles, threshold)
+    except sqlite3.Error as e:
+        logging.error(f"Error searching near-duplicates: {e}")
+        return {}
+
+def bulk_add_blog_entries(entries) -> int:
+    try:
+        added = get_repository().bulk_add(entries)
+        logging.info(f"Added {added} blog entries.")
+        return added
+    except sqlite3.Error as e:
+        logging.error(f"Error adding blog entries: {e}")
+        return 0
 
 def get_recent_topics(limit: int = 5) -> list[str]:
-    conn = None
     try:
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT title FROM blogs ORDER BY id DESC LIMIT ?", (limit,))
-        return [row[0] for row in cursor.fetchall()]
+        return get_repository().recent_topics(limit)
     except sqlite3.Error as e:
         logging.error(f"Error retrieving recent topics: {e}")
         return []
-    finally:
-        if conn:
-            conn.close()
+
+def get_recent_titles(limit: int = 50) -> list[str]:
+    """Latest normalized titles, read through the primary key index."""
+    try:
+        return get_repository().recent_titles(limit)
+    except sqlite3.Error as e:
+        logging.error(f"Error retrieving recent titles: {e}")
+        return []
+
+def get_blogs_page(after_id: int = 0, limit: int = 100, status: str = None) -> list[dict]:
+    try:
+        return get_repository().page(after_id, limit, status)
+    except sqlite3.Error as e:
+        logging.error(f"Error retrieving blog entries: {e}")
+        return []
+
+def iter_normalized_titles(batch_size: int = 1000):
+    """Streams all stored titles page by page; prefer this over get_all_normalized_titles."""
+    try:
+        yield from get_repository().iter_titles(batch_size)
+    except sqlite3.Error as e:
+        logging.error(f"Error streaming normalized titles: {e}")
+
+def get_topic_history() -> list[str]:
+    """Every past topic, for scoring new candidates against the full history."""
+    try:
+        return list(get_repository().iter_topics(batch_size=5000))
+    except sqlite3.Error as e:
+        logging.error(f"Error retrieving topic history: {e}")
+        return []
 
 def get_all_normalized_titles() -> list[str]:
-    conn = None
     try:
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT title FROM blogs")
-        return [row[0] for row in cursor.fetchall()]
+        return get_repository().all_titles()
     except sqlite3.Error as e:
         logging.error(f"Error retrieving all normalized titles: {e}")
         return []
-    finally:
-        if conn:
-            conn.close()
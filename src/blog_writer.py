@@ -1,60 +1,148 @@
-import os
+import asyncio
 import logging
 import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import date
-from openai import OpenAI
-from tenacity import retry, stop_after_attempt, wait_fixed
+from .openai_client import get_openai_client, get_async_openai_client
+from .llm_cache import get_llm_cache
+from .rate_limit import adaptive_retry, endpoint_slot
+from .content_validator import BlogStreamValidator, GenerationAborted
+from .prompt_budget import record_prompt, select_relevant_titles, budget_topic, budget_source_content
+from .metrics import registry, traced, run_in_context, record_llm_usage, record_image
+from .config import IMAGE_WORKERS, IMAGE_URL_TTL, IMAGE_PIPELINE_ENABLED, TITLE_COMPLETIONS
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+_image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="blog-image")
 
-@retry(stop_after_attempt(3), wait_fixed(2))
-def generate_image(client, prompt: str) -> str:
+CHAT_MODEL = "gpt-3.5-turbo"
+IMAGE_MODEL = "dall-e-3"
+IMAGE_PARAMS = {"size": "1024x1024", "quality": "standard", "n": 1}
+BLOG_COMPLETION_TOKENS = 1500 # Rough size of a 1000-word post, reserved against the tokens-per-minute budget
+TITLE_COMPLETION_TOKENS = 150 # Enough for the five titles of one completion
+
+def _reserve_tokens(kind: str, prompt: str, max_tokens: int = BLOG_COMPLETION_TOKENS) -> int:
+    """Tokens to reserve against the tokens-per-minute budget: the counted prompt plus the expected completion."""
+    return record_prompt(kind, prompt, CHAT_MODEL) + max_tokens
+
+def _record_usage(slot, usage):
+    """Settles the rate-limit reservation and records tokens and cost for the current span."""
+    if usage is None:
+        return
+    slot.record_usage(usage.total_tokens)
+    record_llm_usage(CHAT_MODEL, usage.prompt_tokens, usage.completion_tokens)
+
+def _cache_lookup(use_cache: bool, kind: str, model: str, prompt: str, **params):
+    """Returns (key, cached_value). Retries and restarted runs hit the cache instead of the API."""
+    if not use_cache:
+        return None, None
+    cache = get_llm_cache()
+    key = cache.make_key(kind, model, prompt, **params)
+    cached = cache.get(key)
+    registry.counter("llm_cache_lookups_total", "LLM cache lookups, by kind and result.").inc(kind=kind, result="miss" if cached is None else "hit")
+    if cached is not None:
+        logging.info(f"LLM cache hit for {kind}.")
+    return key, cached
+
+def _cache_store(key: str, value, kind: str, ttl: float = None):
+    if key is not None:
+        get_llm_cache().set(key, value, kind=kind, ttl=ttl)
+
+@traced("openai.image")
+@adaptive_retry()
+def generate_image(client, prompt: str, use_cache: bool = True) -> str:
+    key, cached = _cache_lookup(use_cache, "image", IMAGE_MODEL, prompt, **IMAGE_PARAMS)
+    if cached is not None:
+        return cached
     try:
-        response = client.images.generate(
-            model="dall-e-3",
-            prompt=prompt,
-            size="1024x1024",
-            quality="standard",
-            n=1,
-        )
+        with endpoint_slot("images"):
+            response = client.images.generate(
+                model=IMAGE_MODEL,
+                prompt=prompt,
+                **IMAGE_PARAMS,
+            )
         image_url = response.data[0].url
+        record_image(IMAGE_MODEL)
+        _cache_store(key, image_url, "image", ttl=IMAGE_URL_TTL)
         return image_url
     except Exception as e:
         logging.error(f"Error generating image: {e}")
         raise  # Re-raise the exception to allow retry
 
-@retry(stop_after_attempt(3), wait_fixed(2))
-def generate_attractive_title(topic: str, titles_to_avoid: list[str] = None) -> str:
-    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+def build_title_prompt(topic: str, titles_to_avoid: list[str] = None) -> str:
     current_date = date.today().strftime("%B %d, %Y")
+    topic = budget_topic(topic)
+    # Only the most similar past titles, within a fixed token budget, however long the history is
+    titles_to_avoid = select_relevant_titles(topic, titles_to_avoid or [])
     avoid_prompt = ""
     if titles_to_avoid:
         avoid_prompt = f"\nAvoid generating titles similar to or containing keywords from: {', '.join(titles_to_avoid)}"
-    prompt = f"""Generate 5 highly attractive, clickbait-style, and SEO-friendly blog post titles based on the following topic: "{topic}". Today's date is {current_date}. The titles should be concise, engaging, and make readers want to click immediately. Provide only the titles, one per line, without any additional text or numbering.{avoid_prompt}
+    return f"""Generate 5 highly attractive, clickbait-style, and SEO-friendly blog post titles based on the following topic: "{topic}". Today's date is {current_date}. The titles should be concise, engaging, and make readers want to click immediately. Provide only the titles, one per line, without any additional text or numbering.{avoid_prompt}
     """
 
+def parse_title_candidates(raw_content: str) -> list[str]:
+    """Every title in a completion, in order, without list numbering or quotes and without repeats."""
+    titles = []
+    for line in raw_content.split("\n"):
+        title = re.sub(r"^\s*(?:\d+[.)]|[-*])\s*", "", line).strip().strip('"').strip() # Remove leading numbers or bullets
+        if title:
+            titles.append(title)
+    return list(dict.fromkeys(titles))
+
+def _title_params(n: int) -> dict:
+    # n is left out for a single completion so those requests keep their old cache keys
+    return {"max_tokens": TITLE_COMPLETION_TOKENS, **({"n": n} if n > 1 else {})}
+
+@traced("openai.title")
+@adaptive_retry()
+def generate_title_candidates(topic: str, titles_to_avoid: list[str] = None, use_cache: bool = True, n: int = TITLE_COMPLETIONS) -> list[str]:
+    """All titles the model suggests for topic, from n completions of one request. Falls back to [topic]."""
+    client = get_openai_client()
+    prompt = build_title_prompt(topic, titles_to_avoid)
+    params = _title_params(n)
+    key, raw_content = _cache_lookup(use_cache, "title", CHAT_MODEL, prompt, **params)
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=150 # Increased max_tokens to allow for multiple titles
-        )
-        raw_titles = response.choices[0].message.content.strip().split('\n')
-        # Select the first non-empty title as the attractive title
-        attractive_title = next((title.strip() for title in raw_titles if title.strip()), topic) # Fallback to original topic if no attractive title is generated
-        attractive_title = re.sub(r"^\d+\.\s*", "", attractive_title) # Remove leading numbers and periods
-        attractive_title = re.sub(r"^\d+\.\s*", "", attractive_title) # Remove leading numbers and periods
-        logging.info(f"Generated attractive title for '{topic}': {attractive_title}")
-        return attractive_title
+        if raw_content is None:
+            with endpoint_slot("chat", tokens=_reserve_tokens("title", prompt, TITLE_COMPLETION_TOKENS * n)) as slot:
+                response = client.chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=[{"role": "user", "content": prompt}],
+                    **params,
+                )
+                _record_usage(slot, getattr(response, "usage", None))
+            raw_content = "\n".join(choice.message.content or "" for choice in response.choices)
+            _cache_store(key, raw_content, "title")
+        candidates = parse_title_candidates(raw_content)
+        logging.info(f"Generated {len(candidates)} title candidates for '{topic}'.")
+        return candidates or [topic]
     except Exception as e:
         logging.error(f"Error generating attractive title for '{topic}': {e}")
         raise
 
-@retry(stop_after_attempt(3), wait_fixed(2))
-def generate_blog(title: str) -> str:
-    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+def generate_attractive_title(topic: str, titles_to_avoid: list[str] = None, use_cache: bool = True) -> str:
+    """The model's first suggestion; see title_selector.choose_title to rank all of them instead."""
+    attractive_title = generate_title_candidates(topic, titles_to_avoid, use_cache, n=1)[0]
+    logging.info(f"Generated attractive title for '{topic}': {attractive_title}")
+    return attractive_title
+
+def build_image_prompt(title: str) -> str:
+    return f"A relevant image for a blog post titled: {title}"
+
+def embed_image(content: str, image_url: str, title: str) -> str:
+    """Embeds the image at the beginning of the blog post, with responsive srcsets if it came from the image store."""
+    if image_url:
+        stored = None
+        if IMAGE_PIPELINE_ENABLED:
+            from .image_store import get_image_store
+            stored = get_image_store().find_by_url(image_url)
+        if stored is not None:
+            content = stored.to_html(title) + "<br>" + content
+        else:
+            content = f'<img src="{image_url}" alt="{title}" style="width:100%; max-width:600px; height:auto;"><br>' + content
+    return content
+
+def build_blog_prompt(title: str) -> str:
     current_date = date.today().strftime("%B %d, %Y")
-    prompt = f"""Write a 1000-word SEO blog post titled: "{title}". Today's date is {current_date}.
+    return f"""Write a 1000-word SEO blog post titled: "{title}". Today's date is {current_date}.
     The post should be in HTML format, suitable for a blog.
     It should be written in a human-like, engaging, and first-person style, as if a person is writing it.
     It should include:
@@ -65,30 +153,10 @@ def generate_blog(title: str) -> str:
     - Absolutely do NOT include any personal information, email addresses, or names.
     """
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-        )
-        raw_content = response.choices[0].message.content
-    except Exception as e:
-        logging.error(f"Error generating blog content: {e}")
-        raise  # Re-raise the exception to allow retry
-
-    image_prompt = f"A relevant image for a blog post titled: {title}"
-    image_url = generate_image(client, image_prompt)
-
-    if image_url:
-        # Embed the image at the beginning of the blog post
-        raw_content = f'<img src="{image_url}" alt="{title}" style="width:100%; max-width:600px; height:auto;"><br>' + raw_content
-
-    return raw_content
-
-@retry(stop_after_attempt(3), wait_fixed(2))
-def generate_blog_from_content(original_content: str, title: str) -> str:
-    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+def build_blog_from_content_prompt(original_content: str, title: str) -> str:
     current_date = date.today().strftime("%B %d, %Y")
-    prompt = f"""Rewrite and expand the following content into a 1000-word SEO blog post titled: "{title}". Today's date is {current_date}.
+    original_content = budget_source_content(original_content)
+    return f"""Rewrite and expand the following content into a 1000-word SEO blog post titled: "{title}". Today's date is {current_date}.
     The post should be in HTML format, suitable for a blog.
     It should be written in a human-like, engaging, and first-person style, as if a person is writing it.
     It should include:
@@ -102,20 +170,293 @@ def generate_blog_from_content(original_content: str, title: str) -> str:
     {original_content}
     """
 
+def _stream_blog(client, prompt: str, error_context: str, use_cache: bool = True, validator: BlogStreamValidator = None):
+    """Yields the post's HTML in chunks as the completion streams in.
+
+    Every chunk goes through the validator before it is yielded; on a
+    violation the stream is closed, so the rest of the post is neither
+    generated nor paid for, and GenerationAborted is raised. A finished post
+    is cached and later requests for the same prompt get it as one chunk.
+    """
+    key, cached = _cache_lookup(use_cache, "blog", CHAT_MODEL, prompt)
+    if cached is not None:
+        yield cached
+        return
+    validator = validator or BlogStreamValidator()
+    started = time.perf_counter()
+    first_token_at = None
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-        )
-        raw_content = response.choices[0].message.content
+        with endpoint_slot("chat", tokens=_reserve_tokens("blog", prompt)) as slot:
+            stream = client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            try:
+                for chunk in stream:
+                    _record_usage(slot, chunk.usage)
+                    text = chunk.choices[0].delta.content if chunk.choices else None
+                    if not text:
+                        continue
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        registry.histogram("blog_first_token_seconds", "Time to the first streamed token.").observe(first_token_at - started)
+                        logging.info(f"First token of {error_context} after {first_token_at - started:.2f}s.")
+                    validator.feed(text)
+                    yield text
+            finally:
+                stream.close() # Ends the request early if we stopped reading
+        validator.finish()
+        _cache_store(key, validator.text, "blog")
+    except GenerationAborted as e:
+        logging.warning(f"Aborted {error_context} after {len(e.partial_text)} characters: {e.reason}")
+        raise
     except Exception as e:
-        logging.error(f"Error generating blog from provided content: {e}")
+        logging.error(f"Error generating {error_context}: {e}")
         raise  # Re-raise the exception to allow retry
 
-    image_prompt = f"A relevant image for a blog post titled: {title}"
-    image_url = generate_image(client, image_prompt)
+def _complete_blog(client, prompt: str, error_context: str, use_cache: bool = True) -> str:
+    return "".join(_stream_blog(client, prompt, error_context, use_cache))
 
-    if image_url:
-        raw_content = f'<img src="{image_url}" alt="{title}" style="width:100%; max-width:600px; height:auto;"><br>' + raw_content
+def _retry_until_first_chunk(start_stream):
+    """Yields the chunks of start_stream(), starting a new stream on retryable errors until one produces output.
+
+    Errors after the first chunk are raised as they are, since the caller may
+    already have shown that chunk.
+    """
+    @adaptive_retry()
+    def first_chunk():
+        stream = start_stream()
+        return stream, next(stream, None)
+
+    stream, chunk = first_chunk()
+    if chunk is None:
+        return
+    yield chunk
+    yield from stream
+
+def stream_blog_text(title: str, use_cache: bool = True, validator: BlogStreamValidator = None):
+    """Streaming generate_blog_text: yields HTML chunks. Retried like generate_blog_text until the first chunk arrives."""
+    client = get_openai_client()
+    return _retry_until_first_chunk(lambda: _stream_blog(client, build_blog_prompt(title), "blog content", use_cache, validator))
+
+def stream_blog_text_from_content(original_content: str, title: str, use_cache: bool = True, validator: BlogStreamValidator = None):
+    """Streaming generate_blog_text_from_content: yields HTML chunks, retried until the first one arrives."""
+    client = get_openai_client()
+    prompt = build_blog_from_content_prompt(original_content, title)
+    return _retry_until_first_chunk(lambda: _stream_blog(client, prompt, "blog from provided content", use_cache, validator))
+
+@traced("openai.blog")
+@adaptive_retry()
+def generate_blog_text(title: str, use_cache: bool = True) -> str:
+    """Generates only the HTML body for a title, without the image."""
+    client = get_openai_client()
+    return _complete_blog(client, build_blog_prompt(title), "blog content", use_cache)
+
+@traced("openai.blog")
+@adaptive_retry()
+def generate_blog_text_from_content(original_content: str, title: str, use_cache: bool = True) -> str:
+    """Generates only the HTML body from provided content, without the image."""
+    client = get_openai_client()
+    return _complete_blog(client, build_blog_from_content_prompt(original_content, title), "blog from provided content", use_cache)
+
+def generate_blog_image(title: str, use_cache: bool = True) -> str:
+    """Returns the URL to embed: a stored, resized copy (see image_store.py), or the DALL-E URL if the pipeline is off."""
+    client = get_openai_client()
+    prompt = build_image_prompt(title)
+    if not IMAGE_PIPELINE_ENABLED:
+        return generate_image(client, prompt, use_cache)
+    from .image_store import get_image_store
+    return get_image_store().get_or_create(prompt, lambda p: generate_image(client, p, use_cache), reuse=use_cache).url
+
+def start_blog_image(title: str, use_cache: bool = True) -> Future:
+    """Starts image generation in the background and returns its Future."""
+    # run_in_context so the image's span and cost count toward the caller's post
+    return _image_executor.submit(run_in_context(generate_blog_image), title, use_cache)
+
+def attach_image(content: str, image_future: Future, title: str, timeout: float = None) -> str:
+    """Waits for a background image and embeds it.
+
+    Text and image retry independently, so a failed or slow image never costs
+    a second completion: the post just goes out without the image.
+    """
+    try:
+        image_url = image_future.result(timeout=timeout)
+    except FutureTimeoutError:
+        logging.warning(f"Image for '{title}' not ready after {timeout}s. Continuing without it.")
+        return content
+    except Exception as e:
+        logging.error(f"Error generating image for '{title}': {e}. Continuing without it.")
+        return content
+    return embed_image(content, image_url, title)
+
+def generate_blog_deferred(title: str, use_cache: bool = True) -> tuple[str, Future]:
+    """Generates the blog text while the image runs in the background.
+
+    Returns the text and the image Future, for callers that want to post
+    without waiting and attach the image later with attach_image().
+    """
+    image_future = start_blog_image(title, use_cache)
+    try:
+        return generate_blog_text(title, use_cache), image_future
+    except Exception:
+        image_future.cancel()
+        raise
+
+def generate_blog_from_content_deferred(original_content: str, title: str, use_cache: bool = True) -> tuple[str, Future]:
+    image_future = start_blog_image(title, use_cache)
+    try:
+        return generate_blog_text_from_content(original_content, title, use_cache), image_future
+    except Exception:
+        image_future.cancel()
+        raise
+
+def generate_blog(title: str, use_cache: bool = True) -> str:
+    # Text and image only depend on the title, so run them at the same time
+    raw_content, image_future = generate_blog_deferred(title, use_cache)
+    return attach_image(raw_content, image_future, title)
+
+def generate_blog_from_content(original_content: str, title: str, use_cache: bool = True) -> str:
+    raw_content, image_future = generate_blog_from_content_deferred(original_content, title, use_cache)
+    return attach_image(raw_content, image_future, title)
+
+# Async variants. These share one AsyncOpenAI client per event loop, so a batch
+# can run many completions concurrently over a handful of warm connections.
+
+@traced("openai.image")
+@adaptive_retry()
+async def generate_image_async(client, prompt: str, use_cache: bool = True) -> str:
+    key, cached = _cache_lookup(use_cache, "image", IMAGE_MODEL, prompt, **IMAGE_PARAMS)
+    if cached is not None:
+        return cached
+    try:
+        async with endpoint_slot("images"):
+            response = await client.images.generate(
+                model=IMAGE_MODEL,
+                prompt=prompt,
+                **IMAGE_PARAMS,
+            )
+        image_url = response.data[0].url
+        record_image(IMAGE_MODEL)
+        _cache_store(key, image_url, "image", ttl=IMAGE_URL_TTL)
+        return image_url
+    except Exception as e:
+        logging.error(f"Error generating image: {e}")
+        raise
 
-    return raw_content
+@traced("openai.title")
+@adaptive_retry()
+async def generate_title_candidates_async(topic: str, titles_to_avoid: list[str] = None, use_cache: bool = True,
+                                          n: int = TITLE_COMPLETIONS) -> list[str]:
+    client = get_async_openai_client()
+    prompt = build_title_prompt(topic, titles_to_avoid)
+    params = _title_params(n)
+    key, raw_content = _cache_lookup(use_cache, "title", CHAT_MODEL, prompt, **params)
+    try:
+        if raw_content is None:
+            async with endpoint_slot("chat", tokens=_reserve_tokens("title", prompt, TITLE_COMPLETION_TOKENS * n)) as slot:
+                response = await client.chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=[{"role": "user", "content": prompt}],
+                    **params,
+                )
+                _record_usage(slot, getattr(response, "usage", None))
+            raw_content = "\n".join(choice.message.content or "" for choice in response.choices)
+            _cache_store(key, raw_content, "title")
+        candidates = parse_title_candidates(raw_content)
+        logging.info(f"Generated {len(candidates)} title candidates for '{topic}'.")
+        return candidates or [topic]
+    except Exception as e:
+        logging.error(f"Error generating attractive title for '{topic}': {e}")
+        raise
+
+async def generate_attractive_title_async(topic: str, titles_to_avoid: list[str] = None, use_cache: bool = True) -> str:
+    attractive_title = (await generate_title_candidates_async(topic, titles_to_avoid, use_cache, n=1))[0]
+    logging.info(f"Generated attractive title for '{topic}': {attractive_title}")
+    return attractive_title
+
+async def _stream_blog_async(client, prompt: str, error_context: str, use_cache: bool = True, validator: BlogStreamValidator = None):
+    key, cached = _cache_lookup(use_cache, "blog", CHAT_MODEL, prompt)
+    if cached is not None:
+        yield cached
+        return
+    validator = validator or BlogStreamValidator()
+    try:
+        async with endpoint_slot("chat", tokens=_reserve_tokens("blog", prompt)) as slot:
+            stream = await client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            try:
+                async for chunk in stream:
+                    _record_usage(slot, chunk.usage)
+                    text = chunk.choices[0].delta.content if chunk.choices else None
+                    if text:
+                        validator.feed(text)
+                        yield text
+            finally:
+                await stream.close()
+        validator.finish()
+        _cache_store(key, validator.text, "blog")
+    except GenerationAborted as e:
+        logging.warning(f"Aborted {error_context} after {len(e.partial_text)} characters: {e.reason}")
+        raise
+    except Exception as e:
+        logging.error(f"Error generating {error_context}: {e}")
+        raise
+
+async def _complete_blog_async(client, prompt: str, error_context: str, use_cache: bool = True) -> str:
+    return "".join([chunk async for chunk in _stream_blog_async(client, prompt, error_context, use_cache)])
+
+@traced("openai.blog")
+@adaptive_retry()
+async def generate_blog_text_async(title: str, use_cache: bool = True) -> str:
+    client = get_async_openai_client()
+    return await _complete_blog_async(client, build_blog_prompt(title), "blog content", use_cache)
+
+@traced("openai.blog")
+@adaptive_retry()
+async def generate_blog_text_from_content_async(original_content: str, title: str, use_cache: bool = True) -> str:
+    client = get_async_openai_client()
+    return await _complete_blog_async(client, build_blog_from_content_prompt(original_content, title), "blog from provided content", use_cache)
+
+async def generate_blog_image_async(title: str, use_cache: bool = True) -> str:
+    client = get_async_openai_client()
+    prompt = build_image_prompt(title)
+    if not IMAGE_PIPELINE_ENABLED:
+        return await generate_image_async(client, prompt, use_cache)
+    from .image_store import get_image_store
+    stored = await get_image_store().get_or_create_async(prompt, lambda p: generate_image_async(client, p, use_cache), reuse=use_cache)
+    return stored.url
+
+async def attach_image_async(content: str, image_task: asyncio.Task, title: str, timeout: float = None) -> str:
+    try:
+        image_url = await asyncio.wait_for(asyncio.shield(image_task), timeout)
+    except asyncio.TimeoutError:
+        logging.warning(f"Image for '{title}' not ready after {timeout}s. Continuing without it.")
+        return content
+    except Exception as e:
+        logging.error(f"Error generating image for '{title}': {e}. Continuing without it.")
+        return content
+    return embed_image(content, image_url, title)
+
+async def generate_blog_async(title: str, use_cache: bool = True) -> str:
+    image_task = asyncio.create_task(generate_blog_image_async(title, use_cache))
+    try:
+        raw_content = await generate_blog_text_async(title, use_cache)
+    except Exception:
+        image_task.cancel()
+        raise
+    return await attach_image_async(raw_content, image_task, title)
+
+async def generate_blog_from_content_async(original_content: str, title: str, use_cache: bool = True) -> str:
+    image_task = asyncio.create_task(generate_blog_image_async(title, use_cache))
+    try:
+        raw_content = await generate_blog_text_from_content_async(original_content, title, use_cache)
+    except Exception:
+        image_task.cancel()
+        raise
+    return await attach_image_async(raw_content, image_task, title)
@@ -1,32 +1,186 @@
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
 import logging
 import os
 import json
-from tenacity import retry, stop_after_attempt, wait_fixed
+import threading
+from .config import BLOGGER_API_ENDPOINT, BLOGGER_DISCOVERY_DOC, BLOGGER_BATCH_SIZE
+from .rate_limit import adaptive_retry, endpoint_slot
+from .metrics import traced
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+SCOPES = ["https://www.googleapis.com/auth/blogger"]
+DEFAULT_TOKEN_ENV = "GCP_TOKEN_JSON"
 
-@retry(stop_after_attempt(3), wait_fixed(2))
-def post_to_blogger(title, content, blog_id):
-    try:
-        token_json_str = os.environ.get("GCP_TOKEN_JSON")
-        if not token_json_str:
-            raise ValueError("GCP_TOKEN_JSON environment variable not set.")
-        
-        creds_info = json.loads(token_json_str)
-        creds = Credentials.from_authorized_user_info(creds_info, ["https://www.googleapis.com/auth/blogger"])
-        
-        service = build("blogger", "v3", credentials=creds)
+class BloggerClient:
+    """Long-lived Blogger v3 client.
+
+    Credentials are parsed and the service is built once, from the discovery
+    document bundled with google-api-python-client (or a local copy), so no
+    discovery request is made per post. The access token is refreshed only
+    when it has expired. httplib2 connections are not thread-safe, so every
+    thread gets its own authorized HTTP object while sharing the service.
+    Without explicit credentials the token JSON is read from the token_env
+    environment variable, so each blog of a multi-blog setup can use its own.
+    """
+
+    def __init__(self, credentials=None, api_endpoint: str = BLOGGER_API_ENDPOINT,
+                 discovery_doc: str = BLOGGER_DISCOVERY_DOC, batch_size: int = BLOGGER_BATCH_SIZE,
+                 token_env: str = DEFAULT_TOKEN_ENV):
+        self.api_endpoint = api_endpoint
+        self.discovery_doc = discovery_doc
+        self.batch_size = batch_size
+        self.token_env = token_env
+        self._credentials = credentials
+        self._service = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def credentials(self):
+        if self._credentials is None:
+            from google.oauth2.credentials import Credentials
+            token_json_str = os.environ.get(self.token_env)
+            if not token_json_str:
+                raise ValueError(f"{self.token_env} environment variable not set.")
+            creds_info = json.loads(token_json_str)
+            self._credentials = Credentials.from_authorized_user_info(creds_info, SCOPES)
+        return self._credentials
+
+    def _ensure_fresh_token(self):
+        creds = self.credentials
+        if getattr(creds, "expired", False) and getattr(creds, "refresh_token", None):
+            with self._lock:
+                if creds.expired:
+                    from google.auth.transport.requests import Request
+                    creds.refresh(Request())
+                    logging.info("Refreshed Blogger access token.")
+
+    @property
+    def service(self):
+        if self._service is None:
+            with self._lock:
+                if self._service is None:
+                    self._service = self._build_service()
+        return self._service
+
+    def _build_service(self):
+        # Imported here so importing this module stays cheap for the Streamlit app
+        from googleapiclient.discovery import build, build_from_document
+        client_options = {"api_endpoint": self.api_endpoint} if self.api_endpoint else None
+        if self.discovery_doc and os.path.exists(self.discovery_doc):
+            with open(self.discovery_doc, encoding="utf-8") as f:
+                return build_from_document(f.read(), credentials=self.credentials, client_options=client_options)
+        return build("blogger", "v3", credentials=self.credentials, static_discovery=True,
+                     client_options=client_options, cache_discovery=False)
+
+    def _http(self):
+        """Authorized HTTP object for the current thread."""
+        if getattr(self._local, "http", None) is None:
+            import google_auth_httplib2
+            import httplib2
+            self._local.http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http())
+        return self._local.http
+
+    def _insert_request(self, title: str, content: str, blog_id: str, is_draft: bool = True):
         body = {
             "title": title,
             "content": content
         }
-        response = service.posts().insert(blogId=blog_id, body=body, isDraft=True).execute()
+        return self.service.posts().insert(blogId=blog_id, body=body, isDraft=is_draft)
+
+    def insert_post(self, title: str, content: str, blog_id: str, is_draft: bool = True) -> dict:
+        self._ensure_fresh_token()
+        with endpoint_slot("blogger"):
+            return self._insert_request(title, content, blog_id, is_draft).execute(http=self._http())
+
+    def find_post_by_title(self, title: str, blog_id: str, max_pages: int = 2):
+        """Looks for an existing draft or live post with exactly this title among the newest posts.
+
+        Used to recover the post id when a previous run crashed after inserting
+        but before recording the result.
+        """
+        self._ensure_fresh_token()
+        page_token = None
+        for _ in range(max_pages):
+            with endpoint_slot("blogger"):
+                response = self.service.posts().list(
+                    blogId=blog_id, status=["draft", "live", "scheduled"], fetchBodies=False,
+                    maxResults=50, pageToken=page_token,
+                ).execute(http=self._http())
+            for post in response.get("items", []):
+                if post.get("title") == title:
+                    return post
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+        return None
+
+    def _new_batch(self, callback):
+        if self.api_endpoint:
+            # The discovery document's batch URI ignores api_endpoint, so build it ourselves
+            from googleapiclient.http import BatchHttpRequest
+            return BatchHttpRequest(callback=callback, batch_uri=self.api_endpoint.rstrip("/") + "/batch")
+        return self.service.new_batch_http_request(callback=callback)
+
+    def insert_posts(self, posts, blog_id: str, is_draft: bool = True, callback=None) -> list[dict]:
+        """Inserts many posts through the batch endpoint, batch_size posts per HTTP round trip.
+
+        posts is an iterable of {"title", "content"} dicts. Returns one
+        {"title", "response", "error"} dict per post, in input order.
+        callback(index, response, exception) is also called as each result arrives.
+        """
+        posts = list(posts)
+        results = [None] * len(posts)
+
+        def on_result(request_id, response, exception):
+            index = int(request_id)
+            results[index] = {"title": posts[index]["title"], "response": response, "error": exception}
+            if exception is not None:
+                logging.error(f"Error posting blog '{posts[index]['title']}' to Blogger: {exception}")
+            else:
+                logging.info(f"Successfully posted blog: {posts[index]['title']}")
+            if callback:
+                callback(index, response, exception)
+
+        self._ensure_fresh_token()
+        for start in range(0, len(posts), self.batch_size):
+            batch = self._new_batch(on_result)
+            end = min(start + self.batch_size, len(posts))
+            for index in range(start, end):
+                post = posts[index]
+                batch.add(self._insert_request(post["title"], post["content"], blog_id, is_draft), request_id=str(index))
+            # Each call inside a batch counts against the Blogger quota
+            with endpoint_slot("blogger", requests=end - start):
+                batch.execute(http=self._http())
+        return results
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_blogger_client(token_env: str = DEFAULT_TOKEN_ENV) -> BloggerClient:
+    """Process-wide client per credentials variable, so blogs sharing credentials share a client."""
+    client = _clients.get(token_env)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(token_env)
+            if client is None:
+                client = _clients[token_env] = BloggerClient(token_env=token_env)
+    return client
+
+@traced("blogger.post")
+@adaptive_retry()
+def post_to_blogger(title, content, blog_id, token_env=DEFAULT_TOKEN_ENV):
+    try:
+        response = get_blogger_client(token_env).insert_post(title, content, blog_id)
         logging.info(f"Successfully posted blog: {title}")
         return response
     except Exception as e:
         logging.error(f"Error posting blog '{title}' to Blogger: {e}")
         raise
 
+@traced("blogger.find")
+def find_blogger_post(title, blog_id, token_env=DEFAULT_TOKEN_ENV):
+    return get_blogger_client(token_env).find_post_by_title(title, blog_id)
 
+@traced("blogger.post_many")
+def post_many_to_blogger(posts, blog_id, callback=None, token_env=DEFAULT_TOKEN_ENV) -> list[dict]:
+    """Posts several drafts in as few HTTP round trips as possible. See BloggerClient.insert_posts."""
+    return get_blogger_client(token_env).insert_posts(posts, blog_id, callback=callback)
@@ -2,3 +2,114 @@ import os
 
 BLOGGER_BLOG_ID = os.environ.get("BLOGGER_BLOG_ID")
 DATABASE_NAME = os.path.join("data", "blogs.db")
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8")) # Pooled SQLite connections (src/blog_db.py)
+
+MAX_TITLE_RETRIES = 5 # Max attempts to generate a unique title
+TITLE_SIMILARITY_THRESHOLD = float(os.environ.get("TITLE_SIMILARITY_THRESHOLD", "0.6")) # Character-trigram Jaccard above which titles count as duplicates
+TITLE_COMPLETIONS = int(os.environ.get("TITLE_COMPLETIONS", "1")) # Completions (n) per title request, five titles each; all are ranked locally (src/title_selector.py)
+TITLE_RANK_WEIGHTS = {"length": 0.25, "keywords": 0.35, "novelty": 0.4} # How candidate titles are scored against each other
+TITLES_TO_AVOID_LIMIT = int(os.environ.get("TITLES_TO_AVOID_LIMIT", "1000")) # Latest titles considered; the most similar ones that fit TITLE_AVOID_MAX_TOKENS go in the prompt
+
+# Google Trends collection (src/trend_scraper.py)
+TRENDS_SEEDS = [seed.strip() for seed in os.environ.get("TRENDS_SEEDS", "AI tools,tech,earn money online").split(",") if seed.strip()]
+TRENDS_GEOS = [geo.strip() for geo in os.environ.get("TRENDS_GEOS", "").split(",")] # "" is worldwide, e.g. "IN,US"
+TRENDS_HL = os.environ.get("TRENDS_HL", "en-IN")
+TRENDS_TZ = int(os.environ.get("TRENDS_TZ", "330"))
+TRENDS_REQUESTS_PER_MINUTE = float(os.environ.get("TRENDS_REQUESTS_PER_MINUTE", "10"))
+TRENDS_WORKERS = int(os.environ.get("TRENDS_WORKERS", "3"))
+TRENDS_SNAPSHOT_PATH = os.path.join("data", "trends_snapshot.json")
+TRENDS_SNAPSHOT_TTL = float(os.environ.get("TRENDS_SNAPSHOT_TTL", str(60 * 60)))
+
+# Topic novelty ranking (src/topic_ranker.py)
+TOPIC_HASH_FEATURES = 1 << 18
+TOPIC_MAX_DOC_FREQ = float(os.environ.get("TOPIC_MAX_DOC_FREQ", "0.2")) # Ignore terms found in more than this share of topics
+TOPIC_MIN_NOVELTY = float(os.environ.get("TOPIC_MIN_NOVELTY", "0.5")) # Below this every candidate counts as a repeat
+
+# Per-stage worker limits for the batch pipeline (src/pipeline.py)
+PIPELINE_TITLE_WORKERS = int(os.environ.get("PIPELINE_TITLE_WORKERS", "4"))
+PIPELINE_BODY_WORKERS = int(os.environ.get("PIPELINE_BODY_WORKERS", "4"))
+PIPELINE_IMAGE_WORKERS = int(os.environ.get("PIPELINE_IMAGE_WORKERS", "2"))
+PIPELINE_POST_WORKERS = int(os.environ.get("PIPELINE_POST_WORKERS", "2"))
+
+# Blogger client settings (src/blogger_api.py)
+BLOGGER_API_ENDPOINT = os.environ.get("BLOGGER_API_ENDPOINT") # Override to test against a local HTTP stub
+BLOGGER_DISCOVERY_DOC = os.environ.get("BLOGGER_DISCOVERY_DOC", os.path.join("data", "blogger_v3_discovery.json")) # Used if present, else the bundled document
+BLOGGER_BATCH_SIZE = int(os.environ.get("BLOGGER_BATCH_SIZE", "50")) # Google batch requests accept at most 50 calls
+
+# OpenAI client settings (src/openai_client.py)
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL") # Override to benchmark against a local mock server
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", "120"))
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "0")) # Retries go through src/rate_limit.py so throttling is seen there
+
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "4")) # Background DALL-E calls running alongside text generation
+
+# Response cache for OpenAI calls (src/llm_cache.py)
+LLM_CACHE_PATH = os.path.join("data", "llm_cache.db")
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") != "0"
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "10000"))
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+IMAGE_URL_TTL = 50 * 60 # DALL-E URLs expire after about an hour
+
+# Durable job queue (src/job_queue.py)
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "600")) # A job whose worker stops renewing is retaken after this
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "5"))
+
+# Adaptive rate control for external APIs (src/rate_limit.py), per process
+CHAT_REQUESTS_PER_MINUTE = float(os.environ.get("CHAT_REQUESTS_PER_MINUTE", "500"))
+CHAT_TOKENS_PER_MINUTE = float(os.environ.get("CHAT_TOKENS_PER_MINUTE", "200000"))
+CHAT_MAX_CONCURRENCY = int(os.environ.get("CHAT_MAX_CONCURRENCY", "16"))
+IMAGE_REQUESTS_PER_MINUTE = float(os.environ.get("IMAGE_REQUESTS_PER_MINUTE", "50"))
+IMAGE_MAX_CONCURRENCY = int(os.environ.get("IMAGE_MAX_CONCURRENCY", "4"))
+BLOGGER_REQUESTS_PER_MINUTE = float(os.environ.get("BLOGGER_REQUESTS_PER_MINUTE", "60"))
+BLOGGER_MAX_CONCURRENCY = int(os.environ.get("BLOGGER_MAX_CONCURRENCY", "4"))
+RETRY_ATTEMPTS = int(os.environ.get("RETRY_ATTEMPTS", "5"))
+RETRY_BACKOFF_BASE = float(os.environ.get("RETRY_BACKOFF_BASE", "1")) # Seconds; doubles every attempt, with jitter
+RETRY_BACKOFF_MAX = float(os.environ.get("RETRY_BACKOFF_MAX", "60"))
+
+# Streaming generation checks (src/content_validator.py)
+STREAM_MAX_CHARS = int(os.environ.get("STREAM_MAX_CHARS", "20000")) # A 1000-word HTML post is ~8k characters
+STREAM_HEADING_DEADLINE = int(os.environ.get("STREAM_HEADING_DEADLINE", "3000")) # Abort if no <h2>/<h3> by then
+
+# Bulk content ingestion (src/ingest.py)
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "4"))
+INGEST_MAX_SOURCE_TOKENS = int(os.environ.get("INGEST_MAX_SOURCE_TOKENS", "3000")) # Source text beyond this is trimmed (or split with --max-chunks)
+FETCH_TIMEOUT = float(os.environ.get("FETCH_TIMEOUT", "20"))
+
+# Per-call prompt budgets in tokens (src/prompt_budget.py). Install tiktoken for exact counts.
+TITLE_AVOID_MAX_TOKENS = int(os.environ.get("TITLE_AVOID_MAX_TOKENS", "300")) # Past titles listed in the title prompt
+TITLE_TOPIC_MAX_TOKENS = int(os.environ.get("TITLE_TOPIC_MAX_TOKENS", "500")) # Topic or source text the title is based on
+BLOG_SOURCE_MAX_TOKENS = int(os.environ.get("BLOG_SOURCE_MAX_TOKENS", "3000")) # Source content inlined in the rewrite prompt
+
+# Logging, metrics and tracing (src/metrics.py)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+METRICS_SINK = os.environ.get("METRICS_SINK", "sqlite") # sqlite, jsonl or none
+METRICS_PATH = os.environ.get("METRICS_PATH", os.path.join("data", "metrics.db" if METRICS_SINK != "jsonl" else "spans.jsonl"))
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0")) # Set to serve Prometheus metrics on http://127.0.0.1:<port>/metrics
+# USD per 1k tokens (input/output) or per image; update when OpenAI pricing changes
+MODEL_PRICES = {
+    "gpt-3.5-turbo": {"input": 0.0005, "output": 0.0015},
+    "dall-e-3": {"image": 0.04}, # 1024x1024, standard quality
+}
+
+# Image pipeline (src/image_store.py)
+IMAGE_CACHE_DIR = os.environ.get("IMAGE_CACHE_DIR", os.path.join("data", "images")) # Originals and the prompt index
+IMAGE_SIZES = [int(size) for size in os.environ.get("IMAGE_SIZES", "320,640,1024").split(",") if size.strip()] # Widths for srcset
+IMAGE_FORMATS = [fmt.strip() for fmt in os.environ.get("IMAGE_FORMATS", "webp,jpeg").split(",") if fmt.strip()]
+IMAGE_WEBP_QUALITY = int(os.environ.get("IMAGE_WEBP_QUALITY", "80"))
+IMAGE_JPEG_QUALITY = int(os.environ.get("IMAGE_JPEG_QUALITY", "82"))
+IMAGE_MAX_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", str(20 * 1024 * 1024))) # Refuse larger downloads
+IMAGE_REUSE_THRESHOLD = float(os.environ.get("IMAGE_REUSE_THRESHOLD", "0.9")) # Prompt similarity to reuse a stored image; above 1 disables reuse
+IMAGE_BACKEND = os.environ.get("IMAGE_BACKEND", "local") # "local", or "package.module:Class" for a custom ImageBackend
+IMAGE_PUBLIC_DIR = os.environ.get("IMAGE_PUBLIC_DIR", os.path.join("data", "images", "public")) # Where the local backend writes variants
+IMAGE_PUBLIC_BASE_URL = os.environ.get("IMAGE_PUBLIC_BASE_URL", "") # URL IMAGE_PUBLIC_DIR is served from
+# Off (posts embed the DALL-E URL, as before) when set to 0, or when the local backend has no public URL to serve files from
+IMAGE_PIPELINE_ENABLED = os.environ.get("IMAGE_PIPELINE_ENABLED", "1") != "0" and (IMAGE_BACKEND != "local" or bool(IMAGE_PUBLIC_BASE_URL))
+
+# Multi-blog fan-out (src/multi_blog.py); each blog in BLOGS_CONFIG can override the per-blog defaults
+BLOGS_CONFIG = os.environ.get("BLOGS_CONFIG", os.path.join("data", "blogs.json")) # Blog registry; without it BLOGGER_BLOG_ID is the only blog
+BLOG_MAX_CONCURRENCY = int(os.environ.get("BLOG_MAX_CONCURRENCY", "2")) # Posts in flight per blog
+BLOG_DAILY_QUOTA = int(os.environ.get("BLOG_DAILY_QUOTA", "0")) # Posts per blog per UTC day; 0 is unlimited
+BLOG_POSTS_PER_RUN = int(os.environ.get("BLOG_POSTS_PER_RUN", "1"))
+FANOUT_WORKERS = int(os.environ.get("FANOUT_WORKERS", "4")) # Blogs processed side by side
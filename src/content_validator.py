@@ -0,0 +1,79 @@
+import re
+from .config import STREAM_MAX_CHARS, STREAM_HEADING_DEADLINE
+
+# The blog prompts forbid personal information; these catch the obvious leaks
+_CANT = r"(?:can(?:no|['’])t|am unable to|won['’]t)"
+FORBIDDEN_PATTERNS = {
+    "email address": re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"),
+    # Only digits written like a phone number (+country code, (area code), 555-123-4567) or introduced as one;
+    # bare digit runs are as likely to be counts, ISBNs or timestamps
+    "phone number": re.compile(
+        r"(?<![\w+])\+\d{1,3}[\s.-]?\(?\d{2,4}\)?[\s.-]?\d{3}[\s.-]?\d{3,4}(?!\d)"
+        r"|(?<!\w)\(\d{3}\)\s?\d{3}[\s.-]\d{4}(?!\d)"
+        r"|(?<![\w.-])\d{3}([.-])\d{3}\1\d{4}(?![\d.-]\d)"
+        r"|\b(?:call|phone|tel|mobile|whatsapp|fax)\b\W{0,3}(?:(?:us|me|at|on)\s+){0,2}\d[\d\s.-]{8,}\d",
+        re.IGNORECASE,
+    ),
+    # Refusal wording only, so first-person prose like "I can't help but wonder" is fine
+    "model refusal": re.compile(
+        r"as an ai (?:language )?model"
+        rf"|i {_CANT} (?:help|assist)(?: you)? with (?:that|this|your) request"
+        rf"|i {_CANT} (?:fulfill|comply with) (?:that|this|your) request",
+        re.IGNORECASE,
+    ),
+}
+HEADING_PATTERN = re.compile(r"<h[23][\s>]", re.IGNORECASE)
+SCAN_OVERLAP = 64 # Re-scan this much old text so matches split across chunks are still found
+
+class GenerationAborted(Exception):
+    """A streamed generation was stopped early because the output failed validation."""
+
+    def __init__(self, reason: str, partial_text: str = ""):
+        super().__init__(reason)
+        self.reason = reason
+        self.partial_text = partial_text
+
+class BlogStreamValidator:
+    """Checks a blog post while it streams in, so a bad generation can be cut off early.
+
+    feed() is called with each new chunk and only scans the new text (plus a
+    small overlap), so validation stays cheap for long posts. It raises
+    GenerationAborted on forbidden content, on runaway length, or when no
+    <h2>/<h3> heading has appeared after heading_deadline characters.
+    """
+
+    def __init__(self, max_chars: int = STREAM_MAX_CHARS, heading_deadline: int = STREAM_HEADING_DEADLINE,
+                 forbidden_patterns: dict = None):
+        self.max_chars = max_chars
+        self.heading_deadline = heading_deadline
+        self.forbidden_patterns = FORBIDDEN_PATTERNS if forbidden_patterns is None else forbidden_patterns
+        self._parts = []
+        self._length = 0
+        self._scanned = 0
+        self._tail = ""
+        self._has_heading = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def feed(self, chunk: str):
+        self._parts.append(chunk)
+        self._length += len(chunk)
+        window = self._tail + chunk
+        self._tail = window[-SCAN_OVERLAP:]
+
+        for name, pattern in self.forbidden_patterns.items():
+            if pattern.search(window):
+                raise GenerationAborted(f"forbidden content ({name})", self.text)
+        if not self._has_heading:
+            self._has_heading = HEADING_PATTERN.search(window) is not None
+            if not self._has_heading and self.heading_deadline and self._length > self.heading_deadline:
+                raise GenerationAborted(f"no <h2>/<h3> heading in the first {self.heading_deadline} characters", self.text)
+        if self.max_chars and self._length > self.max_chars:
+            raise GenerationAborted(f"output longer than {self.max_chars} characters", self.text)
+
+    def finish(self):
+        """Final checks once the stream has ended."""
+        if not self._has_heading:
+            raise GenerationAborted("no <h2>/<h3> headings in the post", self.text)
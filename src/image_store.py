@@ -0,0 +1,354 @@
+import abc
+import asyncio
+import hashlib
+import html
+import importlib
+import io
+import json
+import logging
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from .config import (
+    IMAGE_CACHE_DIR,
+    IMAGE_SIZES,
+    IMAGE_FORMATS,
+    IMAGE_WEBP_QUALITY,
+    IMAGE_JPEG_QUALITY,
+    IMAGE_MAX_BYTES,
+    IMAGE_REUSE_THRESHOLD,
+    IMAGE_BACKEND,
+    IMAGE_PUBLIC_DIR,
+    IMAGE_PUBLIC_BASE_URL,
+    FETCH_TIMEOUT,
+)
+from .metrics import registry, span
+
+CONTENT_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+EXTENSIONS = {"webp": "webp", "jpeg": "jpg", "png": "png"}
+DISPLAY_SIZES = "(max-width: 600px) 100vw, 600px" # The post shows images at most 600px wide
+IMAGE_STYLE = "width:100%; max-width:600px; height:auto;"
+
+# Upload backends. A backend receives each finished file once and returns the URL posts should use.
+
+class ImageBackend(abc.ABC):
+    """Publishes image files and returns their public URL. Subclass to upload elsewhere (S3, a CDN, ...)."""
+
+    @abc.abstractmethod
+    def publish(self, key: str, data: bytes, content_type: str) -> str:
+        """Uploads data under key (a content-hashed path) and returns the URL posts should use."""
+
+class LocalImageBackend(ImageBackend):
+    """Writes files under root, to be served at base_url (or synced to a CDN).
+
+    Readers can't load file:// URLs, so a base_url is required unless
+    file_urls=True, which only tests and offline benchmarks should pass.
+    """
+
+    def __init__(self, root: str = IMAGE_PUBLIC_DIR, base_url: str = IMAGE_PUBLIC_BASE_URL, file_urls: bool = False):
+        if not base_url and not file_urls:
+            raise ValueError("LocalImageBackend needs a base_url (set IMAGE_PUBLIC_BASE_URL) to publish images.")
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def publish(self, key: str, data: bytes, content_type: str) -> str:
+        path = os.path.join(self.root, *key.split("/"))
+        if not os.path.exists(path): # Keys are content hashes, so an existing file is the same file
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        if self.base_url:
+            return f"{self.base_url}/{key}"
+        return pathlib.Path(path).resolve().as_uri()
+
+def _load_backend(spec: str) -> ImageBackend:
+    if spec == "local":
+        return LocalImageBackend()
+    module_name, _, class_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+# Transcoding
+
+def transcode(data: bytes, sizes=IMAGE_SIZES, formats=IMAGE_FORMATS, webp_quality: int = IMAGE_WEBP_QUALITY,
+              jpeg_quality: int = IMAGE_JPEG_QUALITY) -> list[tuple[str, int, int, bytes]]:
+    """Resizes and re-encodes an image. Returns (format, width, height, bytes) per size and format.
+
+    Images are never upscaled: sizes wider than the original collapse into
+    one variant at the original width. Needs Pillow; without it the original
+    is returned unchanged.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        logging.warning("Pillow is not installed; storing images without resizing (pip install Pillow).")
+        return [("png", 0, 0, data)]
+    with Image.open(io.BytesIO(data)) as original:
+        original.load()
+        image = original.convert("RGBA" if original.mode in ("RGBA", "LA", "P") else "RGB")
+    widths = sorted({min(size, image.width) for size in sizes} or {image.width})
+    variants = []
+    for width in widths:
+        height = round(image.height * width / image.width)
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for fmt in formats:
+            buffer = io.BytesIO()
+            if fmt == "webp":
+                resized.save(buffer, "WEBP", quality=webp_quality, method=4)
+            elif fmt == "jpeg":
+                resized.convert("RGB").save(buffer, "JPEG", quality=jpeg_quality, optimize=True, progressive=True)
+            else:
+                raise ValueError(f"Unsupported image format '{fmt}'")
+            variants.append((fmt, width, height, buffer.getvalue()))
+    return variants
+
+def download_image(url: str, timeout: float = FETCH_TIMEOUT, max_bytes: int = IMAGE_MAX_BYTES) -> bytes:
+    from .rate_limit import endpoint_slot
+    with endpoint_slot("fetch"):
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            data = response.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ValueError(f"Image at {url} is larger than {max_bytes} bytes")
+    return data
+
+@dataclass
+class StoredImage:
+    digest: str
+    url: str # Fallback <img src>: the largest JPEG (or largest variant)
+    width: int = 0
+    height: int = 0
+    variants: list = field(default_factory=list) # [{"format", "width", "url"}]
+
+    def srcset(self, fmt: str) -> str:
+        return ", ".join(f"{v['url']} {v['width']}w" for v in self.variants if v["format"] == fmt and v["width"])
+
+    def to_html(self, alt: str) -> str:
+        """A <picture> with WebP and JPEG srcsets, so browsers download the smallest file that fits."""
+        alt = html.escape(alt, quote=True)
+        size_attrs = f' width="{self.width}" height="{self.height}"' if self.width else ""
+        fallback_format = "jpeg" if any(v["format"] == "jpeg" for v in self.variants) else None
+        img_srcset = f' srcset="{self.srcset(fallback_format)}" sizes="{DISPLAY_SIZES}"' if fallback_format and self.srcset(fallback_format) else ""
+        img = f'<img src="{self.url}"{img_srcset} alt="{alt}"{size_attrs} style="{IMAGE_STYLE}">'
+        webp_srcset = self.srcset("webp")
+        if not webp_srcset:
+            return img
+        return f'<picture><source type="image/webp" srcset="{webp_srcset}" sizes="{DISPLAY_SIZES}">{img}</picture>'
+
+class ImageStore:
+    """Content-addressed cache of generated images.
+
+    Each generated image is downloaded once, stored under its SHA-256, resized
+    into responsive WebP/JPEG variants and published through the backend. A
+    prompt index (normalized text plus MinHash/LSH buckets) lets repeated or
+    near-identical prompts reuse a stored image instead of paying for a new one.
+    """
+
+    def __init__(self, cache_dir: str = IMAGE_CACHE_DIR, backend: ImageBackend = None,
+                 reuse_threshold: float = IMAGE_REUSE_THRESHOLD, downloader=download_image, transcoder=transcode):
+        self.cache_dir = cache_dir
+        self._backend = backend
+        self.reuse_threshold = reuse_threshold
+        self.downloader = downloader
+        self.transcoder = transcoder
+        self._lock = threading.Lock()
+        self._conn = None
+        self._key_locks = {} # key -> [lock, holders and waiters]
+        self._key_locks_lock = threading.Lock()
+
+    @property
+    def backend(self) -> ImageBackend:
+        if self._backend is None:
+            self._backend = _load_backend(IMAGE_BACKEND)
+        return self._backend
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.cache_dir, "images.db"), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS images (
+                    digest TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    width INTEGER,
+                    height INTEGER,
+                    variants TEXT NOT NULL,
+                    source_url TEXT,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_images_url ON images(url);
+                CREATE TABLE IF NOT EXISTS image_prompts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    normalized_prompt TEXT NOT NULL UNIQUE,
+                    digest TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS image_prompt_lsh (
+                    bucket INTEGER NOT NULL,
+                    prompt_id INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_image_prompt_lsh_bucket ON image_prompt_lsh(bucket);
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _row_to_image(row) -> StoredImage:
+        digest, url, width, height, variants = row
+        return StoredImage(digest, url, width or 0, height or 0, json.loads(variants))
+
+    def _get(self, conn, column: str, value: str) -> StoredImage:
+        row = conn.execute(f"SELECT digest, url, width, height, variants FROM images WHERE {column} = ?", (value,)).fetchone()
+        return self._row_to_image(row) if row else None
+
+    def find_by_url(self, url: str) -> StoredImage:
+        """The stored image published at url (its fallback src), or None for foreign URLs."""
+        with self._lock:
+            return self._get(self._connection(), "url", url)
+
+    def lookup(self, prompt: str) -> StoredImage:
+        """A stored image for this prompt or a near-identical one (shingle Jaccard >= reuse_threshold)."""
+        from .blog_db import normalize_title
+        from .title_index import lsh_buckets, shingles, jaccard
+        normalized = normalize_title(prompt)
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT digest FROM image_prompts WHERE normalized_prompt = ?", (normalized,)).fetchone()
+            if row is None and self.reuse_threshold <= 1.0:
+                buckets = lsh_buckets(normalized)
+                if buckets:
+                    candidates = conn.execute(
+                        f"SELECT DISTINCT p.normalized_prompt, p.digest FROM image_prompt_lsh l JOIN image_prompts p ON p.id = l.prompt_id "
+                        f"WHERE l.bucket IN ({','.join('?' * len(buckets))})",
+                        buckets,
+                    ).fetchall()
+                    query = shingles(normalized)
+                    scored = [(jaccard(query, shingles(text)), digest) for text, digest in candidates]
+                    best = max(scored, default=(0.0, None))
+                    if best[0] >= self.reuse_threshold:
+                        row = (best[1],)
+            return self._get(conn, "digest", row[0]) if row else None
+
+    def _remember_prompt(self, conn, prompt: str, digest: str):
+        from .blog_db import normalize_title
+        from .title_index import lsh_buckets
+        normalized = normalize_title(prompt)
+        cursor = conn.execute("INSERT OR IGNORE INTO image_prompts (normalized_prompt, digest, created_at) VALUES (?, ?, ?)",
+                              (normalized, digest, time.time()))
+        if cursor.rowcount:
+            conn.executemany("INSERT INTO image_prompt_lsh (bucket, prompt_id) VALUES (?, ?)",
+                             ((bucket, cursor.lastrowid) for bucket in lsh_buckets(normalized)))
+
+    def store(self, data: bytes, prompt: str = None, source_url: str = None) -> StoredImage:
+        """Stores downloaded image bytes (once per content hash) and publishes its variants."""
+        digest = hashlib.sha256(data).hexdigest()
+        with self._key_lock("digest:" + digest):
+            return self._store(digest, data, prompt, source_url)
+
+    def _store(self, digest: str, data: bytes, prompt: str, source_url: str) -> StoredImage:
+        with self._lock:
+            existing = self._get(self._connection(), "digest", digest)
+        if existing is None:
+            with span("image.store", bytes=len(data)):
+                original_path = os.path.join(self.cache_dir, "originals", digest[:2], digest)
+                if not os.path.exists(original_path):
+                    os.makedirs(os.path.dirname(original_path), exist_ok=True)
+                    with open(original_path, "wb") as f:
+                        f.write(data)
+                variants = []
+                for fmt, width, height, encoded in self.transcoder(data):
+                    key = f"{digest[:2]}/{digest[:24]}-{width or 'orig'}.{EXTENSIONS[fmt]}"
+                    url = self.backend.publish(key, encoded, CONTENT_TYPES[fmt])
+                    variants.append({"format": fmt, "width": width, "height": height, "url": url, "bytes": len(encoded)})
+                    registry.counter("image_bytes_total", "Bytes of published image variants.").inc(len(encoded), format=fmt)
+            largest = max(variants, key=lambda v: (v["format"] == "jpeg", v["width"]))
+            existing = StoredImage(digest, largest["url"], largest["width"], largest["height"], variants)
+            sizes = ", ".join(f"{v['format']} {v['width']}w {v['bytes']}B" for v in variants)
+            logging.info(f"Stored image {digest[:12]}: {len(data)} bytes -> {sizes}")
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR IGNORE INTO images (digest, url, width, height, variants, source_url, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (digest, existing.url, existing.width, existing.height, json.dumps(existing.variants), source_url, time.time()),
+            )
+            if prompt:
+                self._remember_prompt(conn, prompt, digest)
+            conn.commit()
+        return existing
+
+    @contextmanager
+    def _key_lock(self, key: str):
+        """Holds one lock per prompt or content hash, so concurrent requests for the same image do the work once.
+
+        Entries are reference-counted and dropped when the last user leaves, so
+        the table only ever holds keys that are in use.
+        """
+        with self._key_locks_lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._key_locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    def get_or_create(self, prompt: str, generate_fn, reuse: bool = True) -> StoredImage:
+        """Returns a stored image for prompt, calling generate_fn(prompt) -> URL only if none can be reused.
+
+        Concurrent calls for the same prompt wait for the first one instead of
+        paying for the same image twice.
+        """
+        with self._key_lock("prompt:" + " ".join(prompt.lower().split())):
+            stored = self.lookup(prompt) if reuse else None
+            if stored is not None:
+                registry.counter("images_stored_total", "Image requests by outcome.").inc(result="reused")
+                logging.info(f"Reusing stored image {stored.digest[:12]} for prompt: {prompt}")
+                return stored
+            source_url = generate_fn(prompt)
+            stored = self.store(self.downloader(source_url), prompt, source_url)
+            registry.counter("images_stored_total", "Image requests by outcome.").inc(result="generated")
+            return stored
+
+    async def get_or_create_async(self, prompt: str, generate_fn, reuse: bool = True) -> StoredImage:
+        """get_or_create for a coroutine generate_fn; the blocking steps run in worker threads."""
+        stored = await asyncio.to_thread(self.lookup, prompt) if reuse else None
+        if stored is not None:
+            registry.counter("images_stored_total", "Image requests by outcome.").inc(result="reused")
+            return stored
+        source_url = await generate_fn(prompt)
+        data = await asyncio.to_thread(self.downloader, source_url)
+        stored = await asyncio.to_thread(self.store, data, prompt, source_url)
+        registry.counter("images_stored_total", "Image requests by outcome.").inc(result="generated")
+        return stored
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+def get_image_store() -> ImageStore:
+    global _default_store
+    if _default_store is None:
+        with _default_store_lock:
+            if _default_store is None:
+                _default_store = ImageStore()
+    return _default_store
+
+def set_image_store(store: ImageStore):
+    global _default_store
+    _default_store = store
@@ -0,0 +1,384 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from html.parser import HTMLParser
+
+from .config import INGEST_WORKERS, INGEST_MAX_SOURCE_TOKENS, FETCH_TIMEOUT, MAX_TITLE_RETRIES
+from .metrics import configure_logging, span, current_cost
+from .prompt_budget import count_tokens, trim_to_tokens
+
+HTML_EXTENSIONS = (".html", ".htm")
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+TEXT_EXTENSIONS = (".txt",)
+USER_AGENT = "Mozilla/5.0 (compatible; auto-blogger)"
+
+class _TextExtractor(HTMLParser):
+    """Single-pass HTML to text: drops scripts, navigation and boilerplate, keeps paragraph breaks."""
+
+    SKIP_TAGS = {"script", "style", "noscript", "nav", "header", "footer", "aside", "form", "svg", "iframe", "button"}
+    BLOCK_TAGS = {"p", "div", "section", "article", "main", "br", "li", "ul", "ol", "h1", "h2", "h3", "h4", "h5", "h6",
+                  "blockquote", "pre", "tr", "table"}
+    MAIN_TAGS = {"article", "main"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.main_parts = []
+        self.title = ""
+        self._skip_depth = 0
+        self._main_depth = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in self.MAIN_TAGS:
+            self._main_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        if tag in self.BLOCK_TAGS:
+            self._append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self.MAIN_TAGS:
+            self._main_depth = max(0, self._main_depth - 1)
+        elif tag == "title":
+            self._in_title = False
+        if tag in self.BLOCK_TAGS:
+            self._append("\n")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skip_depth:
+            self._append(data)
+
+    def _append(self, text):
+        self.parts.append(text)
+        if self._main_depth:
+            self.main_parts.append(text)
+
+def _clean_whitespace(text: str) -> str:
+    lines = (re.sub(r"[ \t\r\f\v]+", " ", line).strip() for line in text.split("\n"))
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+def html_to_text(html: str) -> tuple[str, str]:
+    """Returns (title, main text). Text inside <article>/<main> wins when the page has it."""
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    main_text = _clean_whitespace("".join(extractor.main_parts))
+    text = main_text if len(main_text) >= 200 else _clean_whitespace("".join(extractor.parts))
+    return _clean_whitespace(extractor.title), text
+
+def markdown_to_text(markdown: str) -> tuple[str, str]:
+    """Returns (title, text): strips YAML front matter and takes the first '# ' heading as the title."""
+    if markdown.startswith("---"):
+        end = markdown.find("\n---", 3)
+        if end != -1:
+            markdown = markdown[end + 4:]
+    match = re.search(r"^#\s+(.+)$", markdown, re.MULTILINE)
+    return (match.group(1).strip() if match else ""), _clean_whitespace(markdown)
+
+def split_to_budget(text: str, max_tokens: int = INGEST_MAX_SOURCE_TOKENS, max_chunks: int = 1) -> list[str]:
+    """Packs paragraphs into chunks of at most max_tokens, keeping at most max_chunks.
+
+    max_chunks=1 truncates the source to the budget at a paragraph boundary.
+    A single paragraph longer than the budget is cut with trim_to_tokens.
+    """
+    chunks, current, current_tokens = [], [], 0
+    for paragraph in text.split("\n\n"):
+        tokens = count_tokens(paragraph)
+        while tokens > max_tokens:
+            paragraph_head = trim_to_tokens(paragraph, max_tokens) or paragraph[:1]
+            paragraph = paragraph[len(paragraph_head):].lstrip()
+            tokens = count_tokens(paragraph)
+            if current:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            chunks.append(paragraph_head)
+            if len(chunks) >= max_chunks:
+                return chunks[:max_chunks]
+        if current_tokens + tokens + 1 > max_tokens and current:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+            if len(chunks) >= max_chunks:
+                return chunks
+        if paragraph:
+            current.append(paragraph)
+            current_tokens += tokens + 1 # Plus the paragraph break
+    if current and len(chunks) < max_chunks:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+def fetch_url(url: str, timeout: float = FETCH_TIMEOUT) -> str:
+    """Default URL fetcher (stdlib only). Any callable url -> HTML string can replace it."""
+    from .rate_limit import endpoint_slot
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    with endpoint_slot("fetch"):
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            charset = response.headers.get_content_charset() or "utf-8"
+            return response.read().decode(charset, errors="replace")
+
+def fetch_article(url: str, fetcher=fetch_url) -> tuple[str, str]:
+    """Fetches a page and returns (title, main text)."""
+    return html_to_text(fetcher(url))
+
+# Source readers. Each yields {"id", "source", "title", "content", "url", "format"}
+# dicts one at a time, so memory stays flat however large the corpus is.
+
+def iter_jsonl(path: str):
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if line:
+                yield _raw_item(json.loads(line), f"{path}:{line_number}")
+
+def iter_csv(path: str):
+    csv.field_size_limit(2 ** 31 - 1) # Articles can exceed the 128 KB default
+    with open(path, encoding="utf-8", newline="") as f:
+        for row_number, row in enumerate(csv.DictReader(f), start=2):
+            yield _raw_item(row, f"{path}:{row_number}")
+
+def iter_directory(path: str):
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            extension = os.path.splitext(name)[1].lower()
+            if extension in HTML_EXTENSIONS:
+                kind = "html"
+            elif extension in MARKDOWN_EXTENSIONS:
+                kind = "markdown"
+            elif extension in TEXT_EXTENSIONS:
+                kind = "text"
+            else:
+                continue
+            with open(file_path, encoding="utf-8", errors="replace") as f:
+                content = f.read()
+            yield {"id": os.path.relpath(file_path, path), "source": file_path, "title": "", "content": content,
+                   "url": "", "format": kind}
+
+def _raw_item(record: dict, source: str) -> dict:
+    content = record.get("content") or record.get("text") or record.get("html") or ""
+    kind = record.get("format") or ("html" if record.get("html") or content.lstrip().startswith("<") else "text")
+    return {"id": str(record.get("id") or source), "source": source, "title": record.get("title") or "",
+            "content": content, "url": record.get("url") or "", "format": kind}
+
+def iter_source(path: str):
+    """Streams items from a .jsonl/.csv file or a directory of .html/.md/.txt files."""
+    if os.path.isdir(path):
+        return iter_directory(path)
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".jsonl", ".ndjson"):
+        return iter_jsonl(path)
+    if extension == ".csv":
+        return iter_csv(path)
+    raise ValueError(f"Unsupported source '{path}': expected a directory, .jsonl or .csv file.")
+
+def read_finished(path: str) -> dict:
+    """{(id, chunk): title} for the generated or skipped results already in a results JSONL.
+
+    Failed results are left out so a resumed run retries them.
+    """
+    finished = {}
+    if not os.path.exists(path):
+        return finished
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue # A line cut short when the previous run was killed
+            if result.get("status") in ("generated", "skipped"):
+                finished[(str(result["id"]), result.get("chunk", 0))] = result.get("title", "")
+    return finished
+
+def open_results(path: str):
+    """Opens a results JSONL for appending, ending a line cut short by a killed run first."""
+    out = open(path, "a", encoding="utf-8")
+    if out.tell():
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                out.write("\n")
+    return out
+
+class _SkipWork(Exception):
+    """The item was handled without generating a post (e.g. its title is taken)."""
+
+class BulkIngestor:
+    """Turns a stream of source articles into blog posts on a worker pool.
+
+    Each item is fetched (if it only has a URL), reduced to its main text,
+    trimmed to max_source_tokens, titled with title_selector.choose_title
+    (unless it has a title of its own) and expanded with
+    generate_blog_from_content. At most workers * 2 items are in memory at a
+    time, and every result is appended to the output JSONL as soon as it is
+    done, so a long run can be followed from the file, and resumed by passing
+    read_finished(path) to run so finished items are not generated again.
+    """
+
+    def __init__(self, workers: int = INGEST_WORKERS, max_source_tokens: int = INGEST_MAX_SOURCE_TOKENS,
+                 max_chunks: int = 1, fetcher=fetch_url, generate_fn=None, title_fn=None, exists_fn=None,
+                 bulk_exists_fn=None, near_duplicates_fn=None, max_title_retries: int = MAX_TITLE_RETRIES):
+        from .blog_writer import generate_blog_from_content, generate_title_candidates
+        from .blog_db import blog_exists, bulk_blog_exists, bulk_find_near_duplicates
+        self.workers = max(1, workers)
+        self.max_source_tokens = max_source_tokens
+        self.max_chunks = max(1, max_chunks)
+        self.fetcher = fetcher
+        self.generate_fn = generate_fn or generate_blog_from_content
+        self.title_fn = title_fn or generate_title_candidates # (text, titles_to_avoid) -> candidate titles
+        self.exists_fn = exists_fn or blog_exists # Only for titles given with the source
+        self.bulk_exists_fn = bulk_exists_fn or bulk_blog_exists
+        self.near_duplicates_fn = near_duplicates_fn or bulk_find_near_duplicates
+        self.max_title_retries = max_title_retries
+        self._claimed_titles = set()
+        self._claim_lock = threading.Lock()
+
+    def prepare(self, item: dict) -> list[dict]:
+        """Extracts and budgets one source item. Long sources give up to max_chunks work items."""
+        title = item["title"]
+        if not item["content"] and item["url"]:
+            page_title, text = fetch_article(item["url"], self.fetcher)
+        elif item["format"] == "html":
+            page_title, text = html_to_text(item["content"])
+        elif item["format"] == "markdown":
+            page_title, text = markdown_to_text(item["content"])
+        else:
+            page_title, text = "", _clean_whitespace(item["content"])
+        chunks = split_to_budget(text, self.max_source_tokens, self.max_chunks)
+        return [{**item, "title": title if len(chunks) == 1 else "", "source_title": page_title, "text": chunk,
+                 "chunk": index} for index, chunk in enumerate(chunks)]
+
+    def _claim(self, title: str) -> bool:
+        """Reserves a title for this run, so two sources can't both be posted under it."""
+        from .blog_db import normalize_title
+        normalized = normalize_title(title)
+        with self._claim_lock:
+            if normalized in self._claimed_titles:
+                return False
+            self._claimed_titles.add(normalized)
+            return True
+
+    def select_title(self, work: dict) -> str:
+        """The source's own title if it is new, else the best unique generated one. Raises _SkipWork if there is none."""
+        from .blog_db import normalize_title
+        from .title_selector import choose_title
+        if work["title"]:
+            if self.exists_fn(normalize_title(work["title"])) or not self._claim(work["title"]):
+                raise _SkipWork("title already exists")
+            return work["title"]
+        with self._claim_lock:
+            titles_to_avoid = list(self._claimed_titles)
+        selection = choose_title(work["text"], titles_to_avoid, generate_fn=self.title_fn, claim_fn=self._claim,
+                                 max_attempts=self.max_title_retries, exists_fn=self.bulk_exists_fn,
+                                 near_duplicates_fn=self.near_duplicates_fn)
+        if not selection.title:
+            raise _SkipWork(f"no unique title after {selection.attempts} attempts")
+        return selection.title
+
+    def process(self, work: dict) -> dict:
+        started = time.perf_counter()
+        result = {"id": work["id"], "source": work["source"], "chunk": work["chunk"], "source_chars": len(work["text"]),
+                  "title": "", "status": "failed", "error": "", "content": ""}
+        with span("ingest.item", source=work["source"], chunk=work["chunk"]) as item_span:
+            try:
+                if not work["text"]:
+                    raise ValueError(work.get("error") or "no text could be extracted")
+                result["title"] = self.select_title(work)
+                result.update(status="generated", content=self.generate_fn(work["text"], result["title"]))
+            except _SkipWork as e:
+                result.update(status="skipped", error=str(e))
+            except Exception as e:
+                result["error"] = str(e)
+                logging.error(f"Ingestion failed for {work['source']}: {e}")
+            result["token_cost"] = current_cost()
+            item_span.set(status=result["status"])
+        result["elapsed_s"] = round(time.perf_counter() - started, 3)
+        return result
+
+    def _work_items(self, items, finished):
+        for item in items:
+            if self.max_chunks == 1 and (item["id"], 0) in finished:
+                continue # Don't fetch or parse a source that is already done
+            try:
+                yield from (work for work in self.prepare(item) if (work["id"], work["chunk"]) not in finished)
+            except Exception as e:
+                logging.error(f"Could not read {item['source']}: {e}")
+                yield {**item, "text": "", "chunk": 0, "error": str(e)}
+
+    def run(self, items, out, finished: dict = None) -> dict:
+        """Processes items (any iterable of source dicts) and writes one JSON line per result to out.
+
+        Chunks listed in finished (see read_finished) are skipped, and their
+        titles stay claimed so new posts can't reuse them.
+        """
+        finished = finished or {}
+        for title in finished.values():
+            if title:
+                self._claim(title)
+        counts = {}
+        started = time.perf_counter()
+        work_items = self._work_items(items, finished)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest") as executor:
+            pending = set()
+            for work in work_items:
+                pending.add(executor.submit(self.process, work))
+                if len(pending) >= self.workers * 2: # Bounded window: don't read ahead of the workers
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self._write(done, out, counts)
+            done, _ = wait(pending)
+            self._write(done, out, counts)
+        return {"counts": counts, "elapsed_s": round(time.perf_counter() - started, 3)}
+
+    @staticmethod
+    def _write(futures, out, counts):
+        for future in futures:
+            result = future.result()
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            out.write(json.dumps(result) + "\n")
+        out.flush()
+
+def main(argv=None):
+    from dotenv import load_dotenv
+    from .blog_db import init_db
+    from .blog_writer import generate_blog_text_from_content
+
+    parser = argparse.ArgumentParser(description="Expand a directory or JSONL/CSV file of source articles into blog posts.")
+    parser.add_argument("source", help="Directory of .html/.md/.txt files, or a .jsonl/.csv file with content/url/title fields.")
+    parser.add_argument("--out", default="-", help="Results JSONL path (default: stdout).")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--max-source-tokens", type=int, default=INGEST_MAX_SOURCE_TOKENS, help="Trim each source to this budget.")
+    parser.add_argument("--max-chunks", type=int, default=1, help="Split long sources into up to this many posts instead of truncating.")
+    parser.add_argument("--no-images", action="store_true", help="Skip DALL-E image generation.")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    load_dotenv()
+    init_db()
+    ingestor = BulkIngestor(workers=args.workers, max_source_tokens=args.max_source_tokens, max_chunks=args.max_chunks,
+                            generate_fn=generate_blog_text_from_content if args.no_images else None)
+    if args.out == "-":
+        summary = ingestor.run(iter_source(args.source), sys.stdout)
+    else:
+        finished = read_finished(args.out)
+        if finished:
+            logging.info(f"Resuming: {len(finished)} results in {args.out} are already finished.")
+        with open_results(args.out) as out:
+            summary = ingestor.run(iter_source(args.source), out, finished)
+    logging.info(f"Ingestion finished: {json.dumps(summary)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from .blog_db import get_repository, BlogRepository, normalize_title
+from .content_validator import GenerationAborted
+from .config import (
+    BLOGGER_BLOG_ID,
+    MAX_TITLE_RETRIES,
+    TITLES_TO_AVOID_LIMIT,
+    JOB_LEASE_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    JOB_POLL_INTERVAL,
+)
+from .metrics import configure_logging, start_metrics_server, span, current_cost
+
+# Each stage's output is saved before the job moves on, so a restarted job
+# continues from its `stage` column without paying for anything twice
+JOB_STAGES = ("title", "body", "image", "post", "record", "done")
+
+JOB_COLUMNS = (
+    "id", "idempotency_key", "topic", "source_content", "title", "normalized_title", "html", "image_url",
+    "blogger_post_id", "post_attempted_at", "stage", "status", "attempts", "error", "lease_owner",
+    "lease_expires", "created_at", "updated_at",
+)
+SAVABLE_COLUMNS = {"title", "normalized_title", "html", "image_url", "blogger_post_id", "post_attempted_at", "stage"}
+
+class LeaseLost(Exception):
+    """The job's lease expired and another worker has taken it over."""
+
+class _SkipJob(Exception):
+    pass
+
+def make_idempotency_key(topic: str, content: str = "", title: str = "") -> str:
+    """Same topic, source content and preset title always give the same key."""
+    payload = json.dumps([topic.strip().lower(), (content or "").strip(), normalize_title(title or "")])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _row_to_job(row) -> dict:
+    return dict(zip(JOB_COLUMNS, row)) if row else None
+
+class JobQueue:
+    """SQLite-backed queue of post jobs, stored in the blogs database.
+
+    Workers lease one job at a time. Leasing runs in a BEGIN IMMEDIATE
+    transaction, so several worker processes can share the database and
+    never take the same job. A lease lasts lease_seconds and is renewed
+    every time a stage is saved. If a worker dies, its job is taken again
+    after the lease expires and resumes from the last saved stage. Every
+    write checks lease_owner, so a worker whose lease was taken over cannot
+    overwrite the new owner's progress.
+    """
+
+    def __init__(self, repository: BlogRepository = None, lease_seconds: float = JOB_LEASE_SECONDS,
+                 max_attempts: int = JOB_MAX_ATTEMPTS, clock=time.time):
+        self.repository = repository or get_repository()
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self._clock = clock
+
+    def enqueue(self, topic: str, content: str = None, title: str = None, idempotency_key: str = None) -> tuple[int, bool]:
+        """Adds a job unless one with the same idempotency key exists. Returns (job_id, created)."""
+        key = idempotency_key or make_idempotency_key(topic, content, title)
+        stage = "body" if title else "title"
+        now = self._clock()
+        with self.repository.connection() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs (idempotency_key, topic, source_content, title, normalized_title, stage, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, 'pending', ?, ?)",
+                (key, topic, content, title, normalize_title(title) if title else None, stage, now, now),
+            )
+            conn.commit()
+            if cursor.rowcount:
+                return cursor.lastrowid, True
+            return conn.execute("SELECT id FROM jobs WHERE idempotency_key = ?", (key,)).fetchone()[0], False
+
+    def enqueue_many(self, items) -> list[tuple[int, bool]]:
+        """items are topic strings or {"topic", "content", "title", "idempotency_key"} dicts."""
+        results = []
+        for item in items:
+            if isinstance(item, str):
+                item = {"topic": item}
+            results.append(self.enqueue(item.get("topic") or item.get("title") or "", item.get("content"),
+                                        item.get("title"), item.get("idempotency_key")))
+        return results
+
+    def lease(self, worker_id: str) -> dict:
+        """Takes the oldest pending job, or one whose lease has expired. Returns None if there is none."""
+        now = self._clock()
+        with self.repository.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs that keep killing their worker stop being retried
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'lease expired too many times', lease_owner = NULL, updated_at = ? "
+                    "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                    (now, now, self.max_attempts),
+                )
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                    "ORDER BY id LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    conn.commit()
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ? "
+                    "WHERE id = ?",
+                    (worker_id, now + self.lease_seconds, now, row[0]),
+                )
+                job = _row_to_job(conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (row[0],)).fetchone())
+                conn.commit()
+                return job
+            except Exception:
+                conn.rollback()
+                raise
+
+    def save(self, job_id: int, worker_id: str, **fields):
+        """Persists stage outputs and renews the lease. Raises LeaseLost if the job is no longer ours."""
+        unknown = set(fields) - SAVABLE_COLUMNS
+        if unknown:
+            raise ValueError(f"Unknown job fields: {sorted(unknown)}")
+        now = self._clock()
+        assignments = "".join(f"{column} = ?, " for column in fields)
+        with self.repository.connection() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments}lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (*fields.values(), now + self.lease_seconds, now, job_id, worker_id),
+            )
+            conn.commit()
+        if not cursor.rowcount:
+            raise LeaseLost(f"job {job_id} is no longer leased by {worker_id}")
+
+    def claim_title(self, job_id: int, worker_id: str, title: str) -> bool:
+        """Stores the title unless another live job already holds it, so parallel workers never pick the same one."""
+        normalized = normalize_title(title)
+        now = self._clock()
+        with self.repository.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                taken = conn.execute(
+                    "SELECT 1 FROM jobs WHERE normalized_title = ? AND id != ? AND status NOT IN ('failed', 'skipped') LIMIT 1",
+                    (normalized, job_id),
+                ).fetchone()
+                if taken:
+                    conn.commit()
+                    return False
+                cursor = conn.execute(
+                    "UPDATE jobs SET title = ?, normalized_title = ?, stage = 'body', lease_expires = ?, updated_at = ? "
+                    "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                    (title, normalized, now + self.lease_seconds, now, job_id, worker_id),
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        if not cursor.rowcount:
+            raise LeaseLost(f"job {job_id} is no longer leased by {worker_id}")
+        return True
+
+    def finish(self, job_id: int, worker_id: str, status: str = "done", error: str = None):
+        """Ends the job with a final status (done, generated, skipped or failed) and releases the lease."""
+        self._release(job_id, worker_id, status, error)
+
+    def fail(self, job_id: int, worker_id: str, error: str):
+        """Puts the job back for a retry, or marks it failed once it has used max_attempts."""
+        job = self.get(job_id)
+        status = "failed" if job and job["attempts"] >= self.max_attempts else "pending"
+        self._release(job_id, worker_id, status, error)
+        return status
+
+    def _release(self, job_id: int, worker_id: str, status: str, error: str):
+        with self.repository.connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ?",
+                (status, error, self._clock(), job_id, worker_id),
+            )
+            conn.commit()
+
+    def get(self, job_id: int) -> dict:
+        with self.repository.connection() as conn:
+            return _row_to_job(conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def active_titles(self) -> list[str]:
+        """Titles held by jobs that are still queued or running."""
+        with self.repository.connection() as conn:
+            rows = conn.execute(
+                "SELECT normalized_title FROM jobs WHERE normalized_title IS NOT NULL AND status IN ('pending', 'leased')"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def counts(self) -> dict:
+        with self.repository.connection() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def requeue_failed(self) -> int:
+        """Gives failed jobs a fresh set of attempts. They resume from their saved stage."""
+        with self.repository.connection() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0, error = NULL, updated_at = ? WHERE status = 'failed'",
+                (self._clock(),),
+            )
+            conn.commit()
+            return cursor.rowcount
+
+class JobWorker:
+    """Leases jobs from a JobQueue and runs each through title -> body -> image -> post -> record.
+
+    Posting is idempotent: post_attempted_at is saved before the Blogger
+    call and the post id right after it. If a worker dies between the two,
+    the next worker looks the title up on Blogger (find_post_fn) and adopts
+    the existing post instead of inserting a second draft.
+    Stage functions default to the real OpenAI/Blogger/DB calls and can be
+    swapped for stubs.
+    """
+
+    def __init__(self, queue: JobQueue = None, blog_id=None, worker_id: str = None, with_images: bool = True,
+                 dry_run: bool = False, max_title_retries: int = MAX_TITLE_RETRIES,
+                 title_fn=None, body_fn=None, content_body_fn=None, image_fn=None, post_fn=None, find_post_fn=None,
+                 exists_fn=None, bulk_exists_fn=None, near_duplicates_fn=None, record_fn=None, existing_titles_fn=None):
+        from .blog_db import blog_exists, bulk_blog_exists, bulk_find_near_duplicates, add_blog_entry, get_recent_titles
+        from .blog_writer import generate_title_candidates, generate_blog_text, generate_blog_text_from_content, generate_blog_image
+        from .blogger_api import post_to_blogger, find_blogger_post
+
+        self.queue = queue or JobQueue()
+        self.blog_id = blog_id or BLOGGER_BLOG_ID
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.with_images = with_images
+        self.dry_run = dry_run
+        self.max_title_retries = max_title_retries
+        self.title_fn = title_fn or generate_title_candidates
+        self.body_fn = body_fn or generate_blog_text
+        self.content_body_fn = content_body_fn or generate_blog_text_from_content
+        self.image_fn = image_fn or generate_blog_image
+        self.post_fn = post_fn or post_to_blogger
+        self.find_post_fn = find_post_fn or find_blogger_post
+        self.exists_fn = exists_fn or blog_exists
+        self.bulk_exists_fn = bulk_exists_fn or bulk_blog_exists
+        self.near_duplicates_fn = near_duplicates_fn or bulk_find_near_duplicates
+        self.record_fn = record_fn or add_blog_entry
+        self.existing_titles_fn = existing_titles_fn or (lambda: get_recent_titles(TITLES_TO_AVOID_LIMIT))
+
+    def run_once(self) -> dict:
+        """Leases and processes one job. Returns the final job row, or None if the queue is empty."""
+        job = self.queue.lease(self.worker_id)
+        if job is None:
+            return None
+        return self.process(job)
+
+    def run(self, max_jobs: int = None, wait: bool = False, poll_interval: float = JOB_POLL_INTERVAL) -> int:
+        """Processes jobs until the queue is empty (or forever with wait=True). Returns the number processed."""
+        processed = 0
+        while max_jobs is None or processed < max_jobs:
+            if self.run_once() is None:
+                if not wait:
+                    break
+                time.sleep(poll_interval)
+                continue
+            processed += 1
+        return processed
+
+    def process(self, job: dict) -> dict:
+        started = time.perf_counter()
+        if job["attempts"] > 1:
+            logging.info(f"Resuming job {job['id']} ('{job['topic']}') at stage '{job['stage']}' (attempt {job['attempts']}).")
+        with span("job.post", job_id=job["id"], topic=job["topic"], attempt=job["attempts"]) as job_span:
+            try:
+                for stage in JOB_STAGES[JOB_STAGES.index(job["stage"]):-1]:
+                    if self.dry_run and stage == "post":
+                        self.queue.finish(job["id"], self.worker_id, "generated")
+                        break
+                    with span(f"stage.{stage}"):
+                        getattr(self, f"_stage_{stage}")(job)
+                else:
+                    self.queue.finish(job["id"], self.worker_id, "done")
+                    logging.info(f"Job {job['id']} done in {time.perf_counter() - started:.1f}s: '{job['title']}'")
+            except LeaseLost as e:
+                logging.warning(f"Stopped job {job['id']}: {e}")
+            except _SkipJob as e:
+                logging.info(f"Skipped job {job['id']} ('{job['topic']}'): {e}")
+                self.queue.finish(job["id"], self.worker_id, "skipped", str(e))
+            except GenerationAborted as e:
+                # Rerunning would pay for the same rejected generation again, so don't requeue it
+                logging.warning(f"Job {job['id']} ('{job['topic']}') failed validation at stage '{job['stage']}': {e.reason}")
+                self.queue.finish(job["id"], self.worker_id, "failed", f"generation aborted: {e.reason}")
+            except Exception as e:
+                status = self.queue.fail(job["id"], self.worker_id, str(e))
+                logging.error(f"Job {job['id']} ('{job['topic']}') failed at stage '{job['stage']}': {e} (now {status})")
+            job_span.set(stage=job["stage"])
+        return self.queue.get(job["id"])
+
+    def _save(self, job: dict, **fields):
+        self.queue.save(job["id"], self.worker_id, **fields)
+        job.update(fields)
+
+    def _stage_title(self, job: dict):
+        source = job["source_content"] or job["topic"]
+        from .title_selector import choose_title
+        titles_to_avoid = list(self.existing_titles_fn()) + self.queue.active_titles()
+        selection = choose_title(source, titles_to_avoid, generate_fn=self.title_fn,
+                                 claim_fn=lambda title: self.queue.claim_title(job["id"], self.worker_id, title),
+                                 max_attempts=self.max_title_retries, exists_fn=self.bulk_exists_fn,
+                                 near_duplicates_fn=self.near_duplicates_fn)
+        if not selection.title:
+            raise _SkipJob(f"no unique title after {selection.attempts} attempts")
+        job.update(title=selection.title, normalized_title=normalize_title(selection.title), stage="body")
+
+    def _stage_body(self, job: dict):
+        if job["source_content"]:
+            html = self.content_body_fn(job["source_content"], job["title"])
+        else:
+            html = self.body_fn(job["title"])
+        self._save(job, html=html, stage="image")
+
+    def _stage_image(self, job: dict):
+        image_url = ""
+        if self.with_images:
+            try:
+                image_url = self.image_fn(job["title"]) or ""
+            except Exception as e:
+                logging.error(f"Image generation failed for '{job['title']}': {e}. Posting without it.")
+        self._save(job, image_url=image_url, stage="post")
+
+    def _stage_post(self, job: dict):
+        from .blog_writer import embed_image
+        if job["blogger_post_id"] is None:
+            if job["post_attempted_at"] is not None:
+                # A previous attempt may have reached Blogger, so look before posting again
+                existing = self.find_post_fn(title=job["title"], blog_id=self.blog_id)
+                if existing:
+                    logging.info(f"Job {job['id']}: found existing Blogger post {existing.get('id')} for '{job['title']}'.")
+                    self._save(job, blogger_post_id=str(existing.get("id", "")), stage="record")
+                    return
+            elif self.exists_fn(job["normalized_title"]):
+                raise _SkipJob(f"title '{job['title']}' was posted by another run")
+            self._save(job, post_attempted_at=time.time())
+            content = embed_image(job["html"], job["image_url"], job["title"]) if job["image_url"] else job["html"]
+            response = self.post_fn(title=job["title"], content=content, blog_id=self.blog_id)
+            self._save(job, blogger_post_id=str((response or {}).get("id", "")), stage="record")
+        else:
+            self._save(job, stage="record")
+
+    def _stage_record(self, job: dict):
+        latency = time.time() - job["created_at"] # Enqueue to post, including any crash and retry
+        # add_blog_entry ignores titles that are already stored, so replaying this stage is harmless
+        self.record_fn(title=job["normalized_title"], status="posted", topic=job["topic"],
+                       blogger_post_id=job["blogger_post_id"], token_cost=current_cost(), latency=latency)
+        self._save(job, stage="done")
+
+def run_workers(queue: JobQueue, workers: int = 1, wait: bool = False, **kwargs) -> int:
+    """Runs several JobWorkers in threads against one queue. Returns the number of jobs processed."""
+    counts = []
+    def work():
+        counts.append(JobWorker(queue, **kwargs).run(wait=wait))
+    threads = [threading.Thread(target=work, name=f"job-worker-{i}") for i in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts)
+
+def main(argv=None):
+    from dotenv import load_dotenv
+    from .blog_db import init_db
+    from .pipeline import load_items
+
+    parser = argparse.ArgumentParser(description="Durable blog post queue.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    enqueue = subparsers.add_parser("enqueue", help="Add jobs to the queue.")
+    enqueue.add_argument("topics", nargs="*", help="Topics to write about.")
+    enqueue.add_argument("--items-file", help="File with one topic per line, or JSON objects with topic/content/title.")
+    enqueue.add_argument("--trending", type=int, default=0, help="Also enqueue up to N trending topics.")
+    work = subparsers.add_parser("work", help="Process queued jobs.")
+    work.add_argument("--workers", type=int, default=1, help="Worker threads in this process.")
+    work.add_argument("--blog-id", default=None, help="Blogger blog id (defaults to BLOGGER_BLOG_ID).")
+    work.add_argument("--no-images", action="store_true", help="Skip DALL-E image generation.")
+    work.add_argument("--dry-run", action="store_true", help="Generate everything but do not post to Blogger.")
+    work.add_argument("--wait", action="store_true", help="Keep polling for new jobs instead of exiting when the queue is empty.")
+    subparsers.add_parser("status", help="Show job counts by status.")
+    subparsers.add_parser("requeue", help="Retry failed jobs from their last saved stage.")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    load_dotenv()
+    init_db()
+    queue = JobQueue()
+    if args.command == "enqueue":
+        results = queue.enqueue_many(load_items(args))
+        created = sum(1 for _, is_new in results if is_new)
+        print(f"Enqueued {created} new jobs ({len(results) - created} already queued).")
+    elif args.command == "work":
+        blog_id = args.blog_id or os.environ.get("BLOGGER_BLOG_ID")
+        if not args.dry_run and not blog_id:
+            parser.error("BLOGGER_BLOG_ID environment variable not set and --blog-id not given.")
+        start_metrics_server()
+        processed = run_workers(queue, args.workers, wait=args.wait, blog_id=blog_id,
+                                with_images=not args.no_images, dry_run=args.dry_run)
+        print(f"Processed {processed} jobs.")
+    elif args.command == "requeue":
+        print(f"Requeued {queue.requeue_failed()} failed jobs.")
+    print(json.dumps(queue.counts()))
+
+if __name__ == "__main__":
+    main()
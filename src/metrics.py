@@ -0,0 +1,449 @@
+import abc
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import itertools
+import uuid
+from contextlib import contextmanager
+from .config import LOG_LEVEL, METRICS_SINK, METRICS_PATH, METRICS_PORT, MODEL_PRICES
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+def configure_logging(level: str = LOG_LEVEL):
+    """The one logging setup for the app and the CLI entry points (modules only log)."""
+    logging.basicConfig(level=getattr(logging, str(level).upper(), logging.INFO), format=LOG_FORMAT)
+
+# Metrics: counters and histograms kept in memory, exported in Prometheus text format
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key: tuple, extra: dict = None) -> str:
+    items = list(key) + list((extra or {}).items())
+    if not items:
+        return ""
+    escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for name, value in items)
+    return "{" + ",".join(escaped) + "}"
+
+class Counter:
+    def __init__(self, name: str, help_text: str = ""):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(key)} {value}" for key, value in values]
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str = "", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._data = {} # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            data = self._data.get(key)
+            if data is None:
+                data = self._data[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def count(self, **labels) -> int:
+        data = self._data.get(_label_key(labels))
+        return data[-1] if data else 0
+
+    def sum(self, **labels) -> float:
+        data = self._data.get(_label_key(labels))
+        return data[-2] if data else 0.0
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = [(key, list(data)) for key, data in self._data.items()]
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, data in items:
+            for bound, bucket_count in zip(self.buckets, data):
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': bound})} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, {'le': '+Inf'})} {data[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {data[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {data[-1]}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, *args):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(name, cls(name, *args))
+        return metric
+
+    def counter(self, name: str, help_text: str = "") -> Counter:
+        return self._get(Counter, name, help_text)
+
+    def histogram(self, name: str, help_text: str = "", buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help_text, buckets)
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+# Tracing: spans nest through a context variable (works across threads and asyncio tasks)
+
+_PROCESS_PREFIX = uuid.uuid4().hex[:8] # Keeps ids unique across worker processes
+_span_ids = itertools.count(1) # Cheaper than a uuid per span; DB queries create many
+
+class Span:
+    def __init__(self, name: str, parent: "Span" = None, attrs: dict = None):
+        self.name = name
+        self.parent = parent
+        self.span_id = f"{_PROCESS_PREFIX}{next(_span_ids):x}"
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.started_at = time.time()
+        self.attrs = dict(attrs or {})
+        self.totals = {}
+        self.error = None
+        self._lock = threading.Lock()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, **values):
+        """Accumulates numeric values (tokens, cost, retries) here and on every ancestor span.
+
+        Propagating immediately, rather than when the span ends, keeps the
+        totals right for work that outlives the span that started it, such
+        as an image generated in the background.
+        """
+        span_ = self
+        while span_ is not None:
+            with span_._lock:
+                for name, value in values.items():
+                    if value:
+                        span_.totals[name] = span_.totals.get(name, 0) + value
+            span_ = span_.parent
+
+    def root(self) -> "Span":
+        span_ = self
+        while span_.parent is not None:
+            span_ = span_.parent
+        return span_
+
+    def to_record(self, duration: float) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration": duration,
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+            "cost_usd": self.totals.get("cost_usd", 0.0),
+            "attrs": {**self.attrs, **self.totals},
+        }
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+def current_span() -> Span:
+    return _current_span.get()
+
+def current_cost():
+    """Estimated USD spent so far in the current trace (e.g. on the post being generated), or None."""
+    span_ = _current_span.get()
+    return span_.root().totals.get("cost_usd") if span_ is not None else None
+
+def add_to_span(**values):
+    span_ = _current_span.get()
+    if span_ is not None:
+        span_.add(**values)
+
+@contextmanager
+def span(name: str, record: bool = True, **attrs):
+    """Times a block as a span: latency histogram, error counter and a record in the span sink.
+
+    record=False keeps only the in-memory metrics, for very frequent calls such as DB queries.
+    """
+    parent = _current_span.get()
+    current = Span(name, parent, attrs)
+    token = _current_span.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        _current_span.reset(token)
+        registry.histogram("span_duration_seconds", "Latency of traced operations.").observe(duration, span=name)
+        if current.error:
+            registry.counter("span_errors_total", "Traced operations that raised.").inc(span=name)
+        if record:
+            get_span_sink().write(current.to_record(duration))
+
+def traced(name: str, record: bool = True):
+    """Decorator form of span() for plain functions and coroutines."""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, record):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, record):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def run_in_context(fn):
+    """Wraps fn to run in a copy of the caller's context, so spans started in pool threads nest correctly.
+
+    Every call gets its own copy, since a context can't be entered by two
+    threads at once; the wrapper can therefore be mapped over a pool.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return run
+
+def record_llm_usage(model: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+    """Counts tokens and their cost (MODEL_PRICES, USD per 1k tokens) on the metrics and the current span."""
+    prompt_tokens = prompt_tokens or 0
+    completion_tokens = completion_tokens or 0
+    prices = MODEL_PRICES.get(model, {})
+    cost = (prompt_tokens * prices.get("input", 0.0) + completion_tokens * prices.get("output", 0.0)) / 1000
+    tokens = registry.counter("llm_tokens_total", "Tokens used, by model and direction.")
+    tokens.inc(prompt_tokens, model=model, direction="prompt")
+    tokens.inc(completion_tokens, model=model, direction="completion")
+    registry.counter("llm_cost_usd_total", "Estimated spend in USD.").inc(cost, model=model)
+    add_to_span(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cost_usd=cost)
+
+def record_image(model: str, images: int = 1):
+    cost = MODEL_PRICES.get(model, {}).get("image", 0.0) * images
+    registry.counter("images_total", "Images generated.").inc(images, model=model)
+    registry.counter("llm_cost_usd_total", "Estimated spend in USD.").inc(cost, model=model)
+    add_to_span(cost_usd=cost)
+
+# Span sinks. Spans are queued and written by a background thread in batches,
+# so tracing adds microseconds, not a disk write, to each call.
+
+class SpanSink(abc.ABC):
+    def __init__(self, flush_interval: float = 1.0, max_batch: int = 500):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def write(self, record: dict):
+        self._queue.put(record)
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="span-sink", daemon=True)
+                    self._thread.start()
+
+    def _drain(self, block: bool) -> list:
+        batch = []
+        try:
+            if block:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+            while len(batch) < self.max_batch:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._drain(block=True)
+            if batch:
+                self._write_batch(batch)
+
+    def _write_batch(self, batch: list):
+        with self._write_lock:
+            try:
+                self._write(batch)
+            except Exception as e:
+                logging.warning(f"Could not write {len(batch)} spans: {e}")
+
+    def flush(self):
+        """Writes everything queued so far (called at exit)."""
+        while True:
+            batch = self._drain(block=False)
+            if not batch:
+                return
+            self._write_batch(batch)
+
+    @abc.abstractmethod
+    def _write(self, batch: list):
+        """Persists a batch of span records; runs on the writer thread or in flush()."""
+
+class NullSpanSink(SpanSink):
+    def write(self, record: dict):
+        pass
+
+    def _write(self, batch: list):
+        pass
+
+class JsonlSpanSink(SpanSink):
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+
+    def _write(self, batch: list):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in batch))
+
+SPAN_COLUMNS = ("trace_id", "span_id", "parent_id", "name", "started_at", "duration", "status", "error", "cost_usd", "attrs")
+
+def _connect_spans_db(path: str) -> sqlite3.Connection:
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS spans (
+            trace_id TEXT NOT NULL,
+            span_id TEXT NOT NULL,
+            parent_id TEXT,
+            name TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            duration REAL NOT NULL,
+            status TEXT NOT NULL,
+            error TEXT,
+            cost_usd REAL,
+            attrs TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_spans_started_at ON spans(started_at)")
+    return conn
+
+class SqliteSpanSink(SpanSink):
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._conn = None
+        self._conn_thread = None
+
+    def _write(self, batch: list):
+        if self._conn is None:
+            self._conn = _connect_spans_db(self.path)
+            self._conn_thread = threading.get_ident()
+        # The final flush at exit runs on the main thread, which can't share the writer's connection
+        conn = self._conn if self._conn_thread == threading.get_ident() else _connect_spans_db(self.path)
+        rows = [tuple(json.dumps(record[c]) if c == "attrs" else record[c] for c in SPAN_COLUMNS) for record in batch]
+        conn.executemany(f"INSERT INTO spans ({', '.join(SPAN_COLUMNS)}) VALUES ({', '.join('?' * len(SPAN_COLUMNS))})", rows)
+        conn.commit()
+        if conn is not self._conn:
+            conn.close()
+
+def load_spans(path: str = None, since: float = 0.0, names=None) -> list[dict]:
+    """Reads spans from the SQLite sink, e.g. for the dashboard."""
+    path = path or (METRICS_PATH if METRICS_SINK == "sqlite" else None)
+    if not path or not os.path.exists(path):
+        return []
+    conn = _connect_spans_db(path)
+    try:
+        query = f"SELECT {', '.join(SPAN_COLUMNS)} FROM spans WHERE started_at >= ?"
+        params = [since]
+        if names:
+            query += f" AND name IN ({', '.join('?' * len(names))})"
+            params += list(names)
+        rows = conn.execute(query + " ORDER BY started_at", params).fetchall()
+    finally:
+        conn.close()
+    return [{**dict(zip(SPAN_COLUMNS, row)), "attrs": json.loads(row[-1] or "{}")} for row in rows]
+
+_sink = None
+_sink_lock = threading.Lock()
+
+def get_span_sink() -> SpanSink:
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                if METRICS_SINK == "sqlite":
+                    _sink = SqliteSpanSink(METRICS_PATH)
+                elif METRICS_SINK == "jsonl":
+                    _sink = JsonlSpanSink(METRICS_PATH)
+                else:
+                    _sink = NullSpanSink()
+    return _sink
+
+def set_span_sink(sink: SpanSink):
+    global _sink
+    _sink = sink
+
+_server = None
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "127.0.0.1"):
+    """Serves /metrics in Prometheus text format from a daemon thread. No-op without a port or if already running."""
+    global _server
+    if not port or _server is not None:
+        return _server
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    _server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    logging.info(f"Serving Prometheus metrics on http://{host}:{port}/metrics")
+    return _server
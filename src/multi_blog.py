@@ -0,0 +1,223 @@
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import partial
+
+from dotenv import load_dotenv
+
+from .blog_db import init_db, get_repository, BlogRepository, DEFAULT_NAMESPACE
+from .blogger_api import post_to_blogger, DEFAULT_TOKEN_ENV
+from .metrics import configure_logging, start_metrics_server, registry
+from .pipeline import BatchPipeline
+from .config import (
+    BLOGS_CONFIG,
+    BLOG_MAX_CONCURRENCY,
+    BLOG_DAILY_QUOTA,
+    BLOG_POSTS_PER_RUN,
+    FANOUT_WORKERS,
+    TRENDS_SEEDS,
+    TRENDS_GEOS,
+    TITLES_TO_AVOID_LIMIT,
+    PIPELINE_TITLE_WORKERS,
+    PIPELINE_BODY_WORKERS,
+    PIPELINE_IMAGE_WORKERS,
+    PIPELINE_POST_WORKERS,
+)
+
+@dataclass
+class BlogConfig:
+    """One blog in the registry.
+
+    Titles are de-duplicated within namespace, which defaults to blog_id; set
+    it to "" to keep the history recorded before multi-blog support.
+    token_env names the environment variable holding the blog's OAuth token JSON.
+    """
+    blog_id: str
+    name: str = ""
+    seeds: list = field(default_factory=lambda: list(TRENDS_SEEDS))
+    geos: list = field(default_factory=lambda: list(TRENDS_GEOS))
+    token_env: str = DEFAULT_TOKEN_ENV
+    namespace: str = None
+    max_concurrency: int = BLOG_MAX_CONCURRENCY
+    daily_quota: int = BLOG_DAILY_QUOTA # 0 is unlimited
+    posts_per_run: int = BLOG_POSTS_PER_RUN
+
+    def __post_init__(self):
+        self.blog_id = str(self.blog_id)
+        self.name = self.name or self.blog_id
+        if self.namespace is None:
+            self.namespace = self.blog_id
+
+def load_blogs(path: str = BLOGS_CONFIG) -> list[BlogConfig]:
+    """Reads the blog registry: a JSON list of BlogConfig fields, or {"blogs": [...]}.
+
+    Without a registry file, BLOGGER_BLOG_ID (if set) is the only blog and
+    keeps the default namespace, so single-blog setups see no change.
+    """
+    if not path or not os.path.exists(path):
+        blog_id = os.environ.get("BLOGGER_BLOG_ID")
+        return [BlogConfig(blog_id=blog_id, namespace=DEFAULT_NAMESPACE)] if blog_id else []
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    entries = data.get("blogs", []) if isinstance(data, dict) else data
+    blogs = []
+    for entry in entries:
+        try:
+            blogs.append(BlogConfig(**entry))
+        except TypeError as e:
+            raise ValueError(f"Invalid blog entry in {path}: {entry!r} ({e})") from None
+    duplicates = {blog.blog_id for blog in blogs if sum(other.blog_id == blog.blog_id for other in blogs) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate blog ids in {path}: {', '.join(sorted(duplicates))}")
+    return blogs
+
+def start_of_day_utc() -> str:
+    """Today's midnight in the timestamp format of the blogs table."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT00:00:00.000Z")
+
+class MultiBlogRunner:
+    """Runs one generation round for every blog in the registry from shared work.
+
+    Trends are fetched once for the union of all blogs' seeds and regions and
+    split per blog afterwards. Each blog then ranks those topics against its
+    own history and runs its own BatchPipeline, with at most max_concurrency
+    posts in flight and no more posts than its daily quota has left, while up
+    to `workers` blogs run side by side. The LLM cache, image store, rate
+    limiters and Blogger clients are process-wide, so blogs share cached
+    bodies and images and stay inside one set of API limits.
+    """
+
+    def __init__(self, blogs, repository: BlogRepository = None, collector=None, workers: int = FANOUT_WORKERS,
+                 with_images: bool = True, image_timeout: float = None, dry_run: bool = False, **pipeline_kwargs):
+        self.blogs = list(blogs)
+        self.repository = repository or get_repository()
+        self.collector = collector
+        self.workers = max(1, workers)
+        self.with_images = with_images
+        self.image_timeout = image_timeout
+        self.dry_run = dry_run
+        self.pipeline_kwargs = pipeline_kwargs # Stage callables for tests and benchmarks, see BatchPipeline
+
+    def _collector(self):
+        if self.collector is None:
+            from .trend_scraper import TrendsCollector
+            seeds = list(dict.fromkeys(seed for blog in self.blogs for seed in blog.seeds))
+            geos = list(dict.fromkeys(geo for blog in self.blogs for geo in blog.geos))
+            self.collector = TrendsCollector(seeds=seeds, geos=geos)
+        return self.collector
+
+    def topics_by_blog(self, use_snapshot: bool = True) -> dict:
+        """Trending topics for each blog's seeds and regions, from one trends fetch."""
+        from .trend_scraper import FALLBACK_TOPICS
+        collector = self._collector()
+        results = collector.collect_results(use_snapshot)
+        topics = {}
+        for blog in self.blogs:
+            blog_topics = collector.merge(results, blog.seeds, blog.geos)
+            if not blog_topics:
+                logging.warning(f"No Google Trends data for blog '{blog.name}'. Using fallback keywords.")
+                blog_topics = FALLBACK_TOPICS
+            topics[blog.blog_id] = [topic for topic in blog_topics if "news" not in topic.lower()]
+        return topics
+
+    def quota_left(self, blog: BlogConfig) -> int:
+        """Posts this blog may still publish today, or posts_per_run when it has no quota."""
+        if blog.daily_quota <= 0:
+            return blog.posts_per_run
+        posted = self.repository.scoped(blog.namespace).posted_since(start_of_day_utc())
+        return max(0, blog.daily_quota - posted)
+
+    def _pipeline(self, blog: BlogConfig, repository: BlogRepository) -> BatchPipeline:
+        workers = max(1, blog.max_concurrency)
+        kwargs = {
+            "title_workers": min(PIPELINE_TITLE_WORKERS, workers),
+            "body_workers": min(PIPELINE_BODY_WORKERS, workers),
+            "image_workers": min(PIPELINE_IMAGE_WORKERS, workers),
+            "post_workers": min(PIPELINE_POST_WORKERS, workers),
+            "max_in_flight": workers,
+            "with_images": self.with_images,
+            "image_timeout": self.image_timeout,
+            "dry_run": self.dry_run,
+            "post_fn": partial(post_to_blogger, token_env=blog.token_env),
+            "exists_fn": repository.exists,
+            "bulk_exists_fn": repository.bulk_exists,
+            "near_duplicates_fn": repository.bulk_find_near_duplicates,
+            "record_fn": repository.add,
+            "existing_titles_fn": lambda: repository.recent_titles(TITLES_TO_AVOID_LIMIT),
+        }
+        kwargs.update(self.pipeline_kwargs)
+        return BatchPipeline(blog_id=blog.blog_id, **kwargs)
+
+    def run_blog(self, blog: BlogConfig, topics) -> dict:
+        """Ranks topics against the blog's own history and posts the best ones its quota allows."""
+        from .topic_ranker import rank_topics
+        repository = self.repository.scoped(blog.namespace)
+        limit = min(blog.posts_per_run, self.quota_left(blog))
+        result = {"blog_id": blog.blog_id, "name": blog.name, "items": [], "summary": None}
+        if limit <= 0:
+            logging.info(f"Blog '{blog.name}' has used its daily quota of {blog.daily_quota} posts. Skipping.")
+            return result
+        ranked = rank_topics(topics, repository.iter_topics())
+        pipeline_result = self._pipeline(blog, repository).run([entry["topic"] for entry in ranked[:limit]])
+        result.update(pipeline_result)
+        posts = registry.counter("blog_posts_total", "Posts handled by the multi-blog fan-out, by blog and status.")
+        for item in pipeline_result["items"]:
+            posts.inc(blog=blog.name, status=item["status"])
+        return result
+
+    def run(self, use_snapshot: bool = True) -> dict:
+        """Processes every blog and returns {"blogs": [...], "summary": {...}}."""
+        started = time.perf_counter()
+        topics = self.topics_by_blog(use_snapshot)
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(self.blogs)) or 1, thread_name_prefix="fanout") as executor:
+            blogs = list(executor.map(lambda blog: self.run_blog(blog, topics[blog.blog_id]), self.blogs))
+        elapsed = time.perf_counter() - started
+
+        counts = {}
+        for blog in blogs:
+            for item in blog["items"]:
+                counts[item["status"]] = counts.get(item["status"], 0) + 1
+        completed = counts.get("posted", 0) + counts.get("generated", 0)
+        summary = {
+            "blogs": len(blogs),
+            "counts": counts,
+            "elapsed_s": round(elapsed, 3),
+            "posts_per_minute": round(completed / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        }
+        return {"blogs": blogs, "summary": summary}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate and post to every blog in the registry from one trends fetch.")
+    parser.add_argument("--config", default=BLOGS_CONFIG, help="Blog registry JSON file.")
+    parser.add_argument("--blog", action="append", default=[], help="Only run this blog id or name (repeatable).")
+    parser.add_argument("--workers", type=int, default=FANOUT_WORKERS, help="Blogs processed side by side.")
+    parser.add_argument("--no-images", action="store_true", help="Skip DALL-E image generation.")
+    parser.add_argument("--image-timeout", type=float, default=None, help="Post without the image if it is not ready after this many seconds.")
+    parser.add_argument("--refresh-trends", action="store_true", help="Ignore the trends snapshot.")
+    parser.add_argument("--dry-run", action="store_true", help="Generate everything but do not post to Blogger.")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    start_metrics_server()
+    load_dotenv()
+    blogs = load_blogs(args.config)
+    if args.blog:
+        blogs = [blog for blog in blogs if blog.blog_id in args.blog or blog.name in args.blog]
+    if not blogs:
+        parser.error(f"No blogs configured: create {args.config} or set BLOGGER_BLOG_ID.")
+
+    init_db()
+    result = MultiBlogRunner(blogs, workers=args.workers, with_images=not args.no_images,
+                             image_timeout=args.image_timeout, dry_run=args.dry_run).run(use_snapshot=not args.refresh_trends)
+    for blog in result["blogs"]:
+        for item in blog["items"]:
+            print(json.dumps({"blog_id": blog["blog_id"], **item}))
+    print(json.dumps(result["summary"], indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import os
+import threading
+import weakref
+from typing import TYPE_CHECKING
+from .config import OPENAI_BASE_URL, OPENAI_TIMEOUT, OPENAI_MAX_RETRIES
+
+# openai is imported on first use since it is one of the slowest imports in the app
+if TYPE_CHECKING:
+    from openai import OpenAI, AsyncOpenAI
+
+_lock = threading.Lock()
+_client = None
+_async_clients = weakref.WeakKeyDictionary() # One AsyncOpenAI per event loop
+
+def _client_kwargs(base_url=None) -> dict:
+    kwargs = {
+        "api_key": os.environ.get("OPENAI_API_KEY"),
+        "timeout": OPENAI_TIMEOUT,
+        "max_retries": OPENAI_MAX_RETRIES,
+    }
+    base_url = base_url or OPENAI_BASE_URL
+    if base_url:
+        kwargs["base_url"] = base_url
+    return kwargs
+
+def get_openai_client(base_url: str = None) -> "OpenAI":
+    """Returns the shared, long-lived sync client.
+
+    The client owns an HTTP connection pool, so reusing it keeps connections
+    warm across calls (and tenacity retries) instead of doing a new TLS
+    handshake every time. Passing base_url builds a dedicated client, e.g. to
+    point at a local mock server.
+    """
+    global _client
+    from openai import OpenAI
+    if base_url:
+        return OpenAI(**_client_kwargs(base_url))
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = OpenAI(**_client_kwargs())
+                logging.info("Created shared OpenAI client.")
+    return _client
+
+def get_async_openai_client(base_url: str = None) -> "AsyncOpenAI":
+    """Returns the shared AsyncOpenAI client for the running event loop.
+
+    Async connection pools are tied to the loop that created them, so one
+    client is kept per loop and dropped when the loop is garbage collected.
+    """
+    from openai import AsyncOpenAI
+    if base_url:
+        return AsyncOpenAI(**_client_kwargs(base_url))
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncOpenAI(**_client_kwargs())
+        _async_clients[loop] = client
+        logging.info("Created shared AsyncOpenAI client.")
+    return client
+
+def reset_openai_clients():
+    """Closes and forgets the shared clients, e.g. after changing OPENAI_API_KEY."""
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _async_clients.clear()
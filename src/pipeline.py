@@ -0,0 +1,332 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+
+from dotenv import load_dotenv
+
+from .blog_db import init_db, blog_exists, bulk_blog_exists, bulk_find_near_duplicates, add_blog_entry, get_recent_titles, normalize_title
+from .blog_writer import generate_title_candidates, generate_blog_text, generate_blog_text_from_content, generate_blog_image, embed_image
+from .blogger_api import post_to_blogger
+from .metrics import configure_logging, start_metrics_server, span, run_in_context, current_cost
+from .title_selector import choose_title
+from .config import (
+    BLOGGER_BLOG_ID,
+    MAX_TITLE_RETRIES,
+    TITLES_TO_AVOID_LIMIT,
+    PIPELINE_TITLE_WORKERS,
+    PIPELINE_BODY_WORKERS,
+    PIPELINE_IMAGE_WORKERS,
+    PIPELINE_POST_WORKERS,
+)
+
+STAGES = ("title", "body", "image", "post")
+
+@dataclass
+class BatchItem:
+    """One post moving through the pipeline, plus everything produced for it."""
+    topic: str
+    content: str = ""  # Source content for "From Provided Content" style items
+    title: str = ""    # A preset title skips the title stage
+    blog_content: str = ""
+    image_url: str = ""
+    post_id: str = ""
+    status: str = "pending"  # pending -> posted | skipped | failed
+    error: str = ""
+    title_attempts: int = 0 # Title requests made
+    title_rejected: dict = field(default_factory=dict) # Rejected candidate -> reason
+    timings: dict = field(default_factory=dict)
+    image_future: object = field(default=None, repr=False)
+
+    def to_dict(self) -> dict:
+        return {
+            "topic": self.topic,
+            "title": self.title,
+            "status": self.status,
+            "error": self.error,
+            "post_id": self.post_id,
+            "image_url": self.image_url,
+            "title_attempts": self.title_attempts,
+            "title_rejected": self.title_rejected,
+            "timings": {stage: round(seconds, 3) for stage, seconds in self.timings.items()},
+        }
+
+def _to_item(raw) -> BatchItem:
+    if isinstance(raw, BatchItem):
+        return raw
+    if isinstance(raw, str):
+        return BatchItem(topic=raw)
+    return BatchItem(
+        topic=raw.get("topic") or raw.get("title") or raw.get("content", "")[:50],
+        content=raw.get("content", ""),
+        title=raw.get("title", ""),
+    )
+
+class _SkipItem(Exception):
+    """Raised by a stage to drop an item without counting it as a failure."""
+
+class BatchPipeline:
+    """Runs title -> body -> image -> post for many items with bounded per-stage concurrency.
+
+    Every item runs its stages in order on a worker thread, but each stage is
+    gated by its own semaphore, so while one item is being written another can
+    be getting its image and a third can be posted. max_in_flight caps how many
+    items are between their first and last stage at once (default: the sum of
+    the stage limits). The stage callables default to the real
+    OpenAI/Blogger/DB functions and can be swapped out for stubs.
+    """
+
+    def __init__(self, blog_id=None, title_workers=PIPELINE_TITLE_WORKERS, body_workers=PIPELINE_BODY_WORKERS,
+                 image_workers=PIPELINE_IMAGE_WORKERS, post_workers=PIPELINE_POST_WORKERS,
+                 max_title_retries=MAX_TITLE_RETRIES, with_images=True, image_timeout=None, dry_run=False,
+                 title_fn=generate_title_candidates, body_fn=generate_blog_text,
+                 content_body_fn=generate_blog_text_from_content, image_fn=generate_blog_image,
+                 post_fn=post_to_blogger, exists_fn=blog_exists, bulk_exists_fn=bulk_blog_exists,
+                 near_duplicates_fn=bulk_find_near_duplicates, record_fn=add_blog_entry, existing_titles_fn=None,
+                 max_in_flight=None):
+        self.blog_id = blog_id or BLOGGER_BLOG_ID
+        self.limits = {"title": title_workers, "body": body_workers, "image": image_workers, "post": post_workers}
+        self.max_in_flight = max_in_flight
+        self.max_title_retries = max_title_retries
+        self.with_images = with_images
+        self.image_timeout = image_timeout
+        self.dry_run = dry_run
+        self.title_fn = title_fn
+        self.body_fn = body_fn
+        self.content_body_fn = content_body_fn
+        self.image_fn = image_fn
+        self.post_fn = post_fn
+        self.exists_fn = exists_fn
+        self.bulk_exists_fn = bulk_exists_fn
+        self.near_duplicates_fn = near_duplicates_fn
+        self.record_fn = record_fn
+        self.existing_titles_fn = existing_titles_fn or (lambda: get_recent_titles(limit=TITLES_TO_AVOID_LIMIT))
+        # Images run on their own executor (sized by image_workers) so they overlap the body stage
+        self._semaphores = {stage: threading.BoundedSemaphore(max(1, limit)) for stage, limit in self.limits.items() if stage != "image"}
+        self._image_executor = None
+        self._claimed_titles = set()
+        self._claim_lock = threading.Lock()
+        self._titles_to_avoid = []
+
+    def run(self, items) -> dict:
+        """Processes all items and returns {"items": [...], "summary": {...}}."""
+        batch = [_to_item(raw) for raw in items]
+        self._titles_to_avoid = list(self.existing_titles_fn())
+        self._claimed_titles = set()
+
+        started = time.perf_counter()
+        max_in_flight = max(1, sum(self.limits.values()))
+        if self.max_in_flight:
+            max_in_flight = min(max_in_flight, max(1, self.max_in_flight))
+        with ThreadPoolExecutor(max_workers=max(1, self.limits["image"]), thread_name_prefix="pipeline-image") as image_executor:
+            self._image_executor = image_executor
+            with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="pipeline") as executor:
+                list(executor.map(self._process, batch))
+        elapsed = time.perf_counter() - started
+
+        return {"items": [item.to_dict() for item in batch], "summary": summarize(batch, elapsed)}
+
+    def _process(self, item: BatchItem) -> BatchItem:
+        with span("pipeline.post", topic=item.topic) as post_span:
+            try:
+                for stage in STAGES:
+                    if stage == "image":
+                        if self.with_images:
+                            self._join_image(item)
+                        continue
+                    with self._semaphores[stage], span(f"stage.{stage}"):
+                        stage_started = time.perf_counter()
+                        try:
+                            getattr(self, f"_stage_{stage}")(item)
+                        finally:
+                            item.timings[stage] = time.perf_counter() - stage_started
+            except _SkipItem as e:
+                item.status = "skipped"
+                item.error = str(e)
+                logging.info(f"Skipped '{item.topic}': {e}")
+            except Exception as e:
+                item.status = "failed"
+                item.error = str(e)
+                logging.error(f"Pipeline failed for '{item.topic}': {e}")
+            post_span.set(status=item.status, title=item.title)
+        return item
+
+    def _claim(self, normalized_title: str) -> bool:
+        """Reserves a title for this batch so two workers never post the same one."""
+        with self._claim_lock:
+            if normalized_title in self._claimed_titles:
+                return False
+            self._claimed_titles.add(normalized_title)
+            return True
+
+    def _stage_title(self, item: BatchItem):
+        if item.title:
+            normalized = normalize_title(item.title)
+            if self.exists_fn(normalized) or not self._claim(normalized):
+                raise _SkipItem(f"title '{item.title}' already exists")
+            return
+
+        source = item.content or item.topic
+        with self._claim_lock:
+            titles_to_avoid = self._titles_to_avoid + list(self._claimed_titles)
+        # Every candidate is checked (reworded duplicates included) and ranked locally before paying for a body
+        selection = choose_title(source, titles_to_avoid, generate_fn=self.title_fn,
+                                 claim_fn=lambda title: self._claim(normalize_title(title)),
+                                 max_attempts=self.max_title_retries, exists_fn=self.bulk_exists_fn,
+                                 near_duplicates_fn=self.near_duplicates_fn)
+        item.title_attempts = selection.attempts
+        item.title_rejected = selection.rejected
+        with self._claim_lock:
+            self._titles_to_avoid.extend(normalize_title(title) for title in selection.rejected)
+        if not selection.title:
+            raise _SkipItem(f"no unique title after {selection.attempts} attempts")
+        item.title = selection.title
+
+    def _stage_body(self, item: BatchItem):
+        if self.with_images:
+            # The image prompt only needs the title, so start it alongside the body
+            item.image_future = self._image_executor.submit(run_in_context(self._generate_image), item)
+        if item.content:
+            item.blog_content = self.content_body_fn(item.content, item.title)
+        else:
+            item.blog_content = self.body_fn(item.title)
+
+    def _generate_image(self, item: BatchItem) -> str:
+        started = time.perf_counter()
+        try:
+            with span("stage.image"):
+                return self.image_fn(item.title) or ""
+        finally:
+            item.timings["image"] = time.perf_counter() - started
+
+    def _join_image(self, item: BatchItem):
+        """Waits for the image started in the body stage and embeds it.
+
+        An image that fails or is not ready within image_timeout does not
+        block the post; it goes out without an image instead.
+        """
+        started = time.perf_counter()
+        try:
+            item.image_url = item.image_future.result(timeout=self.image_timeout)
+            item.blog_content = embed_image(item.blog_content, item.image_url, item.title)
+        except FutureTimeoutError:
+            logging.warning(f"Image for '{item.title}' not ready after {self.image_timeout}s. Posting without it.")
+        except Exception as e:
+            logging.error(f"Image generation failed for '{item.title}': {e}. Posting without it.")
+        finally:
+            item.timings["image_wait"] = time.perf_counter() - started
+
+    def _stage_post(self, item: BatchItem):
+        normalized = normalize_title(item.title)
+        # Final check before posting, another run may have posted it meanwhile
+        if self.exists_fn(normalized):
+            raise _SkipItem(f"title '{item.title}' was posted by another run")
+        if self.dry_run:
+            item.status = "generated"
+            return
+        try:
+            response = self.post_fn(title=item.title, content=item.blog_content, blog_id=self.blog_id)
+        except Exception:
+            self.record_fn(title=normalized, status="failed", topic=item.topic, token_cost=current_cost())
+            raise
+        item.post_id = str((response or {}).get("id", ""))
+        self.record_fn(title=normalized, status="posted", topic=item.topic, blogger_post_id=item.post_id,
+                       token_cost=current_cost(), latency=sum(item.timings.values()))
+        item.status = "posted"
+
+def summarize(items, elapsed: float) -> dict:
+    """Throughput and per-stage latency summary for a finished batch."""
+    counts = {}
+    for item in items:
+        counts[item.status] = counts.get(item.status, 0) + 1
+
+    stages = {}
+    for stage in STAGES + ("image_wait",):
+        samples = sorted(item.timings[stage] for item in items if stage in item.timings)
+        if samples:
+            stages[stage] = {
+                "count": len(samples),
+                "mean_s": round(sum(samples) / len(samples), 3),
+                "max_s": round(samples[-1], 3),
+            }
+
+    completed = counts.get("posted", 0) + counts.get("generated", 0)
+    titled = [item.title_attempts for item in items if item.title_attempts]
+    return {
+        "total": len(items),
+        "counts": counts,
+        "title_requests_per_item": round(sum(titled) / len(titled), 2) if titled else 0.0,
+        "elapsed_s": round(elapsed, 3),
+        "posts_per_minute": round(completed / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        "stages": stages,
+    }
+
+def run_batch(items, **kwargs) -> dict:
+    """Convenience wrapper: initializes the DB and runs one batch."""
+    init_db()
+    return BatchPipeline(**kwargs).run(items)
+
+def load_items(args) -> list:
+    items = list(args.topics or [])
+    if args.items_file:
+        with open(args.items_file, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                items.append(json.loads(line) if line.startswith("{") else line)
+    if args.trending:
+        from .trend_scraper import get_trending_topics
+        from .topic_ranker import rank_topics
+        from .blog_db import get_topic_history
+        init_db()
+        topics = [topic for topic in get_trending_topics() if "news" not in topic.lower()]
+        items += [ranked["topic"] for ranked in rank_topics(topics, get_topic_history())[:args.trending]]
+    return items
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate and post a batch of blogs concurrently.")
+    parser.add_argument("topics", nargs="*", help="Topics to write about.")
+    parser.add_argument("--items-file", help="File with one topic per line, or JSON objects with topic/content/title.")
+    parser.add_argument("--trending", type=int, default=0, help="Also take up to N trending topics.")
+    parser.add_argument("--blog-id", default=None, help="Blogger blog id (defaults to BLOGGER_BLOG_ID).")
+    parser.add_argument("--title-workers", type=int, default=PIPELINE_TITLE_WORKERS)
+    parser.add_argument("--body-workers", type=int, default=PIPELINE_BODY_WORKERS)
+    parser.add_argument("--image-workers", type=int, default=PIPELINE_IMAGE_WORKERS)
+    parser.add_argument("--post-workers", type=int, default=PIPELINE_POST_WORKERS)
+    parser.add_argument("--no-images", action="store_true", help="Skip DALL-E image generation.")
+    parser.add_argument("--image-timeout", type=float, default=None, help="Post without the image if it is not ready after this many seconds.")
+    parser.add_argument("--dry-run", action="store_true", help="Generate everything but do not post to Blogger.")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    start_metrics_server()
+    load_dotenv()
+    blog_id = args.blog_id or os.environ.get("BLOGGER_BLOG_ID")
+    items = load_items(args)
+    if not items:
+        parser.error("No topics given.")
+    if not args.dry_run and not blog_id:
+        parser.error("BLOGGER_BLOG_ID environment variable not set and --blog-id not given.")
+
+    result = run_batch(
+        items,
+        blog_id=blog_id,
+        title_workers=args.title_workers,
+        body_workers=args.body_workers,
+        image_workers=args.image_workers,
+        post_workers=args.post_workers,
+        with_images=not args.no_images,
+        image_timeout=args.image_timeout,
+        dry_run=args.dry_run,
+    )
+    for item in result["items"]:
+        print(json.dumps(item))
+    print(json.dumps(result["summary"], indent=2))
+
+if __name__ == "__main__":
+    main()
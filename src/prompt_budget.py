@@ -0,0 +1,94 @@
+import functools
+import logging
+
+from .config import TITLE_AVOID_MAX_TOKENS, TITLE_TOPIC_MAX_TOKENS, BLOG_SOURCE_MAX_TOKENS
+
+CHARS_PER_TOKEN = 4 # Fallback estimate when tiktoken is not installed
+DEFAULT_ENCODING = "cl100k_base"
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000) # Histogram buckets for prompt sizes
+
+@functools.lru_cache(maxsize=8)
+def _encoding(model: str):
+    """tiktoken encoding for model, or None if tiktoken (an optional dependency) is unavailable."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e: # The BPE files are downloaded on first use, which can fail offline
+        logging.warning(f"tiktoken unavailable ({e}); estimating tokens from length.")
+        return None
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """Exact count with tiktoken when installed, otherwise ~4 characters per token."""
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def trim_to_tokens(text: str, max_tokens: int, model: str = "gpt-3.5-turbo") -> str:
+    """Cuts text to at most max_tokens, preferring a paragraph, line or word boundary near the end."""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    encoding = _encoding(model)
+    if encoding is None:
+        head = text[:max_tokens * CHARS_PER_TOKEN]
+    else:
+        head = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    for separator in ("\n\n", "\n", ". ", " "):
+        cut = head.rfind(separator)
+        if cut >= len(head) * 0.8: # Don't throw away more than a fifth to end on a boundary
+            return head[:cut + (1 if separator == ". " else 0)].rstrip()
+    return head
+
+def select_relevant_titles(topic: str, titles, max_tokens: int = TITLE_AVOID_MAX_TOKENS, model: str = "gpt-3.5-turbo") -> list[str]:
+    """Picks the prior titles most similar to topic that fit in max_tokens.
+
+    Similarity is the share of a title's character 3-grams that also appear
+    in the topic, so the prompt spends its budget on titles the model is
+    actually likely to repeat. Ties keep the input (most recent first) order.
+    """
+    from .blog_db import normalize_title
+    from .title_index import shingles # Imported here to keep numpy out of blog_writer's import time
+
+    titles = list(dict.fromkeys(title for title in titles if title))
+    if not titles or max_tokens <= 0:
+        return []
+    topic_shingles = shingles(normalize_title(topic))
+
+    def relevance(title: str) -> float:
+        title_shingles = shingles(normalize_title(title))
+        return len(title_shingles & topic_shingles) / len(title_shingles) if title_shingles else 0.0
+
+    ranked = sorted(enumerate(titles), key=lambda pair: (-relevance(pair[1]), pair[0]))
+    selected, used = [], 0
+    for _, title in ranked:
+        cost = count_tokens(title, model) + 1 # Plus the ", " separator
+        if used + cost > max_tokens:
+            break
+        selected.append(title)
+        used += cost
+    return selected
+
+def budget_topic(topic: str) -> str:
+    """Titles are sometimes generated from a whole article; only its beginning is needed."""
+    return trim_to_tokens(topic, TITLE_TOPIC_MAX_TOKENS)
+
+def budget_source_content(content: str) -> str:
+    trimmed = trim_to_tokens(content, BLOG_SOURCE_MAX_TOKENS)
+    if len(trimmed) < len(content):
+        logging.info(f"Trimmed source content from {len(content)} to {len(trimmed)} characters ({BLOG_SOURCE_MAX_TOKENS} token budget).")
+    return trimmed
+
+def record_prompt(kind: str, prompt: str, model: str = "gpt-3.5-turbo") -> int:
+    """Counts and records the tokens of a prompt about to be sent. Returns the count."""
+    from .metrics import registry
+    tokens = count_tokens(prompt, model)
+    registry.histogram("prompt_tokens", "Counted prompt tokens per call.", TOKEN_BUCKETS).observe(tokens, kind=kind)
+    logging.info(f"Sending {kind} prompt: {tokens} tokens.")
+    return tokens
@@ -0,0 +1,340 @@
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+from tenacity import retry, stop_after_attempt, retry_if_exception
+from .config import (
+    CHAT_REQUESTS_PER_MINUTE,
+    CHAT_TOKENS_PER_MINUTE,
+    CHAT_MAX_CONCURRENCY,
+    IMAGE_REQUESTS_PER_MINUTE,
+    IMAGE_MAX_CONCURRENCY,
+    BLOGGER_REQUESTS_PER_MINUTE,
+    BLOGGER_MAX_CONCURRENCY,
+    RETRY_ATTEMPTS,
+    RETRY_BACKOFF_BASE,
+    RETRY_BACKOFF_MAX,
+)
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per minute, bursts up to `capacity`.
+
+    acquire() blocks only as long as needed for enough tokens to refill,
+    instead of sleeping a fixed amount after every call.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_minute / 60.0)
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        with self._lock:
+            self._refill(self._clock())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def _take_or_delay(self, tokens: float) -> float:
+        """Takes the tokens and returns 0, or returns how long to wait before trying again."""
+        with self._lock:
+            self._refill(self._clock())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            # Requests larger than the bucket wait for a full bucket and then go through
+            missing = min(tokens, self.capacity) - self._tokens
+            if missing <= 0:
+                self._tokens -= tokens
+                return 0.0
+            return max(missing / self.rate, 0.001) if self.rate > 0 else 0.1
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Takes `tokens`, waiting for a refill if necessary. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            delay = self._take_or_delay(tokens)
+            if not delay:
+                return waited
+            self._sleep(delay)
+            waited += delay
+
+    async def acquire_async(self, tokens: float = 1.0) -> float:
+        """acquire() for coroutines: waits with asyncio.sleep instead of blocking the loop."""
+        waited = 0.0
+        while True:
+            delay = self._take_or_delay(tokens)
+            if not delay:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def refund(self, tokens: float):
+        """Gives back over-estimated tokens. Negative values charge extra, which later callers wait for."""
+        with self._lock:
+            self._refill(self._clock())
+            self._tokens = min(self.capacity, self._tokens + tokens)
+
+class AIMDLimiter:
+    """Concurrency limit that adapts like TCP congestion control.
+
+    Each success raises the limit by about one slot per round of requests
+    (additive increase); a throttled call halves it (multiplicative decrease),
+    at most once per decrease_interval so one burst of 429s counts once.
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1, initial: float = None, increase: float = 1.0,
+                 decrease: float = 0.5, decrease_interval: float = 1.0, clock=time.monotonic):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = float(initial if initial is not None else self.max_limit)
+        self.increase = increase
+        self.decrease = decrease
+        self.decrease_interval = decrease_interval
+        self._clock = clock
+        self._last_decrease = float("-inf")
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self._in_flight < int(self.limit):
+                self._in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= int(self.limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    async def acquire_async(self, poll_interval: float = 0.05):
+        while not self.try_acquire():
+            await asyncio.sleep(poll_interval)
+
+    def release(self, outcome: str = "success"):
+        """outcome is "success", "throttled" or anything else to leave the limit unchanged."""
+        with self._cond:
+            self._in_flight -= 1
+            if outcome == "success":
+                self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+            elif outcome == "throttled":
+                now = self._clock()
+                if now - self._last_decrease >= self.decrease_interval:
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self._last_decrease = now
+                    logging.warning(f"Throttled: concurrency limit lowered to {int(self.limit)}.")
+            self._cond.notify_all()
+
+def status_code(exc: BaseException):
+    """HTTP status of an OpenAI APIStatusError or googleapiclient HttpError, else None."""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "resp", None), "status", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def _headers(exc: BaseException) -> dict:
+    response = getattr(exc, "response", None) # httpx.Response on OpenAI errors
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        headers = getattr(exc, "resp", None) # httplib2.Response is a dict of lower-cased headers
+    return headers if headers is not None else {}
+
+def retry_after_seconds(exc: BaseException):
+    """Server's hint for how long to wait (retry-after-ms or Retry-After), or None."""
+    headers = _headers(exc)
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+def is_throttled(exc: BaseException) -> bool:
+    """429s, 5xx and Blogger's 403 rate-limit errors, i.e. the server asking us to slow down."""
+    status = status_code(exc)
+    if status == 429 or (status is not None and status >= 500):
+        return True
+    return status == 403 and b"ateLimitExceeded" in (getattr(exc, "content", b"") or b"")
+
+def is_retryable(exc: BaseException) -> bool:
+    """Throttling, timeouts and connection errors are retried; other 4xx responses are not."""
+    from .content_validator import GenerationAborted
+    if isinstance(exc, GenerationAborted):
+        return False # The validator rejected the output; another paid completion would likely be rejected too
+    if is_throttled(exc) or status_code(exc) in (408, 409):
+        return True
+    # Other HTTP errors (bad request, auth) would fail the same way again. Errors
+    # without a status (connection drops, timeouts, bad payloads) keep being retried.
+    return status_code(exc) is None and not isinstance(exc, (ValueError, TypeError, KeyError))
+
+class _Slot:
+    """One call's claim on an endpoint, usable with `with` or `async with`."""
+
+    def __init__(self, endpoint: "Endpoint", requests: float, tokens: float):
+        self.endpoint = endpoint
+        self.requests = requests
+        self.tokens = tokens
+
+    def record_usage(self, actual_tokens: float):
+        """Corrects the up-front token estimate once the response reports real usage."""
+        if self.endpoint.token_bucket is not None and actual_tokens is not None:
+            self.endpoint.token_bucket.refund(self.tokens - actual_tokens)
+
+    def __enter__(self):
+        endpoint = self.endpoint
+        while True:
+            pause = endpoint.paused_until - time.monotonic()
+            if pause <= 0:
+                break
+            time.sleep(pause)
+        endpoint.request_bucket.acquire(self.requests)
+        if endpoint.token_bucket is not None and self.tokens:
+            endpoint.token_bucket.acquire(self.tokens)
+        endpoint.concurrency.acquire()
+        return self
+
+    async def __aenter__(self):
+        endpoint = self.endpoint
+        while True:
+            pause = endpoint.paused_until - time.monotonic()
+            if pause <= 0:
+                break
+            await asyncio.sleep(pause)
+        await endpoint.request_bucket.acquire_async(self.requests)
+        if endpoint.token_bucket is not None and self.tokens:
+            await endpoint.token_bucket.acquire_async(self.tokens)
+        await endpoint.concurrency.acquire_async()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.endpoint.record(exc)
+        return False
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+class Endpoint:
+    """Rate and concurrency budget for one upstream API (e.g. chat, images, Blogger).
+
+    Calls wait for a request token, for their estimated model tokens (if the
+    endpoint has a tokens-per-minute quota) and for an AIMD concurrency slot.
+    A Retry-After hint pauses the whole endpoint, not just the call that got
+    it, so parallel workers back off together instead of retrying in lockstep.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: float = None, max_concurrency: int = 8):
+        self.name = name
+        self.request_bucket = TokenBucket(requests_per_minute, capacity=max(1, max_concurrency))
+        # Allow about ten seconds' worth of tokens in one burst
+        self.token_bucket = TokenBucket(tokens_per_minute, capacity=tokens_per_minute / 6) if tokens_per_minute else None
+        self.concurrency = AIMDLimiter(max_concurrency)
+        self.paused_until = 0.0
+        self.counts = {"success": 0, "throttled": 0, "error": 0}
+        self._lock = threading.Lock()
+
+    def slot(self, requests: float = 1, tokens: float = 0) -> _Slot:
+        return _Slot(self, requests, tokens)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def record(self, exc: BaseException = None):
+        if exc is None:
+            outcome = "success"
+        elif is_throttled(exc):
+            outcome = "throttled"
+            hint = retry_after_seconds(exc)
+            if hint:
+                self.pause(hint)
+                logging.warning(f"{self.name}: server asked to retry after {hint:.1f}s, pausing this endpoint.")
+        else:
+            outcome = "error"
+        with self._lock:
+            self.counts[outcome] += 1
+        self.concurrency.release(outcome)
+
+    def stats(self) -> dict:
+        return {"name": self.name, "concurrency_limit": int(self.concurrency.limit),
+                "in_flight": self.concurrency.in_flight, **self.counts}
+
+_endpoints = {}
+_endpoints_lock = threading.Lock()
+
+# Budgets are per process; lower them when several processes share one API key
+ENDPOINT_SETTINGS = {
+    "chat": {"requests_per_minute": CHAT_REQUESTS_PER_MINUTE, "tokens_per_minute": CHAT_TOKENS_PER_MINUTE,
+             "max_concurrency": CHAT_MAX_CONCURRENCY},
+    "images": {"requests_per_minute": IMAGE_REQUESTS_PER_MINUTE, "max_concurrency": IMAGE_MAX_CONCURRENCY},
+    "blogger": {"requests_per_minute": BLOGGER_REQUESTS_PER_MINUTE, "max_concurrency": BLOGGER_MAX_CONCURRENCY},
+}
+
+def get_endpoint(name: str) -> Endpoint:
+    """Shared Endpoint for name; unknown names get a generous default budget."""
+    endpoint = _endpoints.get(name)
+    if endpoint is None:
+        with _endpoints_lock:
+            endpoint = _endpoints.get(name)
+            if endpoint is None:
+                endpoint = Endpoint(name, **ENDPOINT_SETTINGS.get(name, {"requests_per_minute": 600}))
+                _endpoints[name] = endpoint
+    return endpoint
+
+def endpoint_slot(name: str, requests: float = 1, tokens: float = 0) -> _Slot:
+    """`with endpoint_slot("chat", tokens=n):` around one API call (or `async with`)."""
+    return get_endpoint(name).slot(requests, tokens)
+
+def backoff_delay(attempt: int, exc: BaseException = None, base: float = RETRY_BACKOFF_BASE, cap: float = RETRY_BACKOFF_MAX) -> float:
+    """Exponential backoff with full jitter, never shorter than the server's Retry-After."""
+    delay = random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+    hint = retry_after_seconds(exc) if exc is not None else None
+    if hint is not None:
+        delay = min(cap, hint) + random.uniform(0, base)
+    return delay
+
+def _wait_adaptive(retry_state) -> float:
+    return backoff_delay(retry_state.attempt_number, retry_state.outcome.exception())
+
+def _log_retry(retry_state):
+    from .metrics import registry, add_to_span
+    exc = retry_state.outcome.exception()
+    registry.counter("retries_total", "Retried API calls.").inc(fn=retry_state.fn.__name__)
+    add_to_span(retries=1)
+    logging.warning(f"Retrying {retry_state.fn.__name__} in {retry_state.next_action.sleep:.1f}s "
+                    f"(attempt {retry_state.attempt_number}) after: {exc}")
+
+def adaptive_retry(attempts: int = RETRY_ATTEMPTS):
+    """Drop-in replacement for @retry(stop_after_attempt(3), wait_fixed(2)) on API calls.
+
+    Retries only errors that can succeed on a second try, waits with jittered
+    exponential backoff (or the server's Retry-After) and works on both
+    plain functions and coroutines.
+    """
+    return retry(stop=stop_after_attempt(attempts), wait=_wait_adaptive, retry=retry_if_exception(is_retryable),
+                 before_sleep=_log_retry, reraise=True)
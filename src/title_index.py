@@ -0,0 +1,141 @@
+import sqlite3
+import zlib
+import numpy as np
+from .config import TITLE_SIMILARITY_THRESHOLD
+
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+BANDS = 16 # 16 bands x 4 rows: pairs above ~0.5 Jaccard almost always share a bucket
+ROWS_PER_BAND = NUM_PERM // BANDS
+BUCKETS_PER_QUERY = 900 # SQLite's bound-parameter limit, as in blog_db
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Fixed seed: bucket values are persisted, so the permutations must never change
+_rng = np.random.RandomState(1337)
+_PERM_A = _rng.randint(1, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+_BAND_MIX = _rng.randint(1, 1 << 62, size=ROWS_PER_BAND, dtype=np.uint64) | np.uint64(1)
+_BAND_SALT = np.arange(BANDS, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+
+def shingles(normalized_title: str) -> set[str]:
+    """Character n-grams of a normalized title (see blog_db.normalize_title)."""
+    if len(normalized_title) <= SHINGLE_SIZE:
+        return {normalized_title} if normalized_title else set()
+    return {normalized_title[i:i + SHINGLE_SIZE] for i in range(len(normalized_title) - SHINGLE_SIZE + 1)}
+
+def jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def minhash_signature(shingle_set: set[str]) -> np.ndarray:
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingle_set), dtype=np.uint64, count=len(shingle_set))
+    # (a * x + b) mod p for every permutation and shingle at once, then min per permutation
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME & _MAX_HASH
+    return permuted.min(axis=0)
+
+def lsh_buckets(normalized_title: str) -> list[int]:
+    """One bucket id per LSH band; near-duplicates collide in at least one band."""
+    shingle_set = shingles(normalized_title)
+    if not shingle_set:
+        return []
+    bands = minhash_signature(shingle_set).reshape(BANDS, ROWS_PER_BAND)
+    # Mix each band's rows into one 64-bit value (wrapping arithmetic), salted by band number
+    mixed = (bands * _BAND_MIX).sum(axis=1, dtype=np.uint64) + _BAND_SALT
+    return mixed.view(np.int64).tolist()
+
+def create_index_table(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS title_lsh (
+            bucket INTEGER NOT NULL,
+            blog_id INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_title_lsh_bucket ON title_lsh(bucket)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_title_lsh_blog_id ON title_lsh(blog_id)")
+
+def index_title(conn: sqlite3.Connection, blog_id: int, normalized_title: str):
+    """Adds one stored title to the LSH table. Runs inside the caller's transaction."""
+    conn.executemany(
+        "INSERT INTO title_lsh (bucket, blog_id) VALUES (?, ?)",
+        ((bucket, blog_id) for bucket in lsh_buckets(normalized_title)),
+    )
+
+def rebuild_index(conn: sqlite3.Connection, batch_size: int = 5000):
+    """Re-indexes every row of blogs, streaming it in id order."""
+    conn.execute("DELETE FROM title_lsh")
+    after_id = 0
+    while True:
+        rows = conn.execute("SELECT id, title FROM blogs WHERE id > ? ORDER BY id LIMIT ?", (after_id, batch_size)).fetchall()
+        if not rows:
+            return
+        conn.executemany(
+            "INSERT INTO title_lsh (bucket, blog_id) VALUES (?, ?)",
+            ((bucket, blog_id) for blog_id, title in rows for bucket in lsh_buckets(title)),
+        )
+        after_id = rows[-1][0]
+
+def find_similar(conn: sqlite3.Connection, normalized_title: str, threshold: float = TITLE_SIMILARITY_THRESHOLD,
+                 limit: int = 5, namespace: str = None) -> list[tuple[str, float]]:
+    """Stored titles whose shingle Jaccard similarity to normalized_title is >= threshold.
+
+    LSH narrows 1M titles down to a handful of candidates with one indexed
+    query; the exact Jaccard check then filters false positives. Thresholds
+    much below 0.5 will miss some matches because of the band layout.
+    Only titles in namespace are considered, or every title if it is None.
+    """
+    buckets = lsh_buckets(normalized_title)
+    if not buckets:
+        return []
+    placeholders = ",".join("?" * len(buckets))
+    query = f"SELECT DISTINCT b.title FROM title_lsh l JOIN blogs b ON b.id = l.blog_id WHERE l.bucket IN ({placeholders})"
+    params = list(buckets)
+    if namespace is not None:
+        # Unary + keeps SQLite from driving the query off the (unselective) namespace index instead of the buckets
+        query += " AND +b.namespace = ?"
+        params.append(namespace)
+    candidates = conn.execute(query, params).fetchall()
+    query_shingles = shingles(normalized_title)
+    scored = []
+    for (title,) in candidates:
+        score = jaccard(query_shingles, shingles(title))
+        if score >= threshold:
+            scored.append((title, score))
+    scored.sort(key=lambda pair: pair[1], reverse=True)
+    return scored[:limit]
+
+def find_similar_many(conn: sqlite3.Connection, normalized_titles, threshold: float = TITLE_SIMILARITY_THRESHOLD,
+                      namespace: str = None) -> dict[str, list[tuple[str, float]]]:
+    """find_similar for several titles with one bucket query (per BUCKETS_PER_QUERY buckets) instead of one each.
+
+    Returns {title: [(stored_title, similarity), ...]} for the titles with matches.
+    """
+    buckets_by_title = {title: lsh_buckets(title) for title in dict.fromkeys(normalized_titles)}
+    titles_by_bucket = {}
+    for title, buckets in buckets_by_title.items():
+        for bucket in buckets:
+            titles_by_bucket.setdefault(bucket, set()).add(title)
+    all_buckets = list(titles_by_bucket)
+    candidates = {}
+    for start in range(0, len(all_buckets), BUCKETS_PER_QUERY):
+        chunk = all_buckets[start:start + BUCKETS_PER_QUERY]
+        query = f"SELECT DISTINCT l.bucket, b.title FROM title_lsh l JOIN blogs b ON b.id = l.blog_id WHERE l.bucket IN ({','.join('?' * len(chunk))})"
+        params = list(chunk)
+        if namespace is not None:
+            query += " AND +b.namespace = ?" # See find_similar
+            params.append(namespace)
+        for bucket, stored in conn.execute(query, params):
+            for title in titles_by_bucket[bucket]:
+                candidates.setdefault(title, set()).add(stored)
+    matches = {}
+    for title, stored_titles in candidates.items():
+        query_shingles = shingles(title)
+        scored = []
+        for stored in stored_titles:
+            score = jaccard(query_shingles, shingles(stored))
+            if score >= threshold:
+                scored.append((stored, score))
+        if scored:
+            matches[title] = sorted(scored, key=lambda pair: pair[1], reverse=True)
+    return matches
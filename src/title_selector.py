@@ -0,0 +1,159 @@
+import functools
+import logging
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+from .blog_db import normalize_title, bulk_blog_exists, bulk_find_near_duplicates
+from .metrics import registry, span
+from .title_index import shingles
+from .config import MAX_TITLE_RETRIES, TITLE_RANK_WEIGHTS
+
+TITLE_IDEAL_CHARS = (40, 60) # Search results show roughly the first 60 characters of a title
+TITLE_MIN_CHARS = 15 # Shorter candidates (stray fragments of the completion) are never used, except the topic itself
+TOPIC_KEYWORDS = 8 # Keywords taken from the topic (or source text) for the SEO score
+ATTEMPT_BUCKETS = (1, 2, 3, 4, 5, 10)
+_WORD_RE = re.compile(r"[a-z0-9]+")
+# The same recent titles are compared against every candidate of every post in a batch
+_cached_shingles = functools.lru_cache(maxsize=20000)(shingles)
+
+@dataclass
+class TitleSelection:
+    """Outcome of choose_title: the chosen title ("" if none) and what it took to find it."""
+    title: str = ""
+    score: float = 0.0
+    attempts: int = 0   # Title requests made
+    candidates: int = 0 # Titles generated across all attempts
+    rejected: dict = field(default_factory=dict) # Candidate -> reason
+
+def topic_keywords(topic: str, limit: int = TOPIC_KEYWORDS) -> set[str]:
+    """The topic's most frequent non-stopword words; for a short trending topic, all of them."""
+    from .topic_ranker import STOPWORDS
+    words = [word for word in _WORD_RE.findall(topic.lower()) if word not in STOPWORDS and len(word) > 1]
+    return {word for word, _ in Counter(words).most_common(limit)}
+
+def length_score(title: str, ideal=TITLE_IDEAL_CHARS) -> float:
+    low, high = ideal
+    if len(title) < low:
+        return len(title) / low
+    if len(title) > high:
+        return max(0.0, 1.0 - (len(title) - high) / high)
+    return 1.0
+
+def keyword_score(title: str, keywords: set[str]) -> float:
+    if not keywords:
+        return 1.0
+    return len(keywords & set(_WORD_RE.findall(title.lower()))) / len(keywords)
+
+def novelty_score(title_shingles: set, avoid_shingles) -> float:
+    """1 - the highest Jaccard similarity to any avoided title (the union size is derived, not built)."""
+    best = 0.0
+    for other in avoid_shingles:
+        shared = len(title_shingles & other)
+        if shared:
+            best = max(best, shared / (len(title_shingles) + len(other) - shared))
+    return 1.0 - best
+
+def rank_titles(topic: str, candidates, titles_to_avoid=(), exists_fn=bulk_blog_exists,
+                near_duplicates_fn=bulk_find_near_duplicates, weights: dict = TITLE_RANK_WEIGHTS) -> tuple[list[dict], dict]:
+    """Filters candidate titles and scores the rest, best first.
+
+    Stored titles are found with one bulk_exists query and reworded ones
+    with one LSH lookup for all candidates. Survivors are scored on length,
+    share of topic keywords they contain and novelty (1 - the highest
+    similarity to any title in titles_to_avoid). Returns (ranked, rejected),
+    where ranked is [{"title", "normalized", "score", "length", "keywords", "novelty"}]
+    and rejected maps each dropped candidate to why it was dropped.
+    """
+    avoid = {normalize_title(title) for title in titles_to_avoid}
+    topic_normalized = normalize_title(topic) # The fallback title for short topics like "iPhone 17"
+    rejected = {}
+    unique = {}
+    for title in candidates:
+        normalized = normalize_title(title)
+        if not normalized:
+            rejected[title] = "empty"
+        elif len(title) < TITLE_MIN_CHARS and normalized != topic_normalized:
+            rejected[title] = "too_short"
+        elif normalized in unique:
+            rejected[title] = "repeated"
+        elif normalized in avoid:
+            rejected[title] = "avoided"
+        else:
+            unique[normalized] = title
+
+    existing = exists_fn(list(unique)) if unique else set()
+    for normalized in existing:
+        rejected[unique.pop(normalized)] = "exists"
+    near_duplicates = near_duplicates_fn(list(unique)) if unique else {}
+    for normalized in near_duplicates:
+        rejected[unique.pop(normalized)] = "near_duplicate"
+
+    keywords = topic_keywords(topic)
+    avoid_shingles = [_cached_shingles(title) for title in avoid]
+    ranked = []
+    for normalized, title in unique.items():
+        title_shingles = shingles(normalized)
+        parts = {
+            "length": length_score(title),
+            "keywords": keyword_score(title, keywords),
+            "novelty": novelty_score(title_shingles, avoid_shingles) if title_shingles else 1.0,
+        }
+        score = sum(weights.get(name, 0.0) * value for name, value in parts.items())
+        ranked.append({"title": title, "normalized": normalized, "score": round(score, 4),
+                       **{name: round(value, 4) for name, value in parts.items()}})
+    ranked.sort(key=lambda entry: entry["score"], reverse=True)
+    return ranked, rejected
+
+def choose_title(topic: str, titles_to_avoid=(), generate_fn=None, claim_fn=None, max_attempts: int = MAX_TITLE_RETRIES,
+                 exists_fn=bulk_blog_exists, near_duplicates_fn=bulk_find_near_duplicates) -> TitleSelection:
+    """Generates candidate titles and returns the best unique one, asking again only if none survive.
+
+    generate_fn(topic, titles_to_avoid) returns a list of candidates (a single
+    title string also works) and defaults to blog_writer.generate_title_candidates.
+    claim_fn(title), if given, reserves the title and returns False if another
+    worker holds it, in which case the next best candidate is tried.
+    Rejected candidates are added to the avoid list of the next request.
+    """
+    if generate_fn is None:
+        from .blog_writer import generate_title_candidates as generate_fn
+    avoid = list(titles_to_avoid)
+    selection = TitleSelection()
+    unused = 0
+    with span("title.select") as select_span:
+        for attempt in range(1, max_attempts + 1):
+            selection.attempts = attempt
+            candidates = generate_fn(topic, avoid)
+            if isinstance(candidates, str):
+                candidates = [candidates]
+            selection.candidates += len(candidates)
+            ranked, rejected = rank_titles(topic, candidates, avoid, exists_fn, near_duplicates_fn)
+            for position, entry in enumerate(ranked):
+                if claim_fn is None or claim_fn(entry["title"]):
+                    selection.title, selection.score = entry["title"], entry["score"]
+                    unused += len(ranked) - position - 1
+                    break
+                rejected[entry["title"]] = "claimed"
+            selection.rejected.update(rejected)
+            if selection.title:
+                break
+            reasons = ", ".join(f"{reason}: {count}" for reason, count in Counter(rejected.values()).items())
+            logging.warning(f"No unique title among {len(candidates)} candidates for '{topic[:80]}' "
+                            f"(attempt {attempt}/{max_attempts}; {reasons}).")
+            avoid.extend(rejected) # As written, since the list also goes into the next prompt
+        select_span.set(attempts=selection.attempts, candidates=selection.candidates, rejected=len(selection.rejected),
+                        chosen=bool(selection.title))
+
+    outcomes = registry.counter("title_candidates_total", "Generated title candidates, by outcome.")
+    for reason, count in Counter(selection.rejected.values()).items():
+        outcomes.inc(count, outcome=reason)
+    if selection.title:
+        outcomes.inc(outcome="chosen")
+    if unused:
+        outcomes.inc(unused, outcome="unused")
+    registry.histogram("title_attempts", "Title requests per post.", ATTEMPT_BUCKETS).observe(
+        selection.attempts, result="chosen" if selection.title else "exhausted")
+    if selection.title:
+        logging.info(f"Chose title '{selection.title}' (score {selection.score:.2f}) from {selection.candidates} candidates "
+                     f"in {selection.attempts} request(s); {len(selection.rejected)} rejected.")
+    return selection
@@ -0,0 +1,127 @@
+import logging
+import re
+import zlib
+import numpy as np
+from scipy import sparse
+from .config import TOPIC_HASH_FEATURES, TOPIC_MAX_DOC_FREQ
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+MIN_DOC_FREQ_CUTOFF = 10 # Small histories keep every term; the frequency cutoff only applies past this count
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "with", "how", "what", "why",
+    "is", "are", "your", "you", "my", "best", "top", "new", "vs", "by", "from", "at", "it",
+}
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase word unigrams plus adjacent bigrams, minus stopwords."""
+    words = [word for word in _TOKEN_RE.findall(text.lower()) if word not in STOPWORDS]
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+def hash_vectorize(texts, n_features: int = TOPIC_HASH_FEATURES) -> sparse.csr_matrix:
+    """Hashed binary bag-of-words, one row per text.
+
+    Topics are a handful of words, so term presence is all that matters; rows
+    are built already sorted and de-duplicated, which lets SciPy skip its own
+    canonicalization pass.
+    """
+    indptr = [0]
+    indices = []
+    for text in texts:
+        indices.extend(sorted({zlib.crc32(token.encode("utf-8")) % n_features for token in tokenize(text)}))
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.float32)
+    matrix = sparse.csr_matrix((data, np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+                               shape=(len(indptr) - 1, n_features))
+    matrix.has_canonical_format = True
+    return matrix
+
+def _row_max_and_argmax(matrix: sparse.csr_matrix) -> tuple[np.ndarray, np.ndarray]:
+    """Per-row maximum and its column (-1 for empty rows), without Python loops."""
+    n_rows = matrix.shape[0]
+    row_max = np.zeros(n_rows, dtype=np.float32)
+    argmax = np.full(n_rows, -1, dtype=np.int64)
+    counts = np.diff(matrix.indptr)
+    nonempty = counts > 0
+    if not nonempty.any():
+        return row_max, argmax
+    row_max[nonempty] = np.maximum.reduceat(matrix.data, matrix.indptr[:-1][nonempty])
+    row_of_entry = np.repeat(np.arange(n_rows), counts)
+    hits = np.flatnonzero(matrix.data == row_max[row_of_entry])
+    rows, first = np.unique(row_of_entry[hits], return_index=True)
+    argmax[rows] = matrix.indices[hits[first]]
+    return row_max, argmax
+
+def _l2_normalize(matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms).dot(matrix).tocsr()
+
+class TopicRanker:
+    """Ranks candidate topics by how different they are from everything already posted.
+
+    Candidates and history are turned into hashed TF-IDF vectors and compared
+    with a single sparse matrix product, so scoring thousands of trending
+    topics against the whole post history takes one pass instead of a nested
+    Python loop. Terms that appear in more than max_doc_freq of all documents
+    (e.g. "ai" on an AI blog) are dropped so they don't make everything look
+    like a repeat.
+    """
+
+    def __init__(self, history, n_features: int = TOPIC_HASH_FEATURES, max_doc_freq: float = TOPIC_MAX_DOC_FREQ):
+        self.history = list(history)
+        self.n_features = n_features
+        self.max_doc_freq = max_doc_freq
+        self._history_counts = hash_vectorize(self.history, n_features)
+        self._history_doc_freq = np.bincount(self._history_counts.indices, minlength=n_features)
+
+    def _tfidf(self, counts: sparse.csr_matrix, idf: np.ndarray) -> sparse.csr_matrix:
+        weighted = counts.copy()
+        weighted.data = weighted.data * idf[weighted.indices]
+        weighted.eliminate_zeros()
+        return _l2_normalize(weighted)
+
+    def rank(self, candidates, chunk_size: int = 2000) -> list[dict]:
+        """Returns [{"topic", "novelty", "closest"}] sorted by novelty, most novel first.
+
+        novelty is 1 - the highest cosine similarity to any past topic. Ties keep
+        the candidates' original (trend) order.
+        """
+        candidates = list(candidates)
+        if not candidates:
+            return []
+        candidate_counts = hash_vectorize(candidates, self.n_features)
+        doc_freq = self._history_doc_freq + np.bincount(candidate_counts.indices, minlength=self.n_features)
+        total_docs = len(self.history) + len(candidates)
+        idf = np.log((1 + total_docs) / (1 + doc_freq)).astype(np.float32) + 1.0
+        idf[(doc_freq > self.max_doc_freq * total_docs) & (doc_freq >= MIN_DOC_FREQ_CUTOFF)] = 0.0
+
+        candidate_vectors = self._tfidf(candidate_counts, idf)
+        best_similarity = np.zeros(len(candidates), dtype=np.float32)
+        closest = np.full(len(candidates), -1, dtype=np.int64)
+        if self.history:
+            history_t = self._tfidf(self._history_counts, idf).T.tocsc()
+            # Chunk the candidates so the similarity matrix never gets too large
+            for start in range(0, len(candidates), chunk_size):
+                similarity = candidate_vectors[start:start + chunk_size].dot(history_t).tocsr()
+                best_similarity[start:start + chunk_size], closest[start:start + chunk_size] = _row_max_and_argmax(similarity)
+
+        novelty = 1.0 - np.clip(best_similarity, 0.0, 1.0)
+        order = np.argsort(-novelty, kind="stable")
+        return [
+            {
+                "topic": candidates[i],
+                "novelty": round(float(novelty[i]), 4),
+                "closest": self.history[closest[i]] if best_similarity[i] > 0 else None,
+            }
+            for i in order
+        ]
+
+def rank_topics(candidates, history) -> list[dict]:
+    """Convenience wrapper around TopicRanker; logs the chosen topic for tuning."""
+    ranker = TopicRanker(history)
+    ranked = ranker.rank(candidates)
+    if ranked:
+        best = ranked[0]
+        logging.info(f"Topic ranking: chose '{best['topic']}' (novelty {best['novelty']:.3f}, closest past topic: {best['closest']!r}) "
+                     f"from {len(ranked)} candidates against {len(ranker.history)} past topics.")
+    return ranked
@@ -1,18 +1,190 @@
-from pytrends.request import TrendReq
-from pytrends import exceptions
+import json
+import logging
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from .rate_limit import TokenBucket
+from .metrics import span, traced, run_in_context
+from .config import (
+    TRENDS_SEEDS,
+    TRENDS_GEOS,
+    TRENDS_HL,
+    TRENDS_TZ,
+    TRENDS_REQUESTS_PER_MINUTE,
+    TRENDS_WORKERS,
+    TRENDS_SNAPSHOT_PATH,
+    TRENDS_SNAPSHOT_TTL,
+)
 
-def get_trending_topics():
-    try:
-        pytrends = TrendReq(hl='en-IN', tz=330)
-        pytrends.build_payload(kw_list=["AI tools", "tech", "earn money online"])
-        data = pytrends.related_queries()
-        time.sleep(5) # Add a delay to avoid rate limiting
+PYTRENDS_MAX_KEYWORDS = 5 # build_payload accepts at most 5 keywords
+FALLBACK_TOPICS = ["AI Automation", "Data Science Trends", "Machine Learning Applications", "n8n Workflows", "Future of AI"]
+
+class PytrendsFetcher:
+    """Network layer: fetches related queries for one keyword batch in one region.
+
+    Returns {keyword: {"top": [query, ...], "rising": [query, ...]}} so results
+    are plain JSON and can be recorded and replayed in tests. Any callable with
+    the same signature can be passed to TrendsCollector instead.
+    """
+
+    def __init__(self, hl: str = TRENDS_HL, tz: int = TRENDS_TZ):
+        self.hl = hl
+        self.tz = tz
+        self._local = threading.local() # TrendReq keeps a requests session, so one per thread
+
+    def _client(self):
+        if getattr(self._local, "client", None) is None:
+            from pytrends.request import TrendReq # pytrends pulls in pandas, so load it on first fetch
+            self._local.client = TrendReq(hl=self.hl, tz=self.tz)
+        return self._local.client
+
+    def __call__(self, keywords: list[str], geo: str = "") -> dict:
+        client = self._client()
+        client.build_payload(kw_list=keywords, geo=geo)
+        data = client.related_queries()
+        related = {}
+        for keyword, frames in data.items():
+            related[keyword] = {
+                kind: [row["query"] for row in frames[kind].to_dict("records")] if frames.get(kind) is not None else []
+                for kind in ("top", "rising")
+            }
+        return related
+
+class TrendsCollector:
+    """Collects trending queries for many seed keywords across several regions.
+
+    Seeds are packed into pytrends' 5-keyword payloads and the batches are
+    fetched in parallel, paced by a token bucket rather than fixed sleeps.
+    The merged result is written to a timestamped snapshot so repeated runs
+    within snapshot_ttl read it from disk instead of hitting Google Trends.
+    """
+
+    def __init__(self, seeds=TRENDS_SEEDS, geos=TRENDS_GEOS, fetcher=None, rate_limiter: TokenBucket = None,
+                 snapshot_path: str = TRENDS_SNAPSHOT_PATH, snapshot_ttl: float = TRENDS_SNAPSHOT_TTL,
+                 max_workers: int = TRENDS_WORKERS, include_rising: bool = True):
+        self.seeds = list(seeds)
+        self.geos = list(geos) or [""]
+        self.fetcher = fetcher or PytrendsFetcher()
+        self.rate_limiter = rate_limiter or TokenBucket(TRENDS_REQUESTS_PER_MINUTE, capacity=max_workers)
+        self.snapshot_path = snapshot_path
+        self.snapshot_ttl = snapshot_ttl
+        self.max_workers = max(1, max_workers)
+        self.include_rising = include_rising
+
+    def batches(self) -> list[tuple[list[str], str]]:
+        keyword_batches = [self.seeds[i:i + PYTRENDS_MAX_KEYWORDS] for i in range(0, len(self.seeds), PYTRENDS_MAX_KEYWORDS)]
+        return [(keywords, geo) for geo in self.geos for keywords in keyword_batches]
+
+    def _snapshot_key(self) -> dict:
+        return {"seeds": self.seeds, "geos": self.geos, "include_rising": self.include_rising}
+
+    def _read_snapshot(self):
+        """The snapshot dict if it is fresh and was built from the same seeds, else None."""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return None
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable trends snapshot: {e}")
+            return None
+        if snapshot.get("key") != self._snapshot_key():
+            return None
+        if time.time() - snapshot.get("created_at", 0) > self.snapshot_ttl:
+            return None
+        return snapshot
+
+    def load_snapshot(self):
+        """Returns the cached topics if the snapshot is fresh and was built from the same seeds."""
+        snapshot = self._read_snapshot()
+        return snapshot["topics"] if snapshot else None
+
+    def save_snapshot(self, topics: list[str], results: list = None):
+        if not self.snapshot_path:
+            return
+        if os.path.dirname(self.snapshot_path):
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"created_at": time.time(), "key": self._snapshot_key(), "topics": topics, "results": results}, f)
+        os.replace(tmp_path, self.snapshot_path) # Atomic, so readers never see half a file
+
+    def _fetch_batch(self, batch):
+        keywords, geo = batch
+        self.rate_limiter.acquire()
+        try:
+            with span("trends.batch", geo=geo, keywords=len(keywords)):
+                return self.fetcher(keywords, geo)
+        except Exception as e:
+            from pytrends import exceptions
+            if isinstance(e, exceptions.TooManyRequestsError):
+                logging.warning(f"Rate limit hit for Google Trends batch {keywords} (geo '{geo}').")
+            else:
+                logging.error(f"Error fetching Google Trends batch {keywords} (geo '{geo}'): {e}")
+            return None
+
+    def fetch_results(self) -> list:
+        """Raw related queries per batch, in batches() order (None for failed batches)."""
+        batches = self.batches()
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches)) or 1) as executor:
+            return list(executor.map(run_in_context(self._fetch_batch), batches))
+
+    def merge(self, results, seeds=None, geos=None) -> list[str]:
+        """Top queries first, then rising, de-duplicated; optionally only for some seeds and regions."""
+        if not any(result is not None for result in results):
+            return []
+        seeds = {seed.lower() for seed in seeds} if seeds is not None else None
+        wanted = [
+            {keyword: related for keyword, related in (result or {}).items() if seeds is None or keyword.lower() in seeds}
+            for (_, geo), result in zip(self.batches(), results)
+            if geos is None or geo in geos
+        ]
+        kinds = ("top", "rising") if self.include_rising else ("top",)
+        seen = set()
         queries = []
-        for topic in data.values():
-            if topic['top'] is not None:
-                queries += [q['query'] for q in topic['top'].to_dict('records')]
+        for kind in kinds:
+            for result in wanted:
+                for related in result.values():
+                    for query in related.get(kind, []):
+                        if query.lower() not in seen:
+                            seen.add(query.lower())
+                            queries.append(query)
         return queries
-    except exceptions.TooManyRequestsError:
-        print("Rate limit hit for Google Trends. Using fallback keywords.")
-        return ["AI Automation", "Data Science Trends", "Machine Learning Applications", "n8n Workflows", "Future of AI"]
+
+    def fetch(self) -> list[str]:
+        """Fetches all batches and merges them."""
+        return self.merge(self.fetch_results())
+
+    def collect_results(self, use_snapshot: bool = True) -> list:
+        """Per-batch results from a fresh snapshot, or fetched (and snapshotted) otherwise."""
+        if use_snapshot:
+            snapshot = self._read_snapshot()
+            if snapshot and snapshot.get("results") is not None:
+                logging.info(f"Using trends snapshot from {self.snapshot_path}.")
+                return snapshot["results"]
+        results = self.fetch_results()
+        failed = sum(result is None for result in results)
+        topics = self.merge(results)
+        if failed:
+            # A partial snapshot would hide the missing seeds for the whole TTL; the next run fetches again
+            logging.warning(f"{failed} of {len(results)} Google Trends batches failed. Not saving a snapshot.")
+        elif topics:
+            self.save_snapshot(topics, results)
+        return results
+
+    def collect(self, use_snapshot: bool = True) -> list[str]:
+        if use_snapshot:
+            topics = self.load_snapshot()
+            if topics is not None:
+                logging.info(f"Using trends snapshot from {self.snapshot_path} ({len(topics)} topics).")
+                return topics
+        return self.merge(self.collect_results(use_snapshot=False))
+
+@traced("trends.collect")
+def get_trending_topics(use_snapshot: bool = True):
+    topics = TrendsCollector().collect(use_snapshot)
+    if not topics:
+        logging.warning("No data from Google Trends (rate limit or errors). Using fallback keywords.")
+        return FALLBACK_TOPICS
+    return topics
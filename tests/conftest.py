@@ -0,0 +1,15 @@
+import os
+
+# Set before src.config is imported: no span database, no cached completions
+os.environ.setdefault("METRICS_SINK", "none")
+os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+os.environ.setdefault("RETRY_BACKOFF_BASE", "0.01") # Retries in tests shouldn't wait seconds
+os.environ.setdefault("BLOGGER_REQUESTS_PER_MINUTE", "60000") # Local mock servers need no pacing
+
+import pytest
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    """Runs every test from an empty directory, so data/ (databases, caches, snapshots) starts fresh."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / "data"
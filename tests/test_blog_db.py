@@ -0,0 +1,61 @@
+import sqlite3
+
+import pytest
+
+from src.blog_db import MIGRATIONS, BlogRepository, normalize_title
+
+BASELINE_TITLES = ["10 AI Tools That Save Hours Every Week", "How to Earn Money Online in 2024", "The Future of Data Science"]
+
+def make_baseline_db(path):
+    """A blogs.db as the original single-table version left it, with a gap in the ids."""
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE blogs (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL UNIQUE, status TEXT NOT NULL)")
+    for title in ["Deleted Draft"] + BASELINE_TITLES:
+        conn.execute("INSERT INTO blogs (title, status) VALUES (?, 'posted')", (normalize_title(title),))
+    conn.execute("DELETE FROM blogs WHERE id = 1")
+    conn.commit()
+    conn.close()
+
+def snapshot(repository):
+    with repository.connection() as conn:
+        return {
+            "schema": conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY name").fetchall(),
+            "blogs": conn.execute("SELECT * FROM blogs ORDER BY id").fetchall(),
+            "title_lsh": conn.execute("SELECT COUNT(*) FROM title_lsh").fetchone()[0],
+        }
+
+@pytest.fixture
+def repository(tmp_path):
+    path = str(tmp_path / "blogs.db")
+    make_baseline_db(path)
+    repository = BlogRepository(path)
+    yield repository
+    repository.close()
+
+def test_baseline_database_is_migrated_in_place(repository):
+    assert repository.schema_version() == 0
+    repository.migrate()
+    assert repository.schema_version() == len(MIGRATIONS)
+
+    with repository.connection() as conn:
+        rows = conn.execute("SELECT id, namespace, title, status FROM blogs ORDER BY id").fetchall()
+        indexed_ids = {row[0] for row in conn.execute("SELECT DISTINCT blog_id FROM title_lsh")}
+    assert rows == [(id_, "", normalize_title(title), "posted") for id_, title in zip((2, 3, 4), BASELINE_TITLES)]
+    assert indexed_ids == {2, 3, 4}
+    assert repository.exists(normalize_title(BASELINE_TITLES[0]))
+    near = repository.bulk_find_near_duplicates([normalize_title("How to Earn Money Online in 2025")])
+    assert [title for title, _ in near[normalize_title("How to Earn Money Online in 2025")]] == [normalize_title(BASELINE_TITLES[1])]
+
+    # Titles are unique per namespace after the rebuild, and new ids continue after the old ones
+    assert not repository.add(normalize_title(BASELINE_TITLES[0]))
+    assert repository.scoped("blog-2").add(normalize_title(BASELINE_TITLES[0]))
+    with repository.connection() as conn:
+        assert conn.execute("SELECT MAX(id) FROM blogs").fetchone()[0] == 5
+
+def test_migrate_is_idempotent(repository):
+    repository.migrate()
+    before = snapshot(repository)
+    repository.migrate()
+    repository.init_db()
+    assert snapshot(repository) == before
+    assert repository.schema_version() == len(MIGRATIONS)
@@ -0,0 +1,31 @@
+import json
+
+import pytest
+
+from benchmarks.mock_services import MockBloggerServer, fake_blogger_token
+from src.blogger_api import SCOPES, BloggerClient
+
+@pytest.fixture
+def blogger_server():
+    with MockBloggerServer(latency="0") as server:
+        yield server
+
+def make_client(server, batch_size):
+    from google.oauth2.credentials import Credentials
+    credentials = Credentials.from_authorized_user_info(json.loads(fake_blogger_token()), SCOPES)
+    return BloggerClient(credentials=credentials, api_endpoint=server.url, batch_size=batch_size)
+
+def test_insert_posts_sends_batch_size_posts_per_request(blogger_server):
+    posts = [{"title": f"Post {i}", "content": f"<p>{i}</p>"} for i in range(7)]
+    arrived = []
+    results = make_client(blogger_server, batch_size=3).insert_posts(
+        posts, "blog", callback=lambda index, response, error: arrived.append(index))
+    assert blogger_server.counts == {"blogger_batch": 3, "blogger_insert": 7}
+    assert [result["title"] for result in results] == [post["title"] for post in posts]
+    assert all(result["error"] is None and result["response"]["id"] for result in results)
+    assert sorted(arrived) == list(range(7))
+
+def test_insert_post_makes_one_request(blogger_server):
+    response = make_client(blogger_server, batch_size=3).insert_post("Single", "<p>Body</p>", "blog")
+    assert response["title"] == "Single"
+    assert blogger_server.counts == {"blogger_insert": 1}
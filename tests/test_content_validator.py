@@ -0,0 +1,53 @@
+import pytest
+
+from src.content_validator import FORBIDDEN_PATTERNS, BlogStreamValidator, GenerationAborted
+
+@pytest.mark.parametrize("text", [
+    "I can't help but wonder why this works.",
+    "I cannot help noticing the trend.",
+    "Honestly, I can't write about this topic without smiling.",
+    "I won't help you waste money on tools you don't need.",
+])
+def test_first_person_idioms_are_not_refusals(text):
+    assert not FORBIDDEN_PATTERNS["model refusal"].search(text)
+
+@pytest.mark.parametrize("text", [
+    "As an AI language model, I do not have opinions.",
+    "I'm sorry, but I can't help with that request.",
+    "I cannot fulfill this request.",
+    "I am unable to assist with your request.",
+])
+def test_refusals_are_caught(text):
+    assert FORBIDDEN_PATTERNS["model refusal"].search(text)
+
+@pytest.mark.parametrize("text", [
+    "We shipped 1234567890 units last year.",
+    "Prices ranged between 100 200 3000 rupees.",
+    "ISBN 978-316-1484100",
+    "The event has timestamp 1700000000 ms.",
+    "Version 2.1.3 shipped in 2024-2025 with 300-400 fixes.",
+])
+def test_numbers_are_not_phone_numbers(text):
+    assert not FORBIDDEN_PATTERNS["phone number"].search(text)
+
+@pytest.mark.parametrize("text", [
+    "Reach us at (555) 123-4567 today.",
+    "Our office: 555-123-4567.",
+    "Dial +1 555 123 4567 for support.",
+    "WhatsApp +91 98765 43210",
+    "Call us at 5551234567.",
+    "Tel: 555 123 4567",
+])
+def test_phone_numbers_are_caught(text):
+    assert FORBIDDEN_PATTERNS["phone number"].search(text)
+
+def test_idiom_split_across_chunks_does_not_abort():
+    validator = BlogStreamValidator()
+    for chunk in ("<h2>Why it works</h2><p>I can", "'t help but wonder why 1234567890 ", "people tried it.</p>"):
+        validator.feed(chunk)
+    validator.finish()
+
+def test_refusal_aborts_the_stream():
+    validator = BlogStreamValidator()
+    with pytest.raises(GenerationAborted, match="model refusal"):
+        validator.feed("I'm sorry, but I can't help with that request.")
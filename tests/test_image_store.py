@@ -0,0 +1,89 @@
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.mock_services import make_png
+from src.image_store import ImageStore, LocalImageBackend, transcode
+
+BASE_URL = "https://img.example.com"
+
+class StubImageApi:
+    """Stands in for DALL-E (prompt -> URL) and the download of that URL."""
+
+    def __init__(self):
+        self.generated = []
+        self.downloads = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt):
+        with self._lock:
+            self.generated.append(prompt)
+        return f"https://dalle.example.com/{len(self.generated)}.png"
+
+    def download(self, url):
+        with self._lock:
+            self.downloads += 1
+        return make_png(200, 150, seed=0)
+
+@pytest.fixture
+def image_api():
+    return StubImageApi()
+
+@pytest.fixture
+def store(tmp_path, image_api):
+    store = ImageStore(cache_dir=str(tmp_path / "images"), backend=LocalImageBackend(str(tmp_path / "public"), BASE_URL),
+                       downloader=image_api.download, transcoder=lambda data: transcode(data, sizes=[100, 320]))
+    yield store
+    store.close()
+
+def test_transcode_resizes_without_upscaling():
+    from PIL import Image
+    variants = transcode(make_png(800, 600), sizes=[320, 640, 1024], formats=["webp", "jpeg"])
+    assert [(fmt, width, height) for fmt, width, height, _ in variants] == [
+        ("webp", 320, 240), ("jpeg", 320, 240), ("webp", 640, 480), ("jpeg", 640, 480), ("webp", 800, 600), ("jpeg", 800, 600)]
+    for fmt, width, height, data in variants:
+        with Image.open(io.BytesIO(data)) as image:
+            assert image.format == fmt.upper() and image.size == (width, height)
+
+def test_local_backend_needs_a_public_url(tmp_path):
+    with pytest.raises(ValueError):
+        LocalImageBackend(str(tmp_path), base_url="")
+    assert LocalImageBackend(str(tmp_path), base_url=BASE_URL + "/").publish("ab/x.jpg", b"x", "image/jpeg") == BASE_URL + "/ab/x.jpg"
+    assert (tmp_path / "ab" / "x.jpg").read_bytes() == b"x"
+    assert LocalImageBackend(str(tmp_path), base_url="", file_urls=True).publish("ab/x.jpg", b"x", "image/jpeg").startswith("file://")
+
+def test_stored_image_is_published_in_every_size(store, image_api, tmp_path):
+    stored = store.get_or_create("A watercolor lighthouse at dawn", image_api.generate)
+    assert stored.url.startswith(BASE_URL) and stored.url.endswith("-200.jpg")
+    assert (stored.width, stored.height) == (200, 150)
+    assert sorted((v["format"], v["width"]) for v in stored.variants) == [("jpeg", 100), ("jpeg", 200), ("webp", 100), ("webp", 200)]
+    assert len(list((tmp_path / "public").rglob("*.*"))) == 4
+    html = stored.to_html('Lighthouse "at dawn"')
+    assert html.startswith('<picture><source type="image/webp"') and f"{BASE_URL}/" in html and "&quot;at dawn&quot;" in html
+    assert store.find_by_url(stored.url) == stored
+    assert store.find_by_url("https://dalle.example.com/1.png") is None
+
+def test_repeated_prompts_reuse_the_stored_image(store, image_api):
+    first = store.get_or_create("A watercolor lighthouse at dawn", image_api.generate)
+    assert store.get_or_create("a watercolor lighthouse, at dawn!", image_api.generate) == first
+    assert image_api.generated == ["A watercolor lighthouse at dawn"]
+
+    # Without reuse the image is generated again, but identical bytes are stored once
+    assert store.get_or_create("A watercolor lighthouse at dawn", image_api.generate, reuse=False).digest == first.digest
+    assert len(image_api.generated) == 2
+
+def test_concurrent_requests_for_one_prompt_generate_once(store, image_api):
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        images = list(executor.map(lambda _: store.get_or_create("A neon city in the rain", image_api.generate), range(4)))
+    assert len({image.digest for image in images}) == 1
+    assert image_api.generated == ["A neon city in the rain"]
+    assert image_api.downloads == 1
+    assert store._key_locks == {} # Per-key locks are dropped once nobody holds them
+
+def test_key_locks_do_not_accumulate(store, image_api):
+    for index in range(20):
+        store.get_or_create(f"A lighthouse, variation {index}", image_api.generate, reuse=False)
+    assert len(image_api.generated) == 20
+    assert store._key_locks == {}
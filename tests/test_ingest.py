@@ -0,0 +1,112 @@
+import io
+import json
+import threading
+import time
+
+from src.blog_db import normalize_title
+from src.ingest import BulkIngestor, open_results, read_finished, split_to_budget
+from src.prompt_budget import count_tokens
+
+def test_split_to_budget_keeps_chunks_within_budget():
+    text = "\n\n".join(f"Paragraph {i} " + "word " * 40 for i in range(20))
+    chunks = split_to_budget(text, max_tokens=100, max_chunks=50)
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 100 for chunk in chunks)
+    assert chunks[0].startswith("Paragraph 0")
+    assert split_to_budget(text, max_tokens=100) == chunks[:1]
+
+def test_split_to_budget_cuts_long_paragraph():
+    text = "word " * 1000
+    chunks = split_to_budget(text, max_tokens=50, max_chunks=3)
+    assert len(chunks) == 3
+    assert all(0 < count_tokens(chunk) <= 50 for chunk in chunks)
+
+def source(item_id, content, title=""):
+    return {"id": item_id, "source": item_id, "title": title, "content": content, "url": "", "format": "text"}
+
+def run_ingestor(ingestor, items):
+    out = io.StringIO()
+    summary = ingestor.run(items, out)
+    return summary, {result["id"]: result for result in map(json.loads, out.getvalue().splitlines())}
+
+def make_ingestor(title_fn, existing=(), **kwargs):
+    existing = set(existing)
+    return BulkIngestor(workers=1, title_fn=title_fn, generate_fn=lambda text, title: f"<h2>{title}</h2>",
+                        exists_fn=lambda title: title in existing, bulk_exists_fn=lambda titles: existing & set(titles),
+                        near_duplicates_fn=lambda titles: {}, **kwargs)
+
+def test_ingest_picks_a_unique_title_per_source():
+    candidates = ["Why Remote Work Is Here to Stay in 2026", "Remote Work: What the Latest Numbers Say"]
+    ingestor = make_ingestor(lambda text, avoid: candidates)
+    summary, results = run_ingestor(ingestor, [source("a", "Remote work article one."), source("b", "Remote work article two.")])
+    assert summary["counts"] == {"generated": 2}
+    assert {results["a"]["title"], results["b"]["title"]} == set(candidates)
+
+def test_ingest_skips_sources_without_a_unique_title():
+    existing = {normalize_title("Remote Work Is Here to Stay for Good")}
+    ingestor = make_ingestor(lambda text, avoid: ["Remote Work Is Here to Stay for Good"], existing=existing, max_title_retries=2)
+    summary, results = run_ingestor(ingestor, [source("a", "Remote work article."),
+                                               source("b", "Another article.", title="Remote Work Is Here to Stay for Good")])
+    assert summary["counts"] == {"skipped": 2}
+    assert results["a"]["error"] == "no unique title after 2 attempts"
+    assert results["b"]["error"] == "title already exists"
+
+def test_ingest_runs_items_in_parallel_with_a_bounded_window():
+    lock = threading.Lock()
+    state = {"running": 0, "max_running": 0, "fetched": 0}
+
+    def generate(text, title):
+        with lock:
+            state["running"] += 1
+            state["max_running"] = max(state["max_running"], state["running"])
+        time.sleep(0.02)
+        with lock:
+            state["running"] -= 1
+        return f"<h2>{title}</h2><p>{text}</p>"
+
+    def fetcher(url):
+        with lock:
+            state["fetched"] += 1
+        return f"<html><head><title>Page {url[-1]}</title></head><body><nav>Menu</nav><article><p>Story {url[-1]}</p></article></body></html>"
+
+    items = [{"id": str(i), "source": f"https://news.example.com/{i}", "title": "", "content": "",
+              "url": f"https://news.example.com/{i}", "format": "html"} for i in range(8)]
+    ingestor = BulkIngestor(workers=4, fetcher=fetcher, generate_fn=generate,
+                            title_fn=lambda text, avoid: [f"What Everyone Should Know About {text}"],
+                            exists_fn=lambda title: False, bulk_exists_fn=lambda titles: set(), near_duplicates_fn=lambda titles: {})
+    summary, results = run_ingestor(ingestor, items)
+    assert summary["counts"] == {"generated": 8}
+    assert state["fetched"] == 8
+    assert 1 < state["max_running"] <= 4
+    assert results["3"]["title"] == "What Everyone Should Know About Story 3"
+    assert "Menu" not in results["3"]["content"]
+
+def test_ingest_resumes_from_its_results_file(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    candidates = ["Why Remote Work Is Here to Stay in 2026", "Remote Work: What the Latest Numbers Say"]
+    state = {"overloaded": True, "generated": []}
+
+    def generate(text, title):
+        if "two" in text and state["overloaded"]:
+            raise RuntimeError("model overloaded")
+        state["generated"].append(title)
+        return f"<h2>{title}</h2>"
+
+    items = [source("a", "Remote work article one."), source("b", "Remote work article two.")]
+    ingestor = make_ingestor(lambda text, avoid: candidates)
+    ingestor.generate_fn = generate
+    with open_results(path) as out:
+        assert ingestor.run(items, out)["counts"] == {"generated": 1, "failed": 1}
+        out.write('{"id": "c", "status": "gener') # Killed mid-write
+
+    finished = read_finished(path)
+    assert list(finished) == [("a", 0)]
+    first_title = finished[("a", 0)]
+    state["overloaded"] = False
+    ingestor = make_ingestor(lambda text, avoid: candidates)
+    ingestor.generate_fn = generate
+    with open_results(path) as out:
+        assert ingestor.run(items, out, finished)["counts"] == {"generated": 1}
+    # "a" is not generated again, and its title stays taken
+    assert state["generated"] == [first_title] + [title for title in candidates if title != first_title]
+    assert set(read_finished(path)) == {("a", 0), ("b", 0)}
@@ -0,0 +1,163 @@
+import pytest
+
+from src.blog_db import BlogRepository
+from src.content_validator import GenerationAborted
+from src.job_queue import JobQueue, JobWorker, LeaseLost
+
+class FakeClock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+class FakeBlogger:
+    """Stores posts like Blogger; fail_after_insert simulates a response lost after the post was created."""
+
+    def __init__(self, fail_after_insert: int = 0):
+        self.posts = []
+        self.fail_after_insert = fail_after_insert
+
+    def post(self, title, content, blog_id):
+        self.posts.append({"id": str(len(self.posts) + 1), "title": title, "content": content})
+        if self.fail_after_insert:
+            self.fail_after_insert -= 1
+            raise ConnectionError("connection reset after the post was created")
+        return self.posts[-1]
+
+    def find(self, title, blog_id):
+        return next((post for post in self.posts if post["title"] == title), None)
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+@pytest.fixture
+def repository(tmp_path):
+    repository = BlogRepository(str(tmp_path / "blogs.db"))
+    repository.init_db()
+    yield repository
+    repository.close()
+
+@pytest.fixture
+def queue(repository, clock):
+    return JobQueue(repository, lease_seconds=60, max_attempts=2, clock=clock)
+
+def make_worker(queue, repository, worker_id="w1", blogger=None, **kwargs):
+    blogger = blogger or FakeBlogger()
+    stubs = {
+        "title_fn": lambda topic, avoid: [f"The Complete Guide to {topic.title()}"],
+        "body_fn": lambda title: f"<h2>{title}</h2><p>Body</p>",
+        "image_fn": lambda title: "",
+        "post_fn": blogger.post,
+        "find_post_fn": blogger.find,
+        "exists_fn": repository.exists,
+        "bulk_exists_fn": repository.bulk_exists,
+        "near_duplicates_fn": repository.bulk_find_near_duplicates,
+        "record_fn": repository.add,
+        "existing_titles_fn": lambda: [],
+    }
+    stubs.update(kwargs)
+    return JobWorker(queue, blog_id="blog", worker_id=worker_id, **stubs)
+
+def test_enqueue_deduplicates_by_idempotency_key(queue):
+    job_id, created = queue.enqueue("Electric cars")
+    assert created
+    assert queue.enqueue("  electric CARS ") == (job_id, False)
+    assert queue.enqueue("Electric cars", title="Why Electric Cars Won")[1]
+    assert queue.enqueue("Anything", idempotency_key="k1")[1]
+    assert not queue.enqueue("Something else", idempotency_key="k1")[1]
+    assert queue.counts() == {"pending": 3}
+
+def test_expired_lease_is_taken_over(queue, clock):
+    job_id, _ = queue.enqueue("Electric cars")
+    job = queue.lease("w1")
+    assert job["id"] == job_id and job["attempts"] == 1
+    assert queue.lease("w2") is None
+
+    clock.advance(30)
+    queue.save(job_id, "w1", html="<p>draft</p>") # Renews the lease
+    clock.advance(45)
+    assert queue.lease("w2") is None
+    clock.advance(30)
+    taken = queue.lease("w2")
+    assert taken["id"] == job_id and taken["attempts"] == 2 and taken["html"] == "<p>draft</p>"
+
+    with pytest.raises(LeaseLost):
+        queue.save(job_id, "w1", html="<p>stale</p>")
+    queue.finish(job_id, "w1", "done") # Ignored: w1 no longer owns the job
+    assert queue.get(job_id)["status"] == "leased"
+    assert queue.get(job_id)["lease_owner"] == "w2"
+
+def test_job_that_keeps_losing_its_lease_fails(queue, clock):
+    job_id, _ = queue.enqueue("Electric cars")
+    queue.lease("w1")
+    clock.advance(61)
+    queue.lease("w2")
+    clock.advance(61)
+    assert queue.lease("w3") is None
+    assert queue.get(job_id)["status"] == "failed"
+    assert queue.get(job_id)["error"] == "lease expired too many times"
+
+def test_claim_title_conflicts_with_live_jobs_only(queue):
+    first, _ = queue.enqueue("Electric cars")
+    second, _ = queue.enqueue("EV market")
+    queue.lease("w1")
+    queue.lease("w2")
+    assert queue.claim_title(first, "w1", "Why Electric Cars Won")
+    assert not queue.claim_title(second, "w2", "why electric cars won!")
+    assert queue.active_titles() == ["whyelectriccarswon"]
+    queue.finish(first, "w1", "failed", "gave up")
+    assert queue.claim_title(second, "w2", "why electric cars won!")
+    with pytest.raises(LeaseLost):
+        queue.claim_title(first, "w1", "Another Title Entirely")
+
+def test_failed_jobs_are_retried_then_requeued(queue):
+    job_id, _ = queue.enqueue("Electric cars")
+    queue.lease("w1")
+    assert queue.fail(job_id, "w1", "timeout") == "pending"
+    queue.lease("w1")
+    assert queue.fail(job_id, "w1", "timeout") == "failed"
+    assert queue.lease("w1") is None
+    assert queue.requeue_failed() == 1
+    job = queue.get(job_id)
+    assert (job["status"], job["attempts"], job["error"]) == ("pending", 0, None)
+    assert queue.lease("w1")["id"] == job_id
+
+def test_worker_runs_a_job_to_the_end(queue, repository):
+    blogger = FakeBlogger()
+    job_id, _ = queue.enqueue("electric cars")
+    assert make_worker(queue, repository, blogger=blogger).run() == 1
+    job = queue.get(job_id)
+    assert (job["status"], job["stage"], job["blogger_post_id"]) == ("done", "done", "1")
+    assert [post["title"] for post in blogger.posts] == ["The Complete Guide to Electric Cars"]
+    assert repository.exists("thecompleteguidetoelectriccars")
+
+def test_crash_after_posting_adopts_the_existing_post(queue, repository, clock):
+    blogger = FakeBlogger(fail_after_insert=1)
+    body_calls = []
+    worker = make_worker(queue, repository, blogger=blogger,
+                         body_fn=lambda title: body_calls.append(title) or f"<h2>{title}</h2>")
+    job_id, _ = queue.enqueue("electric cars")
+
+    job = worker.run_once()
+    assert (job["status"], job["stage"]) == ("pending", "post")
+    assert job["post_attempted_at"] is not None and job["blogger_post_id"] is None
+
+    job = worker.run_once()
+    assert (job["status"], job["blogger_post_id"]) == ("done", "1")
+    assert len(blogger.posts) == 1 # Found on Blogger instead of posted twice
+    assert len(body_calls) == 1 # The saved body was reused
+
+def test_aborted_generation_is_not_requeued(queue, repository):
+    def abort(title):
+        raise GenerationAborted("no <h2>/<h3> heading", "")
+
+    job_id, _ = queue.enqueue("electric cars")
+    job = make_worker(queue, repository, body_fn=abort).run_once()
+    assert job["status"] == "failed" and job["attempts"] == 1
+    assert job["error"] == "generation aborted: no <h2>/<h3> heading"
+    assert queue.lease("w1") is None
@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src import llm_cache
+from src.llm_cache import LLMCache
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(llm_cache, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+def make_cache(tmp_path, **kwargs):
+    cache = LLMCache(path=str(tmp_path / "llm_cache.db"), **{"ttl": 60, "enabled": True, **kwargs})
+    cache.EVICT_EVERY = 5
+    return cache
+
+def keys(cache):
+    return {row[0] for row in cache._connection().execute("SELECT key FROM llm_cache")}
+
+def test_keys_ignore_whitespace_but_not_params():
+    key = LLMCache.make_key("title", "gpt", "Write  a title", n=1)
+    assert key == LLMCache.make_key("title", "gpt", " Write a title ", n=1)
+    assert key != LLMCache.make_key("title", "gpt", "Write a title", n=2)
+
+def test_entries_expire_after_their_ttl(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    cache.set("body", "<p>cached</p>")
+    cache.set("image", "https://dalle.example.com/1.png", ttl=10)
+    clock.now += 30
+    assert cache.get("body") == "<p>cached</p>"
+    assert cache.get("image") is None
+    clock.now += 31
+    assert cache.get("body") is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "hit_rate": 0.333}
+
+def test_least_recently_used_entries_are_evicted_by_count(tmp_path, clock):
+    cache = make_cache(tmp_path, max_entries=3)
+    for index in range(4):
+        cache.set(f"k{index}", index)
+        clock.now += 1
+    assert cache.get("k0") == 0 # Now the most recently used
+    clock.now += 1
+    cache.set("k4", 4) # Fifth write runs the eviction
+    assert keys(cache) == {"k0", "k3", "k4"}
+
+def test_entries_are_evicted_by_size(tmp_path, clock):
+    cache = make_cache(tmp_path, max_bytes=250)
+    for index in range(5):
+        cache.set(f"k{index}", "x" * 98) # 100 bytes as JSON
+        clock.now += 1
+    assert keys(cache) == {"k3", "k4"}
+
+def test_expired_entries_are_dropped_on_eviction(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    cache.set("short", 1, ttl=1)
+    clock.now += 2
+    for index in range(4):
+        cache.set(f"k{index}", index)
+    assert "short" not in keys(cache)
+
+def test_disabled_cache_stores_nothing(tmp_path, clock):
+    cache = make_cache(tmp_path, enabled=False)
+    cache.set("k", "value")
+    assert cache.get("k") is None
+    assert not (tmp_path / "llm_cache.db").exists()
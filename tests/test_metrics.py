@@ -0,0 +1,16 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.metrics import current_span, run_in_context, span
+
+def test_run_in_context_can_be_mapped_over_a_pool():
+    def child(index):
+        with span("child", index=index) as child_span:
+            time.sleep(0.01) # Keep the calls overlapping
+            return child_span.parent.span_id
+
+    with span("parent") as parent_span:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            parents = list(executor.map(run_in_context(child), range(8)))
+        assert current_span() is parent_span
+    assert parents == [parent_span.span_id] * 8
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+from src.blog_db import BlogRepository, normalize_title
+from src.multi_blog import BlogConfig, MultiBlogRunner
+
+TOPICS = ["Quantum Computing", "Sourdough Baking", "Marathon Training", "Index Funds", "Houseplant Care",
+          "Electric Bikes", "Remote Work Burnout", "Vinyl Records"]
+
+class StubCollector:
+    """Hands every blog the same topics without touching Google Trends."""
+
+    def __init__(self, topics):
+        self.topics = topics
+
+    def collect_results(self, use_snapshot=True):
+        return [{}]
+
+    def merge(self, results, seeds=None, geos=None):
+        return list(self.topics)
+
+class InFlightProbe:
+    """Counts items between their title and post stages, like the pipeline's own in-flight limit."""
+
+    def __init__(self, delay: float = 0.02):
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def title_fn(self, topic, avoid):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delay)
+        return [f"Why {topic} Matters"]
+
+    def body_fn(self, title):
+        time.sleep(self.delay)
+        return f"<h2>{title}</h2><p>Body</p>"
+
+    def post_fn(self, title, content, blog_id):
+        time.sleep(self.delay)
+        with self._lock:
+            self.running -= 1
+        return {"id": f"{blog_id}-{normalize_title(title)}"}
+
+@pytest.fixture
+def repository(tmp_path):
+    repository = BlogRepository(str(tmp_path / "blogs.db"))
+    repository.init_db()
+    return repository
+
+def make_runner(blogs, repository, topics, probe=None):
+    probe = probe or InFlightProbe(delay=0)
+    return MultiBlogRunner(blogs, repository=repository, collector=StubCollector(topics), with_images=False,
+                           title_fn=probe.title_fn, body_fn=probe.body_fn, post_fn=probe.post_fn)
+
+def statuses(result):
+    return {blog["blog_id"]: [item["status"] for item in blog["items"]] for blog in result["blogs"]}
+
+def test_titles_are_deduplicated_per_namespace(repository):
+    blogs = [BlogConfig(blog_id="tech"), BlogConfig(blog_id="money")]
+    result = make_runner(blogs, repository, ["Quantum Computing"]).run()
+    assert statuses(result) == {"tech": ["posted"], "money": ["posted"]}
+    title = normalize_title("Why Quantum Computing Matters")
+    assert repository.scoped("tech").exists(title) and repository.scoped("money").exists(title)
+    assert not repository.scoped("").exists(title)
+
+    # A third blog sharing the tech namespace sees the title as already used
+    result = make_runner([BlogConfig(blog_id="tech-mirror", namespace="tech")], repository, ["Quantum Computing"]).run()
+    assert statuses(result) == {"tech-mirror": ["skipped"]}
+
+def test_daily_quota_limits_posts(repository):
+    repository.scoped("tech").add(normalize_title("Posted Earlier Today"))
+    blogs = [BlogConfig(blog_id="tech", daily_quota=3, posts_per_run=5), BlogConfig(blog_id="money", daily_quota=0, posts_per_run=3)]
+    runner = make_runner(blogs, repository, TOPICS)
+    assert runner.quota_left(blogs[0]) == 2
+    assert runner.quota_left(blogs[1]) == 3
+    assert statuses(runner.run()) == {"tech": ["posted"] * 2, "money": ["posted"] * 3}
+    assert runner.quota_left(blogs[0]) == 0
+
+    result = runner.run()
+    assert statuses(result)["tech"] == []
+    assert repository.scoped("tech").posted_since("1970-01-01T00:00:00.000Z") == 3
+
+def test_max_concurrency_bounds_posts_in_flight(repository):
+    probe = InFlightProbe()
+    blog = BlogConfig(blog_id="tech", max_concurrency=2, posts_per_run=8)
+    result = make_runner([blog], repository, TOPICS, probe).run()
+    assert statuses(result) == {"tech": ["posted"] * 8}
+    assert probe.max_running == 2
@@ -0,0 +1,59 @@
+import threading
+import time
+
+from src.blog_db import normalize_title
+from src.pipeline import BatchPipeline
+
+class ConcurrencyProbe:
+    """Wraps a stage stub and records the most calls that were ever running at once."""
+
+    def __init__(self, fn, delay: float = 0.02):
+        self.fn = fn
+        self.delay = delay
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            self.calls += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.delay)
+            return self.fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+def make_pipeline(**kwargs):
+    posted = []
+    stubs = {
+        "title_fn": ConcurrencyProbe(lambda topic, avoid: [f"Everything You Need to Know About {topic}"]),
+        "body_fn": ConcurrencyProbe(lambda title: f"<h2>{title}</h2><p>Body</p>"),
+        "image_fn": ConcurrencyProbe(lambda title: f"https://images.example.com/{len(title)}.png"),
+        "post_fn": ConcurrencyProbe(lambda title, content, blog_id: posted.append(title) or {"id": str(len(posted))}),
+    }
+    pipeline = BatchPipeline(blog_id="blog", exists_fn=lambda title: False, bulk_exists_fn=lambda titles: set(),
+                             near_duplicates_fn=lambda titles: {}, record_fn=lambda **entry: None,
+                             existing_titles_fn=lambda: [], **stubs, **kwargs)
+    return pipeline, stubs, posted
+
+def test_stages_never_exceed_their_worker_limits():
+    pipeline, stubs, posted = make_pipeline(title_workers=2, body_workers=3, image_workers=1, post_workers=1)
+    result = pipeline.run([f"topic {i}" for i in range(12)])
+    assert result["summary"]["counts"] == {"posted": 12}
+    assert len(posted) == 12
+    assert 1 < stubs["title_fn"].max_running <= 2
+    assert 1 < stubs["body_fn"].max_running <= 3
+    assert stubs["image_fn"].max_running == 1
+    assert stubs["post_fn"].max_running == 1
+    assert all(stub.calls == 12 for stub in stubs.values())
+
+def test_duplicate_titles_in_one_batch_are_skipped():
+    pipeline, stubs, posted = make_pipeline(with_images=False)
+    result = pipeline.run(["same topic", "same topic"])
+    assert result["summary"]["counts"] == {"posted": 1, "skipped": 1}
+    assert [normalize_title(title) for title in posted] == [normalize_title("Everything You Need to Know About same topic")]
+    assert stubs["image_fn"].calls == 0
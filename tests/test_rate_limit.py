@@ -0,0 +1,173 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src import blog_writer
+from src.content_validator import GenerationAborted
+from src.rate_limit import AIMDLimiter, Endpoint, TokenBucket, adaptive_retry, backoff_delay, is_retryable
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+class FakeClock:
+    """Clock whose sleep() just moves time forward."""
+
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def chunk(text):
+    return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+class StubStream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+class StubOpenAI:
+    """Streams chunks (by default a post with no headings, which the validator aborts), failing first with errors."""
+
+    def __init__(self, chunks=None, errors=()):
+        self.chunks = chunks or ["<p>" + "word " * 200 + "</p>"] * 100
+        self.errors = list(errors)
+        self.requests = 0
+        self.streams = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.requests += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        stream = StubStream([chunk(text) for text in self.chunks])
+        self.streams.append(stream)
+        return stream
+
+def test_is_retryable():
+    assert is_retryable(StatusError(429))
+    assert is_retryable(StatusError(503))
+    assert is_retryable(ConnectionError("reset"))
+    assert not is_retryable(StatusError(400))
+    assert not is_retryable(ValueError("bad"))
+    assert not is_retryable(GenerationAborted("no heading", ""))
+
+def test_aborted_stream_is_not_retried(monkeypatch):
+    client = StubOpenAI()
+    monkeypatch.setattr(blog_writer, "get_openai_client", lambda: client)
+    with pytest.raises(GenerationAborted):
+        blog_writer.generate_blog_text("A title", use_cache=False)
+    assert client.requests == 1
+    assert client.streams[0].closed
+
+def test_stream_is_retried_until_the_first_chunk(monkeypatch):
+    client = StubOpenAI(chunks=["<h2>Intro</h2>", "<p>Body</p>"], errors=[StatusError(503), ConnectionError("reset")])
+    monkeypatch.setattr(blog_writer, "get_openai_client", lambda: client)
+    assert "".join(blog_writer.stream_blog_text("A title", use_cache=False)) == "<h2>Intro</h2><p>Body</p>"
+    assert client.requests == 3
+
+def test_stream_is_not_retried_on_client_errors(monkeypatch):
+    client = StubOpenAI(chunks=["<h2>Intro</h2>"], errors=[StatusError(400)])
+    monkeypatch.setattr(blog_writer, "get_openai_client", lambda: client)
+    with pytest.raises(StatusError):
+        list(blog_writer.stream_blog_text("A title", use_cache=False))
+    assert client.requests == 1
+
+def test_token_bucket_waits_for_refill():
+    clock = FakeClock()
+    bucket = TokenBucket(60, capacity=2, clock=clock, sleep=clock.sleep) # One token per second
+    assert bucket.acquire() == 0 and bucket.acquire() == 0
+    assert bucket.acquire() == pytest.approx(1.0)
+    assert not bucket.try_acquire()
+    clock.now += 10 # Refills only up to capacity
+    assert bucket.try_acquire(2) and not bucket.try_acquire()
+
+def test_token_bucket_oversized_request_and_refund():
+    clock = FakeClock()
+    bucket = TokenBucket(60, capacity=2, clock=clock, sleep=clock.sleep)
+    bucket.acquire(2)
+    assert bucket.acquire(5) == pytest.approx(2.0) # Waits for a full bucket, then goes into debt
+    assert bucket.acquire() == pytest.approx(4.0)
+    bucket.refund(2)
+    assert bucket.try_acquire(1)
+
+def test_aimd_halves_on_throttle_and_grows_on_success():
+    clock = FakeClock()
+    limiter = AIMDLimiter(8, initial=4, decrease_interval=1.0, clock=clock)
+    assert all(limiter.try_acquire() for _ in range(4)) and not limiter.try_acquire()
+    limiter.release("throttled")
+    assert limiter.limit == 2
+    limiter.release("throttled") # Same burst of 429s: counted once
+    assert limiter.limit == 2
+    clock.now += 1
+    limiter.release("throttled")
+    assert limiter.limit == 1
+    limiter.release("error")
+    assert limiter.limit == 1 and limiter.in_flight == 0
+
+    limiter.acquire()
+    limiter.release("success")
+    assert limiter.limit == 2 # +1/limit per success, i.e. about +1 per round of requests
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release("success")
+    assert 3 < limiter.limit < 4
+    for _ in range(200):
+        limiter.acquire()
+        limiter.release("success")
+    assert limiter.limit == 8
+
+def test_backoff_honours_retry_after():
+    assert 0 <= backoff_delay(3, base=1, cap=60) <= 4
+    assert backoff_delay(10, base=1, cap=5) <= 5
+    assert 7 <= backoff_delay(1, StatusError(429, {"retry-after": "7"}), base=1) <= 8
+    assert 0.25 <= backoff_delay(1, StatusError(429, {"retry-after-ms": "250"}), base=0.01) <= 0.26
+    assert backoff_delay(1, StatusError(429, {"retry-after": "120"}), base=0.01, cap=30) <= 30.01
+
+def test_adaptive_retry_waits_as_asked_and_stops_on_client_errors():
+    clock = FakeClock()
+    errors = [StatusError(429, {"retry-after": "3"}), StatusError(503)]
+
+    @adaptive_retry(attempts=5)
+    def call():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert call.retry_with(sleep=clock.sleep)() == "ok"
+    assert len(clock.sleeps) == 2 and 3 <= clock.sleeps[0] <= 3.01
+
+    calls = []
+
+    @adaptive_retry(attempts=5)
+    def bad_request():
+        calls.append(1)
+        raise StatusError(400)
+
+    with pytest.raises(StatusError):
+        bad_request.retry_with(sleep=clock.sleep)()
+    assert len(calls) == 1
+
+def test_endpoint_pauses_on_retry_after():
+    endpoint = Endpoint("test", requests_per_minute=600, max_concurrency=4)
+    with pytest.raises(StatusError):
+        with endpoint.slot():
+            raise StatusError(429, {"retry-after": "30"})
+    assert endpoint.counts["throttled"] == 1
+    assert endpoint.concurrency.limit == 2
+    assert endpoint.paused_until - time.monotonic() > 25
@@ -0,0 +1,62 @@
+import sqlite3
+
+import pytest
+
+from src.blog_db import normalize_title
+from src.title_index import create_index_table, find_similar, find_similar_many, index_title, jaccard, shingles
+
+CORPUS = [
+    ("10 AI Tools That Save Hours Every Week", ""),
+    ("How to Earn Money Online in 2024", ""),
+    ("The Future of Data Science", ""),
+    ("Best Budget Travel Destinations in Europe", ""),
+    ("Beginner's Guide to Sourdough Baking", "food"),
+]
+
+# (query, stored title it should match)
+NEAR_DUPLICATES = [
+    ("10 AI Tools That Save You Hours Every Week", "10 AI Tools That Save Hours Every Week"),
+    ("How to Earn Money Online in 2025", "How to Earn Money Online in 2024"),
+    ("The Future of Data Science!", "The Future of Data Science"),
+    ("Best Budget Travel Destinations In Europe 2024", "Best Budget Travel Destinations in Europe"),
+]
+
+UNRELATED = ["Kubernetes Networking Explained", "Why Cats Knock Things Off Tables", "A History of the Roman Senate"]
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE blogs (id INTEGER PRIMARY KEY, title TEXT NOT NULL, namespace TEXT NOT NULL DEFAULT '')")
+    create_index_table(conn)
+    for blog_id, (title, namespace) in enumerate(CORPUS, start=1):
+        conn.execute("INSERT INTO blogs (id, title, namespace) VALUES (?, ?, ?)", (blog_id, normalize_title(title), namespace))
+        index_title(conn, blog_id, normalize_title(title))
+    yield conn
+    conn.close()
+
+@pytest.mark.parametrize("query,expected", NEAR_DUPLICATES)
+def test_find_similar_recalls_near_duplicates(conn, query, expected):
+    matches = find_similar(conn, normalize_title(query))
+    assert matches[0][0] == normalize_title(expected)
+    assert matches[0][1] == pytest.approx(jaccard(shingles(normalize_title(query)), shingles(normalize_title(expected))))
+
+@pytest.mark.parametrize("query", UNRELATED)
+def test_find_similar_rejects_unrelated_titles(conn, query):
+    assert find_similar(conn, normalize_title(query)) == []
+
+def test_find_similar_threshold_and_namespace(conn):
+    query = normalize_title("Beginners Guide to Sourdough Bread Baking")
+    stored = normalize_title("Beginner's Guide to Sourdough Baking")
+    assert [title for title, _ in find_similar(conn, query)] == [stored]
+    assert find_similar(conn, query, namespace="food")[0][0] == stored
+    assert find_similar(conn, query, namespace="") == []
+    assert find_similar(conn, query, threshold=0.99) == []
+    assert find_similar(conn, "") == []
+
+def test_find_similar_many_matches_find_similar(conn):
+    queries = [normalize_title(query) for query, _ in NEAR_DUPLICATES] + [normalize_title(query) for query in UNRELATED]
+    matches = find_similar_many(conn, queries + queries[:2])
+    assert set(matches) == {normalize_title(query) for query, _ in NEAR_DUPLICATES}
+    for query in queries:
+        assert matches.get(query, []) == find_similar(conn, query)
+    assert find_similar_many(conn, queries, namespace="food") == {}
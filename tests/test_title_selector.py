@@ -0,0 +1,42 @@
+from src.title_selector import choose_title, rank_titles
+
+def no_duplicates(normalized_titles):
+    return {}
+
+def none_exist(normalized_titles):
+    return set()
+
+def test_short_topic_is_used_as_fallback_title():
+    selection = choose_title("iPhone 17", generate_fn=lambda topic, avoid: [topic],
+                             exists_fn=none_exist, near_duplicates_fn=no_duplicates)
+    assert selection.title == "iPhone 17"
+    assert selection.attempts == 1
+
+def test_short_fragments_are_rejected():
+    ranked, rejected = rank_titles("Bitcoin ETF", ["AI", "Bitcoin ETF Approval: What It Means for Your Portfolio"],
+                                   exists_fn=none_exist, near_duplicates_fn=no_duplicates)
+    assert [entry["title"] for entry in ranked] == ["Bitcoin ETF Approval: What It Means for Your Portfolio"]
+    assert rejected == {"AI": "too_short"}
+
+def test_best_unclaimed_candidate_is_chosen():
+    candidates = ["Top 10 AI Tools", "10 Free AI Tools That Will Change How You Work in 2026", "AI tools list"]
+    claimed = {"10 Free AI Tools That Will Change How You Work in 2026"}
+    selection = choose_title("free AI tools", generate_fn=lambda topic, avoid: candidates,
+                             claim_fn=lambda title: title not in claimed,
+                             exists_fn=none_exist, near_duplicates_fn=no_duplicates)
+    assert selection.title in candidates and selection.title not in claimed
+    assert selection.rejected[next(iter(claimed))] == "claimed"
+    assert selection.attempts == 1
+
+def test_exhausted_candidates_ask_again_with_rejections_avoided():
+    requests = []
+
+    def generate(topic, avoid):
+        requests.append(list(avoid))
+        return ["Existing Title About Crypto Markets"] if len(requests) == 1 else ["A Fresh Look at Crypto Markets This Week"]
+
+    selection = choose_title("crypto markets", generate_fn=generate, near_duplicates_fn=no_duplicates,
+                             exists_fn=lambda titles: {t for t in titles if t.startswith("existing")})
+    assert selection.title == "A Fresh Look at Crypto Markets This Week"
+    assert selection.attempts == 2
+    assert requests[1] == ["Existing Title About Crypto Markets"]
@@ -0,0 +1,51 @@
+from src.topic_ranker import TopicRanker, rank_topics, tokenize
+
+HISTORY = [
+    "iphone 15 review",
+    "best budget laptops 2024",
+    "how to start a vegetable garden",
+    "bitcoin price prediction",
+    "beginner marathon training plan",
+]
+
+def novelty(ranked):
+    return {entry["topic"]: entry["novelty"] for entry in ranked}
+
+def test_tokenize_drops_stopwords_and_adds_bigrams():
+    assert tokenize("How to Start a Vegetable Garden") == ["start", "vegetable", "garden", "start vegetable", "vegetable garden"]
+
+def test_topics_close_to_history_rank_lower():
+    candidates = ["iphone 15 pro review", "sourdough starter tips", "marathon training for beginners", "electric cargo bikes"]
+    ranked = rank_topics(candidates, HISTORY)
+    assert [entry["topic"] for entry in ranked] == ["sourdough starter tips", "electric cargo bikes",
+                                                   "marathon training for beginners", "iphone 15 pro review"]
+    scores = novelty(ranked)
+    assert scores["sourdough starter tips"] == scores["electric cargo bikes"] == 1.0
+    assert 0 < scores["iphone 15 pro review"] < scores["marathon training for beginners"] < 1.0
+    assert ranked[-1]["closest"] == "iphone 15 review"
+    assert ranked[0]["closest"] is None
+
+def test_without_history_trend_order_is_kept():
+    candidates = ["b topic", "a topic", "c topic"]
+    assert [(entry["topic"], entry["novelty"], entry["closest"]) for entry in TopicRanker([]).rank(candidates)] == \
+        [(topic, 1.0, None) for topic in candidates]
+    assert TopicRanker(HISTORY).rank([]) == []
+
+def test_common_terms_are_ignored_past_the_doc_freq_cutoff():
+    history = [f"ai tools for {subject}" for subject in ["writers", "teachers", "lawyers", "doctors", "designers", "marketers",
+                                                         "students", "accountants", "recruiters", "musicians", "chefs", "nurses"]]
+    # "ai" and "tools" are in every past topic, so only "gardening" is left to compare, and nobody wrote about it
+    assert novelty(TopicRanker(history).rank(["ai tools for gardening"])) == {"ai tools for gardening": 1.0}
+    assert TopicRanker(history, max_doc_freq=1.0).rank(["ai tools for gardening"])[0]["novelty"] < 1.0
+    # Below MIN_DOC_FREQ_CUTOFF documents every term counts, however common
+    assert TopicRanker(history[:3]).rank(["ai tools for gardening"])[0]["closest"] in history[:3]
+
+def test_chunked_scoring_matches_unchunked():
+    subjects = ["garden", "laptop", "marathon", "bitcoin", "iphone", "sourdough", "kayak", "guitar", "camera", "budget"]
+    history = [f"{first} {second} guide" for first in subjects for second in subjects[:4] if first != second]
+    candidates = [f"{first} {second} tips" for first in subjects for second in subjects[3:] if first != second]
+    ranker = TopicRanker(history)
+    unchunked = ranker.rank(candidates, chunk_size=len(candidates))
+    assert len({entry["novelty"] for entry in unchunked}) > 2
+    for chunk_size in (1, 7, 16):
+        assert ranker.rank(candidates, chunk_size=chunk_size) == unchunked
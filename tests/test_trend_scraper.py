@@ -0,0 +1,75 @@
+import threading
+import time
+
+from src.rate_limit import TokenBucket
+from src.trend_scraper import TrendsCollector
+
+class StubFetcher:
+    """Answers every keyword with one top and one rising query, and records concurrency."""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, keywords, geo=""):
+        with self._lock:
+            self.calls.append((tuple(keywords), geo))
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delay)
+        with self._lock:
+            self.running -= 1
+        return {keyword: {"top": [f"{keyword} top {geo}".strip()], "rising": [f"{keyword} rising"]} for keyword in keywords}
+
+def make_collector(fetcher, tmp_path, seeds=None, **kwargs):
+    seeds = seeds or [f"seed {i}" for i in range(12)]
+    return TrendsCollector(seeds=seeds, geos=["US", "IN"], fetcher=fetcher, rate_limiter=TokenBucket(6000, capacity=10),
+                           snapshot_path=str(tmp_path / "trends.json"), max_workers=3, **kwargs)
+
+def test_batches_are_fetched_in_parallel(tmp_path):
+    fetcher = StubFetcher()
+    topics = make_collector(fetcher, tmp_path).collect()
+    assert len(fetcher.calls) == 6 # 12 seeds in 5-keyword batches, for 2 regions
+    assert all(len(keywords) <= 5 for keywords, _ in fetcher.calls)
+    assert fetcher.max_running == 3
+    assert topics[:2] == ["seed 0 top US", "seed 1 top US"]
+    assert topics.index("seed 11 top IN") < topics.index("seed 0 rising")
+    assert len(topics) == len(set(topics)) == 12 * 2 + 12
+
+def test_snapshot_is_reused_until_seeds_change(tmp_path):
+    topics = make_collector(StubFetcher(), tmp_path).collect()
+
+    fetcher = StubFetcher()
+    assert make_collector(fetcher, tmp_path).collect() == topics
+    assert make_collector(fetcher, tmp_path).collect_results() is not None
+    assert fetcher.calls == []
+
+    make_collector(fetcher, tmp_path, seeds=["other seed"]).collect()
+    assert len(fetcher.calls) == 2
+    make_collector(fetcher, tmp_path, snapshot_ttl=0).collect()
+    assert len(fetcher.calls) == 2 + 6 # With ttl 0 every snapshot is stale
+
+def test_partial_results_are_not_snapshotted(tmp_path):
+    class FlakyFetcher(StubFetcher):
+        """Fails the first request for the batch holding seed 0 in India."""
+        failed = False
+
+        def __call__(self, keywords, geo=""):
+            if geo == "IN" and "seed 0" in keywords and not self.failed:
+                self.failed = True
+                raise RuntimeError("connection reset")
+            return super().__call__(keywords, geo)
+
+    fetcher = FlakyFetcher(delay=0)
+    topics = make_collector(fetcher, tmp_path).collect()
+    assert "seed 0 top US" in topics and "seed 0 top IN" not in topics
+    assert not (tmp_path / "trends.json").exists()
+
+    topics = make_collector(fetcher, tmp_path).collect()
+    assert "seed 0 top IN" in topics
+    assert len(fetcher.calls) == 5 + 6 # The failed batch is not recorded; the retry fetches everything
+    assert make_collector(fetcher, tmp_path).collect() == topics
+    assert len(fetcher.calls) == 5 + 6